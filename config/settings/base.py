@@ -259,6 +259,76 @@ LOGGING = {
 
 # Kafka
 KAFKA_URL = env.list("KAFKA_URL")
+# Codec of published events: "json", "orjson" or "msgpack"
+KAFKA_CODEC = env("KAFKA_CODEC", default="json")
+# Topic for all user lifecycle events, ordered per user (unset uses per event topics)
+USER_EVENTS_TOPIC = env("USER_EVENTS_TOPIC", default=None)
+# Compacted topic of the latest public state of each user (unset disables)
+USER_SNAPSHOTS_TOPIC = env("USER_SNAPSHOTS_TOPIC", default=None)
+# Users republished by each run of the daily snapshots task, before it queues the next
+USER_SNAPSHOTS_CHUNK_SIZE = env.int("USER_SNAPSHOTS_CHUNK_SIZE", 10000)
+# Hours of events the hourly reconciliation compares users with
+RECONCILE_WINDOW_HOURS = env.int("RECONCILE_WINDOW_HOURS", 2)
+# Repair users diverging from the events, instead of only reporting them
+RECONCILE_REPAIR = env.bool("RECONCILE_REPAIR", False)
+# Times the reconciliation reads the window, folding a share of the users each
+# time, to bound its memory
+RECONCILE_PASSES = env.int("RECONCILE_PASSES", 1)
+# Seconds the hourly reconciliation may run, as it reads the whole window
+RECONCILE_TIME_LIMIT = env.int("RECONCILE_TIME_LIMIT", 30 * 60)
+# Seconds to wait before each retry of a failed event, before dead-lettering it
+KAFKA_RETRY_DELAYS = env.list("KAFKA_RETRY_DELAYS", cast=int, default=[10, 60, 600])
+# Runtime of the consumer: "threads" or "asyncio" (with aiokafka)
+CONSUMER_RUNTIME = env("CONSUMER_RUNTIME", default="threads")
+# Port the consumer serves Prometheus metrics on (unset disables)
+CONSUMER_METRICS_PORT = env.int("CONSUMER_METRICS_PORT", default=None)
+# File the consumer writes Prometheus metrics to, for the node exporter's
+# textfile collector (unset disables)
+CONSUMER_METRICS_TEXTFILE = env("CONSUMER_METRICS_TEXTFILE", default=None)
+# Bounds of the number of messages the consumer handles per poll, sized so
+# that handling a poll takes about KAFKA_POLL_TARGET_MS
+KAFKA_POLL_MIN_RECORDS = env.int("KAFKA_POLL_MIN_RECORDS", 10)
+KAFKA_POLL_MAX_RECORDS = env.int("KAFKA_POLL_MAX_RECORDS", 1000)
+KAFKA_POLL_TARGET_MS = env.int("KAFKA_POLL_TARGET_MS", 1000)
+# Milliseconds per message above which the consumer pauses, as the database is
+# saturated
+KAFKA_SATURATION_MS = env.int("KAFKA_SATURATION_MS", 500)
+# Seconds between sweeps of the verification assigner for requests it missed
+VERIFICATION_SWEEP_PERIOD = env.int("VERIFICATION_SWEEP_PERIOD", 600)
+# Verification requests claimed and assigned in one transaction
+VERIFICATION_ASSIGN_BATCH_SIZE = env.int("VERIFICATION_ASSIGN_BATCH_SIZE", 100)
+# Hours after which a verification request is overdue and assigned even to
+# accountables at capacity
+VERIFICATION_SLA_HOURS = env.int("VERIFICATION_SLA_HOURS", 48)
+# Days to remember applied event ids; redeliveries older than that are reapplied
+APPLIED_EVENTS_RETENTION_DAYS = env.int("APPLIED_EVENTS_RETENTION_DAYS", 7)
+# Write events to the outbox table, to be published by the `outboxrelay` command
+EVENT_OUTBOX = env.bool("EVENT_OUTBOX", False)
+# Seconds outbox events are held back, for transactions that wrote earlier ones to
+# commit, as the relay publishes them in order
+EVENT_OUTBOX_LAG = env.float("EVENT_OUTBOX_LAG", 1)
+# Where events go: "kafka", "outbox", "memory" (applied by this process, without
+# a broker) or "file" (appended to EVENT_LOG_PATH)
+EVENT_STORE = env("EVENT_STORE", default="outbox" if EVENT_OUTBOX else "kafka")
+# Apply events of the "memory" store on a background thread
+EVENT_STORE_BACKGROUND = env.bool("EVENT_STORE_BACKGROUND", False)
+EVENT_LOG_PATH = env("EVENT_LOG_PATH", default=str(BASE_DIR / "events.log"))
+# Directory to spool events to while Kafka is unreachable (unset disables)
+EVENT_SPOOL_DIR = env("EVENT_SPOOL_DIR", default=None)
+EVENT_SPOOL_MAX_BYTES = env.int("EVENT_SPOOL_MAX_BYTES", 256 * 1024 * 1024)
+# Milliseconds a send may block on Kafka before the event is spooled
+EVENT_SPOOL_MAX_BLOCK_MS = env.int("EVENT_SPOOL_MAX_BLOCK_MS", 100)
+# Unix socket of the `eventrelay` command to send events through (unset disables)
+EVENT_RELAY_SOCKET = env("EVENT_RELAY_SOCKET", default=None)
+# Milliseconds to hold back user updates, to merge them with the following ones
+EVENT_COALESCE_MS = env.int("EVENT_COALESCE_MS", 0)
+# Seconds a request waits for the consumer to apply its own event (0 disables)
+EVENT_ACK_TIMEOUT = env.float("EVENT_ACK_TIMEOUT", 10)
+EVENT_ACK_POLL_INTERVAL = env.float("EVENT_ACK_POLL_INTERVAL", 0.05)
+# Cache shared by web workers and the consumer to acknowledge applied events
+EVENT_ACK_CACHE = env("EVENT_ACK_CACHE", default="default")
+# Seconds an applied-event acknowledgement is kept in cache
+EVENT_ACK_TTL = env.int("EVENT_ACK_TTL", 60 * 60)
 
 # Celery
 # ------------------------------------------------------------------------------
@@ -290,6 +360,25 @@ CELERY_TASK_TIME_LIMIT = 5 * 60
 CELERY_TASK_SOFT_TIME_LIMIT = 60
 # https://docs.celeryq.dev/en/stable/userguide/configuration.html#beat-scheduler
 CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
+# https://docs.celeryq.dev/en/stable/userguide/configuration.html#beat-schedule
+CELERY_BEAT_SCHEDULE = {
+    "prune-applied-events": {
+        "task": "users.tasks.prune_applied_events",
+        "schedule": timedelta(hours=1),
+    },
+    "reconcile-users": {
+        "task": "users.tasks.reconcile_users",
+        "schedule": timedelta(hours=1),
+    },
+    "recount-workloads": {
+        "task": "users.tasks.recount_workloads",
+        "schedule": timedelta(hours=1),
+    },
+    "publish-user-snapshots": {
+        "task": "users.tasks.publish_user_snapshots",
+        "schedule": timedelta(days=1),
+    },
+}
 # https://docs.celeryq.dev/en/stable/userguide/configuration.html#worker-send-task-events
 CELERY_WORKER_SEND_TASK_EVENTS = True
 # https://docs.celeryq.dev/en/stable/userguide/configuration.html#std-setting-task_send_sent_event
@@ -3,6 +3,7 @@
 
 from .base import *  # noqa: F403
 from .base import INSTALLED_APPS
+from .base import env
 
 # CACHES
 # ------------------------------------------------------------------------------
@@ -12,7 +13,16 @@ CACHES = {
         "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
         "LOCATION": "",
     },
+    # Shared with the consumer container to acknowledge applied events
+    "events": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": env("REDIS_URL"),
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+        },
+    },
 }
+EVENT_ACK_CACHE = "events"
 
 # WhiteNoise
 # ------------------------------------------------------------------------------
@@ -38,3 +38,5 @@ MEDIA_URL = "http://media.testserver/"
 # ------------------------------------------------------------------------------
 ALLOWED_HOSTS = ["api.testserver", "api.admin.testserver"]
 ADMIN_ALLOWED_HOSTS = ["api.admin.testserver"]
+# There is no consumer to acknowledge events in tests.
+EVENT_ACK_TIMEOUT = 0
@@ -0,0 +1,28 @@
+from django.test import SimpleTestCase
+from django.test import override_settings
+
+from utils import acks
+
+
+@override_settings(EVENT_ACK_POLL_INTERVAL=0.01)
+class AckTests(SimpleTestCase):
+    def setUp(self):
+        acks.get_cache().clear()
+
+    def test_not_waiting_when_disabled(self):
+        acks.wait_for_ack("a", timeout=0)
+
+    def test_acknowledged(self):
+        acks.acknowledge("a")
+        acks.acknowledge_many(["b", "c"])
+        for event_id in "abc":
+            acks.wait_for_ack(event_id, timeout=1)
+
+    def test_other_event_is_not_an_ack(self):
+        acks.acknowledge("a")
+        self.assertFalse(acks.is_applied("b"))
+
+    def test_timeout(self):
+        acks.acknowledge("a")
+        with self.assertRaises(acks.EventNotAppliedError):
+            acks.wait_for_ack("b", timeout=0.05)
@@ -0,0 +1,145 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+from aiokafka.structs import ConsumerRecord
+from aiokafka.structs import TopicPartition
+from django.test import SimpleTestCase
+from kafka.structs import OffsetAndMetadata
+
+from utils.aio import AsyncConsumer
+from utils.aio import AsyncRebalanceListener
+
+TP = TopicPartition("UserUpdated", 0)
+
+
+def record(offset, key, value=b"{}"):
+    return ConsumerRecord(
+        topic=TP.topic,
+        partition=TP.partition,
+        offset=offset,
+        timestamp=0,
+        timestamp_type=0,
+        key=key,
+        value=value,
+        checksum=None,
+        serialized_key_size=len(key),
+        serialized_value_size=len(value),
+        headers=[],
+    )
+
+
+def fail(message):
+    msg = "poison"
+    raise ValueError(msg)
+
+
+class AsyncConsumerTests(SimpleTestCase):
+    def setUp(self):
+        self.consumer = AsyncConsumer(workers=4)
+        self.consumer.consumer = MagicMock()
+        self.consumer.executor = ThreadPoolExecutor(max_workers=4)
+        self.addCleanup(self.consumer.executor.shutdown)
+        self.batch = {TP: [record(i, str(i % 3).encode()) for i in range(30)]}
+
+    def test_decode_message(self):
+        message = self.consumer.decode_message(record(0, b"k", b'{"id": "1"}'))
+        self.assertEqual(message.value, {"id": "1"})
+
+    async def test_undecodable_message(self):
+        self.consumer.producer = MagicMock()
+        self.consumer.group_id = "g"
+        batch = self.consumer.decode_batch(
+            {TP: [record(0, b"k"), record(1, b"k", b"{"), record(2, b"k")]}
+        )
+        processed = []
+        offsets = await self.consumer.process(batch, processed.append)
+        self.assertEqual([m.offset for m in processed], [0, 2])
+        self.assertEqual(offsets[TP].offset, 3)
+        args, _ = self.consumer.producer.send.call_args
+        self.assertEqual(args[1], b"{")
+
+    async def test_order_per_key(self):
+        processed = []
+        offsets = await self.consumer.process(self.batch, processed.append)
+        self.assertEqual(offsets[TP].offset, 30)
+        for key in (b"0", b"1", b"2"):
+            offsets = [m.offset for m in processed if m.key == key]
+            self.assertEqual(offsets, sorted(offsets))
+        self.assertEqual(len(processed), 30)
+
+    async def test_coroutine_handler(self):
+        processed = []
+
+        async def on_message(message):
+            await asyncio.sleep(0)
+            processed.append(message.offset)
+
+        await self.consumer.process(self.batch, on_message)
+        self.assertEqual(sorted(processed), list(range(30)))
+
+    async def test_failure_rewinds(self):
+        def on_message(message):
+            if message.offset == poison:
+                fail(message)
+
+        poison = 7
+        offsets = await self.consumer.process(self.batch, on_message)
+        self.assertEqual(offsets[TP].offset, 7)
+        self.consumer.consumer.seek.assert_called_once_with(TP, 7)
+
+    async def test_batch(self):
+        batches = []
+        offsets = await self.consumer.process(
+            self.batch, on_batch=lambda messages: batches.append(len(messages))
+        )
+        self.assertEqual(batches, [30])
+        self.assertEqual(offsets[TP].offset, 30)
+
+    async def test_batch_failure_without_fallback(self):
+        with self.assertRaises(ValueError):
+            await self.consumer.process(self.batch, on_batch=fail)
+        self.consumer.consumer.seek.assert_called_once_with(TP, 0)
+
+    async def test_commit(self):
+        async def commit(offsets):
+            self.committed = offsets
+
+        self.consumer.consumer.commit = commit
+        offsets = await self.consumer.process(self.batch, lambda m: None)
+        await self.consumer.commit_offsets(offsets)
+        self.assertEqual(self.committed, {TP: 30})
+
+
+class AsyncRebalanceTests(SimpleTestCase):
+    async def test_commit_on_revoke_after_processing(self):
+        consumer = AsyncConsumer()
+        consumer.consumer = MagicMock()
+        committed = []
+
+        async def commit(offsets):
+            committed.append(offsets)
+
+        consumer.consumer.commit = commit
+        consumer.idle = asyncio.Event()
+        consumer.offsets = {TP: OffsetAndMetadata(3, None)}
+        revoking = asyncio.create_task(
+            AsyncRebalanceListener(consumer).on_partitions_revoked([TP])
+        )
+        await asyncio.sleep(0)
+        # Nothing is committed while a poll is being processed
+        self.assertEqual(committed, [])
+        consumer.offsets[TP] = OffsetAndMetadata(5, None)
+        consumer.idle.set()
+        await revoking
+        self.assertEqual(committed, [{TP: 5}])
+        self.assertEqual(consumer.offsets, {})
+
+
+class DecodeTests(SimpleTestCase):
+    def test_skip_by_event_type(self):
+        consumer = AsyncConsumer(event_types={"UserCreated"})
+        value = json.dumps({"type": "UserCreated"}).encode()
+        batch = consumer.decode_batch({TP: [record(0, b"k", value)]})
+        self.assertEqual(batch[TP][0].value, {"type": "UserCreated"})
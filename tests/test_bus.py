@@ -0,0 +1,101 @@
+# ruff: noqa: S106
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase
+from django.test import TestCase
+from django.test import override_settings
+
+from users.events import UserUpdated
+from users.handlers import handle_message
+from users.services import UserService
+from utils.bus import FileEventStore
+from utils.bus import InMemoryEventStore
+from utils.bus import read_event_log
+
+User = get_user_model()
+
+
+class InMemoryEventStoreTests(SimpleTestCase):
+    def test_sync(self):
+        handled = []
+        store = InMemoryEventStore(handled.append)
+        store.add_event(UserUpdated({"id": "1", "first_name": "a"}))
+        self.assertEqual(len(handled), 1)
+        self.assertEqual(handled[0]["type"], "UserUpdated")
+        self.assertEqual(handled[0]["key"], "1")
+        self.assertEqual(handled[0]["payload"]["first_name"], "a")
+
+    def test_background_in_order(self):
+        handled = []
+        store = InMemoryEventStore(handled.append, background=True)
+        for i in range(10):
+            store.add_event(UserUpdated({"id": "1", "version": i}))
+        store.join()
+        self.assertEqual([m["payload"]["version"] for m in handled], list(range(10)))
+
+    @mock.patch("utils.bus.connection")
+    def test_close(self, connection):
+        handled = []
+        store = InMemoryEventStore(handled.append, background=True)
+        store.add_event(UserUpdated({"id": "1", "version": 0}))
+        store.close()
+        self.assertEqual(len(handled), 1)
+        connection.close.assert_called_once()
+        # Events are handled in place once closed.
+        store.add_event(UserUpdated({"id": "1", "version": 1}))
+        self.assertEqual(len(handled), 2)
+
+    def test_background_handler_error(self):
+        handled = []
+
+        def handler(message):
+            if message["payload"]["version"] == 0:
+                raise ValueError
+            handled.append(message)
+
+        store = InMemoryEventStore(handler, background=True)
+        store.add_event(UserUpdated({"id": "1", "version": 0}))
+        store.add_event(UserUpdated({"id": "1", "version": 1}))
+        store.join()
+        self.assertEqual([m["payload"]["version"] for m in handled], [1])
+
+
+class FileEventStoreTests(SimpleTestCase):
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "events.log"
+            store = FileEventStore(path)
+            for i in range(3):
+                store.add_event(UserUpdated({"id": str(i)}))
+            messages = list(read_event_log(path))
+        self.assertEqual([m["key"] for m in messages], ["0", "1", "2"])
+        self.assertEqual(messages[0]["type"], "UserUpdated")
+
+
+class InMemoryUserServiceTests(TestCase):
+    def setUp(self):
+        self.service = UserService(InMemoryEventStore(handle_message))
+
+    def test_create_update_delete(self):
+        user = self.service.create(
+            email="bus@example.com",
+            password="secret",
+            first_name="a",
+            last_name="b",
+        )
+        self.assertTrue(User.objects.filter(pk=user.pk).exists())
+        self.service.update(user, first_name="c")
+        user.refresh_from_db()
+        self.assertEqual(user.first_name, "c")
+        self.service.delete(user)
+        self.assertFalse(User.objects.filter(pk=user.pk).exists())
+
+    @override_settings(EVENT_ACK_TIMEOUT=10)
+    @mock.patch("utils.acks.is_applied")
+    def test_without_ack_wait(self, is_applied):
+        service = UserService(InMemoryEventStore(handle_message), ack_timeout=0)
+        service.create(email="bus@example.com", first_name="a", last_name="b")
+        is_applied.assert_not_called()
@@ -0,0 +1,44 @@
+import datetime
+import json
+import uuid
+
+from django.test import SimpleTestCase
+
+from utils import codecs
+
+
+class CodecTests(SimpleTestCase):
+    def setUp(self):
+        self.value = {
+            "id": str(uuid.uuid4()),
+            "type": "UserUpdated",
+            "payload": {
+                "id": uuid.uuid4(),
+                "date_joined": datetime.datetime(
+                    2024, 1, 2, 3, 4, 5, tzinfo=datetime.UTC
+                ),
+                "roles": {"support"},
+                "version": 2,
+            },
+        }
+        # What every codec decodes to
+        self.expected = json.loads(codecs.JSONCodec().encode(self.value))
+
+    def test_round_trip(self):
+        for name, codec in codecs.CODECS.items():
+            with self.subTest(codec=name):
+                self.assertEqual(codec.decode(codec.encode(self.value)), self.expected)
+
+    def test_decode_by_header(self):
+        for name, codec in codecs.CODECS.items():
+            with self.subTest(codec=name):
+                headers = [(codecs.CODEC_HEADER, name.encode())]
+                data = codec.encode(self.value)
+                self.assertEqual(codecs.decode(data, headers), self.expected)
+
+    def test_decode_without_header(self):
+        data = json.dumps({"type": "UserDeleted"}).encode()
+        self.assertEqual(codecs.decode(data, []), {"type": "UserDeleted"})
+
+    def test_decode_tombstone(self):
+        self.assertIsNone(codecs.decode(None, []))
@@ -0,0 +1,420 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import NamedTuple
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+from kafka.structs import OffsetAndMetadata
+from kafka.structs import TopicPartition
+from prometheus_client import REGISTRY
+
+from utils.kafka import EVENT_TYPE_HEADER
+from utils.kafka import Consumer
+from utils.kafka import KafkaEventStore
+from utils.kafka import PollSizer
+from utils.kafka import RebalanceListener
+from utils.kafka import get_event_ids
+from utils.kafka import get_message_headers
+from utils.kafka import read_topics
+
+TP = TopicPartition("UserUpdated", 0)
+
+
+def record(offset, key, headers=None, tp=TP):
+    return SimpleNamespace(
+        topic=tp.topic,
+        partition=tp.partition,
+        offset=offset,
+        key=key,
+        value={},
+        headers=headers or [],
+    )
+
+
+class ConsumerRecord(NamedTuple):
+    offset: int
+    value: bytes
+    headers: list
+    topic: str = TP.topic
+    partition: int = TP.partition
+    key: bytes = None
+
+
+@patch("utils.kafka.KafkaConsumer")
+class ParallelConsumerTests(SimpleTestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.batch = {TP: [record(i, str(i % 3).encode()) for i in range(30)]}
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_order_per_key(self, kafka_consumer):
+        consumer = Consumer(workers=4)
+        processed = []
+        done = consumer.process_in_parallel(
+            self.executor, self.batch, lambda m: processed.append(m)
+        )
+        self.assertTrue(done)
+        for key in (b"0", b"1", b"2"):
+            offsets = [m.offset for m in processed if m.key == key]
+            self.assertEqual(offsets, sorted(offsets))
+        args, _ = consumer.consumer.commit_async.call_args
+        self.assertEqual(args[0], {TP: OffsetAndMetadata(30, None)})
+
+    def test_commit_up_to_first_failure(self, kafka_consumer):
+        consumer = Consumer(workers=4)
+
+        def on_message(message):
+            if message.offset == 7:  # noqa: PLR2004
+                raise ValueError
+
+        done = consumer.process_in_parallel(self.executor, self.batch, on_message)
+        self.assertFalse(done)
+        consumer.consumer.seek.assert_called_once_with(TP, 7)
+        args, _ = consumer.consumer.commit_async.call_args
+        self.assertEqual(args[0], {TP: OffsetAndMetadata(7, None)})
+
+
+def fail(message):
+    msg = "poison"
+    raise ValueError(msg)
+
+
+@patch("utils.kafka.KafkaConsumer")
+class DeadLetterTests(SimpleTestCase):
+    def get_consumer(self):
+        return Consumer(producer=MagicMock(), retry_delays=[5], group_id="g")
+
+    def test_retry(self, kafka_consumer):
+        consumer = self.get_consumer()
+        consumer.process_serially({TP: [record(3, b"k")]}, fail)
+        args, kwargs = consumer.producer.send.call_args
+        self.assertEqual(args[0], "g.retry.1")
+        self.assertEqual(kwargs["message_key"], "k")
+        headers = dict(kwargs["headers"])
+        self.assertEqual(headers["original-topic"], b"UserUpdated")
+        self.assertEqual(headers["original-offset"], b"3")
+        self.assertEqual(headers["retry-attempt"], b"1")
+        self.assertEqual(headers["error"], b"ValueError: poison")
+        consumer.consumer.commit_async.assert_called_once()
+
+    def test_dead_letter(self, kafka_consumer):
+        consumer = self.get_consumer()
+        headers = [("original-topic", b"UserUpdated"), ("retry-attempt", b"1")]
+        tp = TopicPartition("g.retry.1", 0)
+        consumer.process_serially({tp: [record(0, b"k", headers, tp)]}, fail)
+        args, kwargs = consumer.producer.send.call_args
+        self.assertEqual(args[0], "g.dlq")
+        self.assertEqual(dict(kwargs["headers"])["retry-attempt"], b"2")
+
+    def test_undecodable_message(self, kafka_consumer):
+        consumer = self.get_consumer()
+        records = [
+            ConsumerRecord(0, b'{"type": "UserUpdated"}', []),
+            ConsumerRecord(1, b"{", []),
+            ConsumerRecord(2, b"{}", [("codec", b"unknown")]),
+            ConsumerRecord(3, b'{"type": "UserUpdated"}', []),
+        ]
+        consumer.consumer.poll.return_value = {TP: records}
+        handled = []
+        consumer.process_serially(consumer.poll(), handled.append)
+        self.assertEqual([m.offset for m in handled], [0, 3])
+        sent = consumer.producer.send.call_args_list
+        self.assertEqual([c.args[1] for c in sent], [b"{", b"{}"])
+        self.assertEqual(dict(sent[1].kwargs["headers"])["codec"], b"unknown")
+        offsets = consumer.consumer.commit_async.call_args.args[0]
+        self.assertEqual(offsets[TP].offset, 4)
+
+    def test_undecodable_message_without_retries(self, kafka_consumer):
+        consumer = Consumer(group_id="g")
+        records = [
+            ConsumerRecord(0, b'{"type": "UserUpdated"}', []),
+            ConsumerRecord(1, b"{", []),
+            ConsumerRecord(2, b'{"type": "UserUpdated"}', []),
+        ]
+        consumer.consumer.poll.return_value = {TP: records}
+        with self.assertRaises(ValueError):
+            consumer.process_serially(consumer.poll(), lambda message: None)
+        consumer.consumer.seek.assert_called_once_with(TP, 1)
+        offsets = consumer.consumer.commit_async.call_args.args[0]
+        self.assertEqual(offsets[TP].offset, 1)
+
+    def test_hold_back(self, kafka_consumer):
+        consumer = self.get_consumer()
+        tp = TopicPartition("g.retry.1", 0)
+        due = record(0, b"k", [("retry-at", b"0")], tp)
+        not_due = record(1, b"k", [("retry-at", b"9999999999")], tp)
+        batch = consumer.hold_back({tp: [due, not_due]})
+        self.assertEqual(batch, {tp: [due]})
+        consumer.consumer.seek.assert_called_once_with(tp, 1)
+        consumer.consumer.pause.assert_called_once_with(tp)
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@patch("utils.kafka.KafkaConsumer")
+class MetricsTests(SimpleTestCase):
+    def get_consumer(self):
+        return Consumer(producer=MagicMock(), retry_delays=[5], group_id="metrics")
+
+    def test_lag(self, kafka_consumer):
+        consumer = self.get_consumer()
+        consumer.consumer.assignment.return_value = {TP}
+        consumer.consumer.highwater.return_value = 10
+        consumer.consumer.position.return_value = 7
+        consumer.update_lag()
+        lag = sample(
+            "kafka_consumer_lag", group="metrics", topic=TP.topic, partition="0"
+        )
+        self.assertEqual(lag, 3)
+
+    def test_handler_latency_and_failures(self, kafka_consumer):
+        consumer = self.get_consumer()
+        labels = {"group": "metrics", "event_type": "UserUpdated"}
+        handled = sample("kafka_consumer_handler_seconds_count", **labels)
+        retried = sample(
+            "kafka_consumer_failures_total",
+            group="metrics",
+            destination="metrics.retry.1",
+        )
+        message = record(0, b"k", [(EVENT_TYPE_HEADER, b"UserUpdated")])
+        consumer.process_serially({TP: [message]}, lambda m: None)
+        consumer.process_serially({TP: [message]}, fail)
+        self.assertEqual(
+            sample("kafka_consumer_handler_seconds_count", **labels), handled + 2
+        )
+        self.assertEqual(
+            sample(
+                "kafka_consumer_failures_total",
+                group="metrics",
+                destination="metrics.retry.1",
+            ),
+            retried + 1,
+        )
+
+
+class PollSizerTests(SimpleTestCase):
+    def test_grow_while_full_and_fast(self):
+        sizer = PollSizer(min_records=10, max_records=300, target_ms=1000)
+        sizer.observe(100, 0.1)
+        self.assertEqual(sizer.records, 200)
+        self.assertEqual(sizer.timeout_ms, 0)
+        sizer.observe(200, 0.1)
+        self.assertEqual(sizer.records, 300)
+
+    def test_shrink_when_slow(self):
+        sizer = PollSizer(min_records=10, target_ms=1000)
+        sizer.observe(100, 2)
+        self.assertEqual(sizer.records, 50)
+        for _ in range(5):
+            sizer.observe(1, 2)
+        self.assertEqual(sizer.records, 10)
+
+    def test_wait_when_idle(self):
+        sizer = PollSizer(idle_timeout_ms=1000)
+        sizer.observe(100, 0.1)
+        sizer.observe(3, 0.01)
+        self.assertEqual(sizer.records, 200)
+        self.assertEqual(sizer.timeout_ms, 1000)
+
+    def test_saturated(self):
+        sizer = PollSizer(saturation_ms=100)
+        sizer.observe(10, 0.1)
+        self.assertFalse(sizer.saturated)
+        for _ in range(20):
+            sizer.observe(10, 5)
+        self.assertTrue(sizer.saturated)
+
+    def test_slow_poll_is_capped(self):
+        sizer = PollSizer(saturation_ms=100)
+        sizer.observe(1, 10)
+        self.assertEqual(sizer.latency_ms, 40)
+        self.assertFalse(sizer.saturated)
+
+    def test_recover_while_idle(self):
+        sizer = PollSizer(saturation_ms=100)
+        sizer.latency_ms = 200
+        sizer.observed_at -= sizer.half_life * 2
+        sizer.observe(0, 0)
+        self.assertAlmostEqual(sizer.latency_ms, 50, delta=1)
+        self.assertFalse(sizer.saturated)
+
+
+@patch("utils.kafka.KafkaConsumer")
+class BackpressureTests(SimpleTestCase):
+    def test_throttle_while_saturated(self, kafka_consumer):
+        retry = TopicPartition("g.retry.1", 0)
+        consumer = Consumer(sizer=PollSizer(saturation_ms=10), group_id="g")
+        consumer.sizer.latency_ms = 20
+        consumer.paused = {retry: 0}
+        consumer.consumer.assignment.return_value = {TP, retry}
+        consumer.adapt({TP: [record(0, b"k")]}, 1)
+        consumer.consumer.pause.assert_called_once_with(TP)
+        self.assertEqual(consumer.throttle, 1)
+        consumer.release()
+        consumer.consumer.resume.assert_not_called()
+        consumer.throttled_until = 0
+        consumer.release()
+        consumer.consumer.resume.assert_called_once_with(TP)
+
+    def test_commit_sync_on_shutdown(self, kafka_consumer):
+        consumer = Consumer(group_id="g")
+        consumer.process_serially({TP: [record(0, b"k"), record(1, b"k")]}, None)
+        consumer.consumer.commit.assert_not_called()
+        consumer.commit_sync()
+        consumer.consumer.commit.assert_called_once_with(
+            {TP: OffsetAndMetadata(2, None)}
+        )
+
+
+@patch("utils.kafka.KafkaConsumer")
+class RebalanceTests(SimpleTestCase):
+    def test_subscribe_with_listener(self, kafka_consumer):
+        consumer = Consumer("UserUpdated", group_id="g")
+        kwargs = consumer.consumer.subscribe.call_args.kwargs
+        self.assertEqual(kwargs["topics"], ["UserUpdated"])
+        self.assertIsInstance(kwargs["listener"], RebalanceListener)
+
+    def test_commit_on_revoke(self, kafka_consumer):
+        other = TopicPartition("UserUpdated", 1)
+        consumer = Consumer(group_id="g")
+        consumer.process_serially(
+            {TP: [record(0, b"k")], other: [record(4, b"k", tp=other)]}, None
+        )
+        consumer.paused = {TP: 0}
+        RebalanceListener(consumer).on_partitions_revoked([TP])
+        consumer.consumer.commit.assert_called_once_with(
+            {TP: OffsetAndMetadata(1, None)}
+        )
+        self.assertEqual(consumer.paused, {})
+        self.assertEqual(consumer.offsets, {other: OffsetAndMetadata(5, None)})
+
+
+@patch("utils.kafka.KafkaConsumer")
+class PollTests(SimpleTestCase):
+    def test_skip_by_event_type(self, kafka_consumer):
+        messages = [
+            {"type": "UserUpdated", "schema_version": 1},
+            {"type": "UserCreated"},
+            {"type": "PasswordResetRequested"},
+        ]
+        records = [
+            ConsumerRecord(i, json.dumps(m).encode(), get_message_headers(m))
+            for i, m in enumerate(messages)
+        ]
+        # Not decoded, as it is skipped
+        records.append(ConsumerRecord(3, b"{", [(EVENT_TYPE_HEADER, b"Other")]))
+        records.append(ConsumerRecord(4, b'{"type": "Old"}', []))
+        consumer = Consumer(event_types={"UserCreated", "UserUpdated"})
+        consumer.consumer.poll.return_value = {TP: records}
+        batch = consumer.poll()
+        self.assertEqual([m.offset for m in batch[TP]], [0, 1, 4])
+        self.assertEqual(batch[TP][1].value, {"type": "UserCreated"})
+
+    def test_skip_whole_partition(self, kafka_consumer):
+        consumer = Consumer(event_types={"UserCreated"})
+        consumer.consumer.poll.return_value = {
+            TP: [ConsumerRecord(0, b"{", [(EVENT_TYPE_HEADER, b"Other")])]
+        }
+        self.assertEqual(consumer.poll(), {})
+
+    def test_count_messages(self, kafka_consumer):
+        consumer = Consumer(group_id="counted")
+        consumer.consumer.poll.return_value = {
+            TP: [ConsumerRecord(0, b'{"type": "UserUpdated"}', [])]
+        }
+        consumer.poll()
+        count = sample(
+            "kafka_consumer_messages_total",
+            group="counted",
+            topic=TP.topic,
+            event_type="UserUpdated",
+        )
+        self.assertEqual(count, 1)
+
+
+@patch("utils.kafka.KafkaConsumer")
+class ReadTopicsTests(SimpleTestCase):
+    def test_read_up_to_end_offsets(self, kafka_consumer):
+        consumer = kafka_consumer.return_value
+        consumer.partitions_for_topic.return_value = {0}
+        consumer.end_offsets.return_value = {TP: 2}
+        consumer.position.side_effect = [0, 3]
+        consumer.poll.return_value = {
+            TP: [ConsumerRecord(i, b'{"type": "UserUpdated"}', []) for i in range(3)]
+        }
+        messages = list(read_topics("kafka:9092", ["UserUpdated"]))
+        # Messages produced after the call are not read
+        self.assertEqual([m.offset for m in messages], [0, 1])
+        self.assertEqual(messages[0].value, {"type": "UserUpdated"})
+        consumer.seek_to_beginning.assert_called_once_with(TP)
+        consumer.close.assert_called_once()
+
+
+class Created(SimpleNamespace):
+    name = "Created"
+    coalescable = False
+
+
+class Updated(SimpleNamespace):
+    name = "Updated"
+    coalescable = True
+
+
+def event(cls, key, timestamp, **payload):
+    return cls(
+        id=str(timestamp),
+        topic="users",
+        key=key,
+        data=payload,
+        timestamp=timestamp,
+        schema_version=1,
+    )
+
+
+@patch("utils.kafka.create_event_producer")
+class CoalescingEventStoreTests(SimpleTestCase):
+    def sent(self, store):
+        return [c.args[1] for c in store.producer.send.call_args_list]
+
+    def test_updates_are_merged(self, create_event_producer):
+        store = KafkaEventStore("kafka:9092", coalesce_ms=60000)
+        store.add_event(event(Updated, "a", 1, first_name="x", version=1))
+        store.add_event(event(Updated, "b", 2, first_name="y", version=1))
+        store.add_event(event(Updated, "a", 3, last_name="z", version=2))
+        store.producer.send.assert_not_called()
+        store.flush()
+        sent = {m["key"]: m for m in self.sent(store)}
+        self.assertEqual(
+            sent["a"]["payload"], {"first_name": "x", "last_name": "z", "version": 2}
+        )
+        self.assertEqual(sent["a"]["timestamp"], 3)
+        self.assertEqual(get_event_ids(sent["a"]), ["1", "3"])
+        self.assertEqual(len(sent), 2)
+
+    def test_order_is_kept(self, create_event_producer):
+        store = KafkaEventStore("kafka:9092", coalesce_ms=60000)
+        store.add_event(event(Created, "a", 1))
+        store.add_event(event(Updated, "a", 2))
+        store.add_event(event(Created, "a", 3))
+        self.assertEqual([m["timestamp"] for m in self.sent(store)], [1, 2, 3])
+
+    def test_sent_after_window(self, create_event_producer):
+        store = KafkaEventStore("kafka:9092", coalesce_ms=10)
+        store.add_event(event(Updated, "a", 1))
+        for _ in range(100):
+            if store.producer.send.called:
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(self.sent(store)), 1)
+
+    def test_disabled(self, create_event_producer):
+        store = KafkaEventStore("kafka:9092")
+        store.add_event(event(Updated, "a", 1))
+        store.producer.send.assert_called_once()
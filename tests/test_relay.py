@@ -0,0 +1,75 @@
+import tempfile
+import threading
+import uuid
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from utils.relay import RelayClient
+from utils.relay import RelayError
+from utils.relay import RelayServer
+from utils.spool import SPOOLED
+
+
+class RelayTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = str(Path(directory.name) / "relay.sock")
+        self.fallback = mock.Mock()
+        self.client = RelayClient(self.path, lambda: self.fallback)
+        self.addCleanup(self.client.end)
+
+    def start_server(self, producer):
+        server = RelayServer(self.path, producer)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+    def test_relay(self):
+        producer = mock.Mock()
+        self.start_server(producer)
+        pk = uuid.uuid4()
+        headers = [("codec", b"json")]
+        for i in range(3):
+            self.assertIsNone(
+                self.client.send(
+                    "UserUpdated", {"id": pk, "version": i}, "key", headers
+                )
+            )
+        self.assertEqual(
+            producer.send.call_args_list,
+            [
+                mock.call(
+                    topic="UserUpdated",
+                    message={"id": str(pk), "version": i},
+                    message_key="key",
+                    headers=headers,
+                )
+                for i in range(3)
+            ],
+        )
+        self.fallback.send.assert_not_called()
+
+    def test_spooled(self):
+        producer = mock.Mock()
+        producer.send.return_value = SPOOLED
+        self.start_server(producer)
+        self.assertIs(self.client.send("UserUpdated", {"id": "1"}), SPOOLED)
+
+    def test_rejected(self):
+        producer = mock.Mock()
+        producer.send.side_effect = ValueError
+        self.start_server(producer)
+        with self.assertRaises(RelayError):
+            self.client.send("UserUpdated", {"id": "1"})
+
+    def test_fallback(self):
+        future = self.client.send("UserUpdated", {"id": "1"}, "key")
+        self.assertEqual(future, self.fallback.send.return_value)
+        self.fallback.send.assert_called_once_with(
+            topic="UserUpdated", message={"id": "1"}, message_key="key", headers=None
+        )
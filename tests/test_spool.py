@@ -0,0 +1,100 @@
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+from kafka.errors import KafkaTimeoutError
+
+from utils.spool import SPOOLED
+from utils.spool import Spool
+from utils.spool import SpoolFullError
+from utils.spool import SpoolingProducer
+
+
+def record(i):
+    return {
+        "topic": "UserUpdated",
+        "message": {"id": str(i)},
+        "message_key": "key",
+        "headers": [("codec", b"json")],
+    }
+
+
+class SpoolTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.spool = Spool(self.directory.name, 1024 * 1024, segment_bytes=100)
+
+    def drain(self):
+        drained = []
+        self.spool.drain(lambda records: drained.extend(records))
+        return drained
+
+    def test_drain_in_order(self):
+        for i in range(10):
+            self.spool.append(record(i))
+        self.assertGreater(len(self.spool.get_paths()), 1)
+        self.assertTrue(self.spool.pending)
+        drained = self.drain()
+        self.assertEqual([r["message"]["id"] for r in drained], list("0123456789"))
+        self.assertEqual(drained[0]["headers"], [["codec", b"json"]])
+        self.assertEqual(self.spool.get_paths(), [])
+        self.assertFalse(self.spool.pending)
+
+    def test_failed_drain_is_retried(self):
+        self.spool.append(record(1))
+
+        def fail(records):
+            raise KafkaTimeoutError
+
+        with self.assertRaises(KafkaTimeoutError):
+            self.spool.drain(fail)
+        self.assertTrue(self.spool.pending)
+        self.assertEqual(len(self.drain()), 1)
+
+    def test_truncated_record(self):
+        self.spool.append(record(1))
+        self.spool.append(record(2))
+        self.spool.roll()
+        path = self.spool.get_paths()[0]
+        path.write_bytes(path.read_bytes()[:-3])
+        self.assertEqual([r["message"]["id"] for r in self.drain()], ["1"])
+
+    def test_full(self):
+        spool = Spool(self.directory.name, 50)
+        with self.assertRaises(SpoolFullError):
+            spool.append(record(1))
+
+
+class SpoolingProducerTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.spool = Spool(directory.name, 1024 * 1024)
+        self.producer = mock.Mock()
+        self.spooling = SpoolingProducer(self.producer, self.spool, interval=3600)
+
+    def test_send(self):
+        future = self.spooling.send("UserUpdated", {"id": "1"}, message_key="key")
+        self.assertEqual(future, self.producer.send.return_value)
+        self.assertFalse(self.spool.pending)
+
+    def test_spool_when_kafka_is_unreachable(self):
+        self.producer.send.side_effect = KafkaTimeoutError
+        self.assertIs(self.spooling.send("UserUpdated", {"id": "1"}), SPOOLED)
+        self.producer.send.side_effect = None
+        # Spooled events are sent first
+        self.assertIs(self.spooling.send("UserUpdated", {"id": "2"}), SPOOLED)
+        self.assertEqual(self.producer.send.call_count, 1)
+
+        self.spool.drain(self.spooling.send_records)
+        calls = self.producer.send.call_args_list[1:]
+        self.assertEqual([c.kwargs["message"]["id"] for c in calls], ["1", "2"])
+        self.assertFalse(self.spool.pending)
+
+    def test_spool_undelivered(self):
+        self.spooling.send("UserUpdated", {"id": "1"}, message_key="key")
+        future = self.producer.send.return_value
+        callback, record = future.add_errback.call_args.args
+        callback(record, KafkaTimeoutError())
+        self.assertTrue(self.spool.pending)
@@ -3,6 +3,7 @@ from django.contrib.auth import get_user_model
 
 from .models.admin import SentVerification
 from .models.company import Company
+from .models.workload import AccountableWorkload
 
 User = get_user_model()
 
@@ -29,3 +30,24 @@ class CompanyAdmin(admin.ModelAdmin):
 @admin.register(SentVerification)
 class SentVerificationAdmin(admin.ModelAdmin):
     readonly_fields = ("user_comment",)
+
+
+@admin.register(AccountableWorkload)
+class AccountableWorkloadAdmin(admin.ModelAdmin):
+    list_display = [
+        "accountable",
+        "assigned_count",
+        "capacity",
+        "works_from",
+        "works_until",
+        "content_type",
+    ]
+    list_select_related = ["accountable", "content_type"]
+    ordering = ["-assigned_count"]
+    raw_id_fields = ("accountable",)
+    readonly_fields = ("assigned_count",)
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj:
+            return ("accountable", *self.readonly_fields)
+        return self.readonly_fields
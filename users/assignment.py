@@ -0,0 +1,131 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+
+from users.events import UserUpdated
+from users.events import VerificationAssigned
+from users.events import VerificationCreated
+from users.events import VerificationInspected
+from users.models.verification import VerificationRequest
+from users.serializers.verification import AdminVerificationRequestSerializer
+from users.services import event_store
+from utils import acks
+
+logger = logging.getLogger(__name__)
+
+# Fields of a user whose change may make them an accountable
+ACCOUNTABLE_FIELDS = {"roles", "is_staff", "is_active"}
+
+
+def get_unassigned():
+    return VerificationRequest.objects.filter(
+        status=VerificationRequest.SENT, accountable=None
+    )
+
+
+def assign_request(item, store=None):
+    """
+    Assign a verification request to the least assigned accountable and
+    publish the assignment. Returns the accountable, if any.
+    """
+    with transaction.atomic():
+        accountable = item.assign()
+        if accountable:
+            item.refresh_from_db()
+            serializer = AdminVerificationRequestSerializer(item)
+            event = VerificationAssigned(serializer.data)
+            (store or event_store).add_event(event)
+    return accountable
+
+
+def assign_batch(pks, store=None):
+    """
+    Assign verification requests to the least assigned accountables with a
+    query for their loads and one UPDATE, and publish the assignments.
+    Returns how many requests were assigned.
+    """
+    pks = list(pks)
+    with transaction.atomic():
+        assigned = VerificationRequest.objects.assign_many(
+            VerificationRequest.objects.distribute(pks)
+        )
+        items = (
+            VerificationRequest.objects.filter(pk__in=assigned)
+            .select_related("user__company", "accountable", "content_type")
+            .prefetch_related(
+                "documents", "accountable__groups", "accountable__user_permissions"
+            )
+        )
+        serializer = AdminVerificationRequestSerializer(items, many=True)
+        (store or event_store).add_events(
+            [VerificationAssigned(data) for data in serializer.data]
+        )
+    return len(assigned)
+
+
+def assign_unassigned(store=None, batch_size=None):
+    """
+    Assign every unassigned verification request, oldest first, in a
+    transaction per `batch_size` requests. Requests claimed by another
+    assigner are skipped, so that several of them can drain a backlog
+    together. Returns how many were assigned.
+    """
+    batch_size = batch_size or settings.VERIFICATION_ASSIGN_BATCH_SIZE
+    total = 0
+    while True:
+        with transaction.atomic():
+            pks = VerificationRequest.objects.claim_unassigned(batch_size)
+            assigned = assign_batch(pks, store)
+        total += assigned
+        if len(pks) < batch_size or not assigned:
+            return total
+
+
+def on_verification_created(message):
+    # The event is published before the request is committed, so a missing
+    # request is raised to be retried.
+    item = VerificationRequest.objects.get(pk=message["payload"]["id"])
+    with transaction.atomic():
+        # Requests assigned or being assigned by another assigner are skipped.
+        if VerificationRequest.objects.claim_unassigned(1, pks=[item.pk]):
+            assign_request(item)
+
+
+def on_user_updated(message):
+    if not ACCOUNTABLE_FIELDS & message["payload"].keys():
+        return
+    # A new accountable can take requests no one could before, once the
+    # consumer has applied the change. It is retried later instead of waited
+    # for, so as not to hold back the messages behind it.
+    event_id = message.get("id")
+    if event_id and not acks.is_applied(event_id):
+        raise acks.EventNotAppliedError
+    assigned = assign_unassigned()
+    if assigned:
+        msg = f"Assigned {assigned} verification requests after an admin changed"
+        logger.info(msg)
+
+
+def on_verification_inspected(message):
+    # Accountables at capacity may take waiting requests again.
+    assigned = assign_unassigned()
+    if assigned:
+        msg = f"Assigned {assigned} verification requests after one was inspected"
+        logger.info(msg)
+
+
+CALLBACKS = {
+    VerificationCreated.name: on_verification_created,
+    VerificationInspected.name: on_verification_inspected,
+    UserUpdated.name: on_user_updated,
+}
+
+
+def handle_message(message):
+    """
+    Assign verification requests as an event message calls for.
+    """
+    callback = CALLBACKS.get(message["type"])
+    if callback:
+        callback(message)
@@ -1,28 +1,70 @@
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+
+
 class Event:
     name = None
+    # Bumped when the payload changes incompatibly
+    schema_version = 1
+    # Whether events of the same key can be merged, keeping the later values
+    coalescable = False
 
     def __init__(self, data):
         self.data = data
-        self.topic = self.name
+        self.topic = self.get_topic()
         # key is used as message key
         self.key = data["id"]
+        # id is used to apply the event only once, and to acknowledge it
+        self.id = str(uuid.uuid4())
+        # timestamp is used to order events of different partitions
+        self.timestamp = time.time()
 
     def __str__(self):
         return f"{self.name}: {self.data}"
 
+    @classmethod
+    def get_topic(cls):
+        return cls.name
+
+
+class UserLifecycleEvent(Event):
+    @classmethod
+    def get_topic(cls):
+        # With a single user topic, the events of a user are consumed in the
+        # order they were produced.
+        return settings.USER_EVENTS_TOPIC or cls.name
+
 
-class UserCreated(Event):
+class UserCreated(UserLifecycleEvent):
     name = "UserCreated"
 
 
-class UserUpdated(Event):
+class UserUpdated(UserLifecycleEvent):
     name = "UserUpdated"
+    coalescable = True
 
 
-class UserDeleted(Event):
+class UserDeleted(UserLifecycleEvent):
     name = "UserDeleted"
 
 
+# Events applied to users by the consumer
+USER_EVENTS = [UserCreated, UserUpdated, UserDeleted]
+
+
+def get_user_event_topics():
+    """
+    Topics of the user events. Per event topics are still read after switching
+    to a single user topic, until they are drained.
+    """
+    topics = {event.name for event in USER_EVENTS}
+    topics |= {event.get_topic() for event in USER_EVENTS}
+    return topics
+
+
 class PasswordResetRequested(Event):
     name = "PasswordResetRequested"
 
@@ -45,3 +87,49 @@ class VerificationAssigned(Event):
 
 class VerificationInspected(Event):
     name = "VerificationInspected"
+
+
+class UserEventFold:
+    """
+    Collapses user events into the final state per user id. Later updates win
+    over earlier ones and a delete wins over everything else.
+    """
+
+    def __init__(self):
+        self.created = {}
+        self.updated = {}
+        self.deleted = set()
+        # latest event timestamp per user id
+        self.timestamps = {}
+        # number of updates folded per user id, added to their version
+        self.update_counts = Counter()
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def add(self, message):
+        """
+        Add a message built by `utils.kafka.get_event_message`. Messages of a
+        type must be added in the order they were produced.
+        """
+        tp = message["type"]
+        key = message["key"]
+        body = message["payload"]
+        if tp not in (UserCreated.name, UserUpdated.name, UserDeleted.name):
+            return
+        self.timestamps[key] = max(message["timestamp"], self.timestamps.get(key, 0))
+        if key in self.deleted:
+            return
+        if tp == UserCreated.name:
+            self.created[key] = body
+        elif tp == UserUpdated.name:
+            # The version is counted by the consumer. Events published before
+            # that carry the version the service read, which may be stale.
+            body = {name: value for name, value in body.items() if name != "version"}
+            self.updated[key] = {**self.updated.get(key, {}), **body}
+            self.update_counts[key] += 1
+        else:
+            self.deleted.add(key)
+            self.created.pop(key, None)
+            self.updated.pop(key, None)
+            self.update_counts.pop(key, None)
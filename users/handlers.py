@@ -0,0 +1,81 @@
+import logging
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from users.events import UserCreated
+from users.events import UserDeleted
+from users.events import UserEventFold
+from users.events import UserUpdated
+from users.models.ledger import AppliedEvent
+from utils import acks
+from utils.kafka import get_event_ids
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+
+def on_user_created(body):
+    from users.services import UserService
+
+    UserService.on_user_created(**body)
+
+
+CALLBACKS = {
+    UserCreated.name: on_user_created,
+    UserUpdated.name: lambda body: User.objects.update_user(**body),
+    UserDeleted.name: lambda body: User.objects.filter(pk=body["id"]).delete(),
+}
+
+
+def handle_message(message):
+    """
+    Apply an event message built by `utils.kafka.get_event_message` once, and
+    acknowledge it. Returns whether the message is a user event.
+    """
+    callback = CALLBACKS.get(message["type"])
+    if not callback:
+        return False
+    # Events published before ids were introduced have none.
+    event_id = message.get("id")
+    with transaction.atomic():
+        if event_id and AppliedEvent.objects.get_applied([event_id]):
+            logger.info("Skipping already applied event.")
+        else:
+            callback(message["payload"])
+            if event_id:
+                AppliedEvent.objects.record([event_id])
+    acks.acknowledge_many(get_event_ids(message))
+    return True
+
+
+def handle_batch(messages):
+    """
+    Apply event messages in bulk, once each and in the order given, and
+    acknowledge them. Returns the ids of the affected users.
+    """
+    event_ids = {m["id"] for m in messages if m.get("id")}
+    with transaction.atomic():
+        applied = AppliedEvent.objects.get_applied(event_ids)
+        seen = set(applied)
+        fold = UserEventFold()
+        for message in messages:
+            event_id = message.get("id")
+            # Redeliveries may also be in the same batch.
+            if event_id in seen:
+                continue
+            if event_id:
+                seen.add(event_id)
+            fold.add(message)
+        User.objects.apply_batch(
+            fold.created,
+            fold.updated,
+            fold.deleted,
+            update_counts=fold.update_counts,
+        )
+        AppliedEvent.objects.record(event_ids - applied)
+    # Redeliveries are acknowledged again, in case the acks expired.
+    acks.acknowledge_many(
+        {event_id for message in messages for event_id in get_event_ids(message)}
+    )
+    return set(fold.timestamps)
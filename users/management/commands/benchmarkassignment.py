@@ -0,0 +1,74 @@
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from users.assignment import assign_batch
+from users.assignment import assign_request
+from users.assignment import get_unassigned
+from users.models.verification import VerificationRequest
+from utils.bus import InMemoryEventStore
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Measures assigning a backlog of verification requests, then rolls back"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests", type=int, default=10000, help="Number of requests to assign"
+        )
+        parser.add_argument(
+            "--admins", type=int, default=100, help="Number of accountables"
+        )
+        parser.add_argument(
+            "--skip-legacy",
+            action="store_true",
+            help="Do not measure assigning the requests one by one",
+        )
+
+    def report(self, action, count, start):
+        rate = count / max(time.monotonic() - start, 1e-6)
+        self.stdout.write(f"{action}: {count} ({rate:.0f}/s)")
+
+    def create_users(self, count, **kwargs):
+        password = make_password(None)
+        return User.objects.bulk_create(
+            User(id=pk, email=f"{pk.hex}@example.com", password=password, **kwargs)
+            for pk in (uuid.uuid4() for _ in range(count))
+        )
+
+    def create_requests(self, count):
+        content_type = ContentType.objects.get_for_model(User)
+        VerificationRequest.objects.bulk_create(
+            VerificationRequest(
+                content_type=content_type, object_id=str(user.pk), user=user
+            )
+            for user in self.create_users(count)
+        )
+
+    def handle(self, *args, requests, admins, skip_legacy, **options):
+        store = InMemoryEventStore(lambda message: None)
+        with transaction.atomic():
+            self.create_users(
+                admins, is_staff=True, roles=["verifications.accountable"]
+            )
+            self.create_requests(requests)
+            if not skip_legacy:
+                with transaction.atomic():
+                    start = time.monotonic()
+                    for item in get_unassigned().order_by("created_at"):
+                        assign_request(item, store)
+                    self.report("Assigned one by one", requests, start)
+                    transaction.set_rollback(True)
+            start = time.monotonic()
+            assigned = assign_batch(
+                get_unassigned().values_list("pk", flat=True), store
+            )
+            self.report("Assigned in a batch", assigned, start)
+            transaction.set_rollback(True)
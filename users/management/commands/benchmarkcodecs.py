@@ -0,0 +1,79 @@
+import gzip
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from users.events import UserUpdated
+from users.serializers.user import ReadOnlyUserSerializer
+from utils.codecs import CODECS
+from utils.kafka import get_event_message
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Compares throughput and message size of the event codecs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--messages", type=int, default=1000, help="Number of messages to encode"
+        )
+        parser.add_argument(
+            "--rounds", type=int, default=5, help="Rounds to run, the best is kept"
+        )
+
+    def build_messages(self, count):
+        now = timezone.now()
+        messages = []
+        for i in range(count):
+            user = User(
+                id=uuid.uuid4(),
+                email=f"user{i}@example.com",
+                email_verified=True,
+                email_verified_at=now,
+                mobile=f"0912{i:07d}",
+                mobile_verified=True,
+                mobile_verified_at=now,
+                national_code=f"{i:010d}",
+                shahkar_verified=True,
+                shahkar_verified_at=now,
+                postal_code=f"{i:010d}",
+                postal_address="No. 12, Valiasr St., Tehran",
+                first_name="Ali",
+                last_name="Rezaei",
+                date_joined=now,
+                roles=["support"],
+                access_list=["users.view_user"],
+                version=i,
+            )
+            body = ReadOnlyUserSerializer(user).data
+            messages.append(get_event_message(UserUpdated(body)))
+        return messages
+
+    def best_of(self, rounds, func, items):
+        best = float("inf")
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for item in items:
+                func(item)
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    def handle(self, *args, messages, rounds, **options):
+        payloads = self.build_messages(messages)
+        self.stdout.write(
+            f"{'codec':<10}{'encode/s':>12}{'decode/s':>12}{'bytes':>10}{'gzip':>10}"
+        )
+        for name, codec in CODECS.items():
+            encoded = [codec.encode(payload) for payload in payloads]
+            encode_time = self.best_of(rounds, codec.encode, payloads)
+            decode_time = self.best_of(rounds, codec.decode, encoded)
+            size = sum(len(data) for data in encoded) / messages
+            gzipped = len(gzip.compress(b"".join(encoded))) / messages
+            self.stdout.write(
+                f"{name:<10}{messages / encode_time:>12.0f}"
+                f"{messages / decode_time:>12.0f}{size:>10.0f}{gzipped:>10.0f}"
+            )
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from users.events import UserUpdated
+from utils.aio import create_async_consumer
+from utils.kafka import create_consumer
+from utils.kafka import create_producer
+from utils.kafka import get_event_message
+from utils.kafka import get_message_headers
+
+
+class Counter:
+    """
+    Counts handled messages and stops the consumer once all are handled.
+    """
+
+    def __init__(self, consumer, total):
+        self.consumer = consumer
+        self.total = total
+        self.count = 0
+        self.lock = threading.Lock()
+        self.started = None
+        self.finished = None
+
+    def add(self, count=1):
+        with self.lock:
+            if self.started is None:
+                self.started = time.monotonic()
+            self.count += count
+            if self.count >= self.total and self.finished is None:
+                self.finished = time.monotonic()
+                self.consumer.stop()
+
+    @property
+    def rate(self):
+        return self.count / max(self.finished - self.started, 1e-6)
+
+
+class Command(BaseCommand):
+    help = "Compares the throughput of the threads and asyncio consumer runtimes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--messages", type=int, default=10000, help="Number of messages to consume"
+        )
+        parser.add_argument(
+            "--handler-ms",
+            type=float,
+            default=2,
+            help="Milliseconds each message handler waits, as a database write would",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=4, help="Number of worker threads"
+        )
+        parser.add_argument(
+            "--keys", type=int, default=1000, help="Number of distinct message keys"
+        )
+
+    def produce(self, topic, messages, keys):
+        producer = create_producer(settings.KAFKA_URL)
+        ids = [str(uuid.uuid4()) for _ in range(keys)]
+        for i in range(messages):
+            message = get_event_message(
+                UserUpdated({"id": ids[i % keys], "version": i})
+            )
+            producer.send(
+                topic,
+                message,
+                message_key=message["key"],
+                headers=get_message_headers(message),
+            )
+        producer.end()
+
+    def run(self, factory, handler):
+        consumer = factory(
+            settings.KAFKA_URL, f"benchmark-{uuid.uuid4()}", [self.topic], self.workers
+        )
+        counter = Counter(consumer, self.messages)
+        consumer.start_consuming(on_message=handler(counter))
+        return counter.rate
+
+    def handle(self, *args, messages, handler_ms, workers, keys, **options):
+        self.topic = f"benchmark-{uuid.uuid4()}"
+        self.messages = messages
+        self.workers = workers
+        self.produce(self.topic, messages, keys)
+        delay = handler_ms / 1000
+
+        def blocking(counter):
+            def on_message(message):
+                time.sleep(delay)
+                counter.add()
+
+            return on_message
+
+        def coroutine(counter):
+            async def on_message(message):
+                await asyncio.sleep(delay)
+                counter.add()
+
+            return on_message
+
+        runs = [
+            ("threads", create_consumer, blocking),
+            ("asyncio", create_async_consumer, blocking),
+            ("asyncio (coroutine handler)", create_async_consumer, coroutine),
+        ]
+        self.stdout.write(f"{'runtime':<30}{'messages/s':>12}")
+        for name, factory, handler in runs:
+            rate = self.run(factory, handler)
+            self.stdout.write(f"{name:<30}{rate:>12.0f}")
@@ -0,0 +1,69 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import transaction
+
+from users.handlers import handle_message
+from users.services import UserService
+from utils.bus import InMemoryEventStore
+
+
+class Command(BaseCommand):
+    help = "Measures the throughput of user writes, applied in process without a broker"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users", type=int, default=1000, help="Number of users to create"
+        )
+        parser.add_argument(
+            "--updates", type=int, default=5, help="Number of updates per user"
+        )
+        parser.add_argument(
+            "--background",
+            action="store_true",
+            help="Apply events on a background thread, with --keep",
+        )
+        parser.add_argument(
+            "--keep", action="store_true", help="Keep the users instead of rolling back"
+        )
+
+    def report(self, action, count, start):
+        rate = count / max(time.monotonic() - start, 1e-6)
+        self.stdout.write(f"{action}: {count} ({rate:.0f}/s)")
+
+    def run(self, service, users, updates):
+        start = time.monotonic()
+        instances = [
+            service.create(
+                email=f"{uuid.uuid4().hex}@example.com",
+                password=uuid.uuid4().hex,
+                first_name="Bench",
+                last_name="Mark",
+            )
+            for _ in range(users)
+        ]
+        service.event_store.join()
+        self.report("Created users", users, start)
+        start = time.monotonic()
+        for instance in instances:
+            for i in range(updates):
+                service.update(instance, first_name=f"Bench {i}")
+        service.event_store.join()
+        self.report("Updated users", users * updates, start)
+
+    def handle(self, *args, users, updates, background, keep, **options):
+        if background and not keep:
+            # The thread writes with its own connection, outside the transaction.
+            msg = "--background writes can not be rolled back, add --keep."
+            raise CommandError(msg)
+        store = InMemoryEventStore(handle_message, background=background)
+        # Writes are timed up to applying them, without polling for their acks.
+        service = UserService(store, ack_timeout=0)
+        try:
+            with transaction.atomic():
+                self.run(service, users, updates)
+                transaction.set_rollback(not keep)
+        finally:
+            store.close()
@@ -1,41 +1,111 @@
 import logging
 
 from django.conf import settings
-from django.contrib.auth import get_user_model
 from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
 
-from users.events import UserCreated
-from users.events import UserDeleted
-from users.events import UserUpdated
-from users.services import UserService
+from users.events import get_user_event_topics
+from users.handlers import CALLBACKS
+from users.handlers import handle_batch
+from users.handlers import handle_message
+from users.snapshots import publish_snapshots
 from utils.kafka import create_consumer
+from utils.kafka import create_producer
+from utils.kafka import interleave
+from utils.metrics import serve_metrics
 
 logger = logging.getLogger(__name__)
-User = get_user_model()
 
 
 class Command(BaseCommand):
     help = "Starts consuming events and tasks."
 
-    EVENTS = [UserCreated, UserUpdated, UserDeleted]
+    # Producer of user snapshots, if they are enabled
+    producer = None
 
-    CALLBACKS = {
-        UserCreated.name: lambda body: UserService.on_user_created(**body),
-        UserUpdated.name: lambda body: User.objects.update_user(**body),
-        UserDeleted.name: lambda body: User.objects.filter(pk=body["id"]).delete(),
-    }
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch",
+            action="store_true",
+            help="Collapse the events of each poll per user and apply them in bulk",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of threads applying events of different users concurrently",
+        )
+        parser.add_argument(
+            "--runtime",
+            choices=["threads", "asyncio"],
+            default=settings.CONSUMER_RUNTIME,
+            help="Run the consumer on threads, or on asyncio with aiokafka",
+        )
+        parser.add_argument(
+            "--metrics-port",
+            type=int,
+            default=settings.CONSUMER_METRICS_PORT,
+            help="Port to serve Prometheus metrics on",
+        )
+        parser.add_argument(
+            "--metrics-textfile",
+            default=settings.CONSUMER_METRICS_TEXTFILE,
+            help="File to write Prometheus metrics to, for a textfile collector",
+        )
 
     def on_message(self, message):
-        tp = message.value["type"]
-        callback = self.CALLBACKS.get(tp)
-        if callback:
-            body = message.value["payload"]
-            callback(body)
-
-    def handle(self, *args, **options):
-        topics = [event.name for event in self.EVENTS]
+        if handle_message(message.value):
+            self.publish_snapshots([message.value["key"]])
+
+    def on_batch(self, messages):
+        # Events of a user are ordered within their partition only.
+        messages = interleave(messages, key=lambda message: message.value["timestamp"])
+        self.publish_snapshots(handle_batch([message.value for message in messages]))
+
+    def publish_snapshots(self, pks):
+        # Snapshots that fail to publish are fixed by the next full republish.
+        if self.producer:
+            publish_snapshots(self.producer, pks)
+
+    def handle(  # noqa: PLR0913
+        self,
+        *args,
+        batch,
+        workers,
+        runtime="threads",
+        metrics_port=None,
+        metrics_textfile=None,
+        **options,
+    ):
+        if batch and workers > 1:
+            msg = "--batch and --workers can not be used together."
+            raise CommandError(msg)
+        serve_metrics(metrics_port, metrics_textfile)
+        topics = get_user_event_topics()
         bootstrap_servers = settings.KAFKA_URL
         logger.info("Connecting to Kafka...")
+        factory = create_consumer
+        if runtime == "asyncio":
+            from utils.aio import create_async_consumer as factory
         # Create Kafka consumer
-        consumer = create_consumer(bootstrap_servers, "userapi", topics)
-        consumer.start_consuming(on_message=self.on_message)
+        consumer = factory(
+            bootstrap_servers,
+            "userapi",
+            topics,
+            workers,
+            retry_delays=settings.KAFKA_RETRY_DELAYS,
+            event_types=set(CALLBACKS),
+        )
+        self.producer = None
+        if settings.USER_SNAPSHOTS_TOPIC:
+            self.producer = create_producer(bootstrap_servers)
+        try:
+            if batch:
+                consumer.start_consuming(
+                    on_message=self.on_message, on_batch=self.on_batch
+                )
+            else:
+                consumer.start_consuming(on_message=self.on_message)
+        finally:
+            if self.producer:
+                self.producer.end()
@@ -0,0 +1,55 @@
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from utils.kafka import create_event_producer
+from utils.relay import RelayServer
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Sends the events of all processes of this host with one producer"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--socket",
+            default=settings.EVENT_RELAY_SOCKET,
+            help="Unix socket to listen on",
+        )
+        parser.add_argument(
+            "--linger-ms",
+            type=int,
+            default=200,
+            help="Milliseconds to wait for more messages to fill a batch",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=256 * 1024,
+            help="Maximum size of a batch in bytes",
+        )
+
+    def handle(self, *args, socket, linger_ms, batch_size, **options):
+        if not socket:
+            msg = "Set EVENT_RELAY_SOCKET or pass --socket."
+            raise CommandError(msg)
+        logger.info("Connecting to Kafka...")
+        producer = create_event_producer(
+            settings.KAFKA_URL,
+            settings.EVENT_SPOOL_DIR,
+            linger_ms=linger_ms,
+            batch_size=batch_size,
+        )
+        server = RelayServer(socket, producer)
+        msg = f"Relaying events from {socket}"
+        logger.info(msg)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            producer.end()
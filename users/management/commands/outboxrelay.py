@@ -0,0 +1,50 @@
+import logging
+from time import sleep
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from users.models.outbox import OutboxEvent
+from utils.kafka import create_producer
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Publishes events from the outbox table to Kafka"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Maximum number of events published at once",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0.2,
+            help="Seconds to wait when the outbox is empty",
+        )
+
+    def handle(self, *args, batch_size, interval, **options):
+        logger.info("Connecting to Kafka...")
+        producer = create_producer(settings.KAFKA_URL)
+        try:
+            while True:
+                try:
+                    published = OutboxEvent.objects.publish_batch(
+                        producer, batch_size, lag=settings.EVENT_OUTBOX_LAG
+                    )
+                except Exception as e:
+                    msg = f"Failed to publish outbox events: {e}"
+                    logger.exception(msg)
+                    sleep(5)
+                    continue
+                if published:
+                    msg = f"Published {published} outbox events."
+                    logger.info(msg)
+                if published < batch_size:
+                    sleep(interval)
+        finally:
+            producer.end()
@@ -0,0 +1,49 @@
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from users.snapshots import publish_all_snapshots
+from utils.kafka import create_compacted_topic
+from utils.kafka import create_producer
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Republishes the snapshots of all users to the user snapshots topic"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of users published before waiting for the broker",
+        )
+        parser.add_argument(
+            "--partitions",
+            type=int,
+            default=6,
+            help="Partitions of the topic, if it is created",
+        )
+        parser.add_argument(
+            "--replicas",
+            type=int,
+            default=1,
+            help="Replication factor of the topic, if it is created",
+        )
+
+    def handle(self, *args, batch_size, partitions, replicas, **options):
+        topic = settings.USER_SNAPSHOTS_TOPIC
+        if not topic:
+            msg = "Set USER_SNAPSHOTS_TOPIC to publish user snapshots."
+            raise CommandError(msg)
+        bootstrap_servers = settings.KAFKA_URL
+        create_compacted_topic(bootstrap_servers, topic, partitions, replicas)
+        producer = create_producer(bootstrap_servers)
+        try:
+            count = publish_all_snapshots(producer, batch_size)
+        finally:
+            producer.end()
+        self.stdout.write(self.style.SUCCESS(f"Published {count} user snapshots"))
@@ -0,0 +1,102 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from users.reconcile import read_user_events
+from users.reconcile import reconcile_events
+from users.reconcile import reconcile_snapshots
+from users.reconcile import repair_events
+from users.reconcile import repair_snapshots
+from users.snapshots import SNAPSHOT_TYPE
+from utils.kafka import create_producer
+from utils.kafka import read_topics
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Compares users with the published events or snapshots"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source",
+            choices=["events", "snapshots"],
+            default="events",
+            help="What to compare users with",
+        )
+        parser.add_argument(
+            "--since",
+            type=parse_datetime,
+            help="Only compare users changed since this ISO datetime",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Compare all users, not only recently changed ones",
+        )
+        parser.add_argument(
+            "--grace",
+            type=float,
+            default=60,
+            help="Seconds an event may take to be applied",
+        )
+        parser.add_argument(
+            "--repair",
+            action="store_true",
+            help="Repair users or snapshots that diverge",
+        )
+        parser.add_argument(
+            "--passes",
+            type=int,
+            default=settings.RECONCILE_PASSES,
+            help="Read the events this many times, each time for a share of the"
+            " users, to bound memory",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(  # noqa: PLR0913
+        self,
+        *args,
+        source,
+        since,
+        full,
+        grace,
+        repair,
+        passes,
+        batch_size,
+        **options,
+    ):
+        if full:
+            since = None
+        elif since is None:
+            since = timezone.now() - timedelta(hours=settings.RECONCILE_WINDOW_HOURS)
+        if source == "events":
+            divergence = reconcile_events(
+                lambda: read_user_events(since), grace, batch_size, passes
+            )
+            if repair:
+                repair_events(divergence, batch_size)
+        else:
+            if not settings.USER_SNAPSHOTS_TOPIC:
+                msg = "Set USER_SNAPSHOTS_TOPIC to compare with user snapshots."
+                raise CommandError(msg)
+            messages = read_topics(
+                settings.KAFKA_URL,
+                [settings.USER_SNAPSHOTS_TOPIC],
+                event_types={SNAPSHOT_TYPE},
+                decode_values=False,
+            )
+            divergence = reconcile_snapshots(messages, since, batch_size)
+            if repair:
+                producer = create_producer(settings.KAFKA_URL)
+                try:
+                    repair_snapshots(divergence, producer)
+                finally:
+                    producer.end()
+        action = "Repaired" if repair else "Found"
+        self.stdout.write(f"{action} {divergence} users")
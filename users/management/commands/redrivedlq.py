@@ -0,0 +1,89 @@
+import logging
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from utils.kafka import ERROR_HEADER
+from utils.kafka import ORIGINAL_TOPIC_HEADER
+from utils.kafka import RETRY_AT_HEADER
+from utils.kafka import RETRY_ATTEMPT_HEADER
+from utils.kafka import create_consumer
+from utils.kafka import create_producer
+from utils.kafka import get_header
+from utils.kafka import get_raw_value
+
+logger = logging.getLogger(__name__)
+
+# Headers of a failed attempt, dropped so that a re-driven event starts over
+RETRY_HEADERS = {RETRY_ATTEMPT_HEADER, RETRY_AT_HEADER, ERROR_HEADER}
+
+
+class Command(BaseCommand):
+    help = "Re-publishes dead-lettered events to the topics they failed on"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--group",
+            default="userapi",
+            help="Consumer group whose dead-letter topic is re-driven",
+        )
+        parser.add_argument(
+            "--limit", type=int, help="Maximum number of events to re-drive"
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report dead-lettered events, without re-driving them",
+        )
+
+    def handle(self, *args, group, limit, dry_run, **options):
+        bootstrap_servers = settings.KAFKA_URL
+        consumer = create_consumer(
+            bootstrap_servers, f"{group}.redrive", [f"{group}.dlq"]
+        )
+        producer = create_producer(bootstrap_servers)
+        counts = Counter()
+        try:
+            while limit is None or counts.total() < limit:
+                max_records = 500 if limit is None else limit - counts.total()
+                batch = consumer.poll(
+                    timeout_ms=5000, max_records=min(max_records, 500)
+                )
+                if not batch:
+                    break
+                futures = []
+                for messages in batch.values():
+                    for message in messages:
+                        topic = get_header(message, ORIGINAL_TOPIC_HEADER)
+                        counts[(topic, get_header(message, ERROR_HEADER))] += 1
+                        if not dry_run:
+                            key = message.key.decode("utf-8") if message.key else None
+                            headers = [
+                                (name, value)
+                                for name, value in message.headers or []
+                                if name not in RETRY_HEADERS
+                            ]
+                            futures.append(
+                                producer.send(
+                                    topic,
+                                    get_raw_value(message),
+                                    message_key=key,
+                                    headers=headers,
+                                )
+                            )
+                producer.flush()
+                for future in futures:
+                    future.get(timeout=30)
+                if not dry_run:
+                    consumer.commit_offsets(consumer.rewind(batch, []))
+        finally:
+            producer.end()
+            # Asynchronous commits may still be in flight.
+            consumer.commit_sync()
+            consumer.consumer.close()
+
+        for (topic, error), count in counts.most_common():
+            self.stdout.write(f"{count}\t{topic}\t{error}")
+        action = "Found" if dry_run else "Re-drove"
+        self.stdout.write(f"{action} {counts.total()} dead-lettered events.")
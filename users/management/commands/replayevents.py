@@ -0,0 +1,181 @@
+import logging
+import time
+from itertools import batched
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from users.events import USER_EVENTS
+from users.events import UserEventFold
+from users.events import get_user_event_topics
+from users.serializers.user import UserSnapshotSerializer
+from users.snapshots import SNAPSHOT_TYPE
+from utils.bus import read_event_log
+from utils.kafka import interleave
+from utils.kafka import read_topics
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Rebuilds users from the event log, optionally from user snapshots"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            type=parse_datetime,
+            help="Replay events produced since this ISO datetime, not from the start",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Number of users loaded in one statement",
+        )
+        parser.add_argument(
+            "--shadow",
+            action="store_true",
+            help="COPY users into a shadow table and merge it in one transaction",
+        )
+        parser.add_argument(
+            "--shadow-table",
+            default="users_user_replay",
+            help="Name of the shadow table",
+        )
+        parser.add_argument(
+            "--log",
+            help="Read events from a file written by the file event store",
+        )
+        parser.add_argument(
+            "--from-snapshots",
+            action="store_true",
+            help="Load user snapshots first, then replay events since --since",
+        )
+
+    def report(self, action, count, start):
+        rate = count / max(time.monotonic() - start, 1e-6)
+        self.stdout.write(f"{action} {count} ({rate:.0f}/s)")
+
+    def load_snapshots(self, batch_size):
+        start = time.monotonic()
+        snapshots = {}
+        for message in read_topics(
+            settings.KAFKA_URL,
+            [settings.USER_SNAPSHOTS_TOPIC],
+            event_types={SNAPSHOT_TYPE},
+        ):
+            snapshots[message.key.decode("utf-8")] = message.value
+        self.report("Read snapshots", len(snapshots), start)
+        start = time.monotonic()
+        loaded = 0
+        users = [body for body in snapshots.values() if body is not None]
+        # Snapshots have no password, so it is kept for existing users and
+        # unusable for new ones.
+        fields = sorted(set(UserSnapshotSerializer().fields) - {"id"})
+        for batch in batched(users, batch_size):
+            User.objects.load_users(
+                [{"password": make_password(None), **body} for body in batch],
+                batch_size,
+                update_fields=fields,
+            )
+            loaded += len(batch)
+            self.report("Loaded snapshots", loaded, start)
+        deleted = [pk for pk, body in snapshots.items() if body is None]
+        User.objects.filter(pk__in=deleted).delete()
+        self.report("Deleted users", len(deleted), start)
+
+    def read_events(self, since, log):
+        topics = get_user_event_topics()
+        # Events of a user are only ordered within a partition, while a log
+        # file has all of them in the order they were produced.
+        if log:
+            values = read_event_log(log)
+            if since is not None:
+                since = since.timestamp()
+                values = (v for v in values if v["timestamp"] >= since)
+        else:
+            values = read_topics(
+                settings.KAFKA_URL,
+                topics,
+                since=since,
+                event_types={event.name for event in USER_EVENTS},
+            )
+        messages = []
+        start = time.monotonic()
+        for value in values:
+            messages.append(value)
+            if len(messages) % 100000 == 0:
+                self.report("Read events", len(messages), start)
+        self.report("Read events", len(messages), start)
+        if not log:
+            messages = [
+                message.value
+                for message in interleave(
+                    messages, key=lambda message: message.value["timestamp"]
+                )
+            ]
+        fold = UserEventFold()
+        for message in messages:
+            fold.add(message)
+        return fold
+
+    def load(self, created, batch_size):
+        start = time.monotonic()
+        loaded = 0
+        for batch in batched(created.values(), batch_size):
+            User.objects.load_users(batch, batch_size)
+            loaded += len(batch)
+            self.report("Loaded users", loaded, start)
+
+    def load_shadow(self, created, batch_size, table):
+        start = time.monotonic()
+        User.objects.create_shadow_table(table)
+        copied = 0
+        for batch in batched(created.values(), batch_size):
+            User.objects.copy_users(table, batch)
+            copied += len(batch)
+            self.report("Copied users", copied, start)
+        with transaction.atomic():
+            merged = User.objects.merge_shadow_table(table)
+        self.report("Merged users", merged, start)
+
+    def handle(  # noqa: PLR0913
+        self,
+        *args,
+        since,
+        batch_size,
+        shadow,
+        shadow_table,
+        from_snapshots,
+        log,
+        **options,
+    ):
+        if from_snapshots:
+            if shadow:
+                msg = "--from-snapshots and --shadow can not be used together."
+                raise CommandError(msg)
+            if not settings.USER_SNAPSHOTS_TOPIC:
+                msg = "Set USER_SNAPSHOTS_TOPIC to load user snapshots."
+                raise CommandError(msg)
+            self.load_snapshots(batch_size)
+        fold = self.read_events(since, log)
+        # Users created in the replayed range are loaded in full.
+        created = {}
+        for pk, body in fold.created.items():
+            created[pk] = {**body, **fold.updated.pop(pk, {})}
+        if shadow:
+            self.load_shadow(created, batch_size, shadow_table)
+        else:
+            self.load(created, batch_size)
+        # Users created before it only get their changes.
+        start = time.monotonic()
+        User.objects.apply_batch({}, fold.updated, fold.deleted, batch_size)
+        self.report("Updated users", len(fold.updated), start)
+        self.report("Deleted users", len(fold.deleted), start)
+        self.stdout.write(self.style.SUCCESS(f"Replayed events of {len(fold)} users"))
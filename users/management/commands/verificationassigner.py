@@ -1,35 +1,71 @@
 import logging
-from time import sleep
+import threading
+import time
 
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import close_old_connections
 
-from users.events import VerificationAssigned
-from users.models.verification import VerificationRequest
-from users.serializers.verification import AdminVerificationRequestSerializer
-from users.services import kafka_event_store
+from users.assignment import CALLBACKS
+from users.assignment import assign_unassigned
+from users.assignment import handle_message
+from users.events import VerificationCreated
+from users.events import VerificationInspected
+from users.events import get_user_event_topics
+from utils.kafka import create_consumer
 
 logger = logging.getLogger(__name__)
 
 
 class Command(BaseCommand):
-    help = "Assigns verification requests to accountable admins"
+    help = "Assigns verification requests to accountable admins as they are created"
 
     def add_arguments(self, parser):
-        parser.add_argument("period", type=int)
+        parser.add_argument(
+            "period",
+            type=int,
+            nargs="?",
+            default=settings.VERIFICATION_SWEEP_PERIOD,
+            help="Seconds between sweeps for requests whose events were missed",
+        )
+
+    def on_message(self, message):
+        handle_message(message.value)
+
+    def sweep(self):
+        assigned = assign_unassigned()
+        if assigned:
+            msg = f"Swept {assigned} unassigned verification requests"
+            logger.warning(msg)
+
+    def run_sweeper(self, period):
+        while True:
+            time.sleep(period)
+            close_old_connections()
+            try:
+                self.sweep()
+            except Exception as e:
+                msg = f"Failed to sweep verification requests: {e}"
+                logger.exception(msg)
 
     def handle(self, *args, period, **options):
-        msg = f"Starting to assign verification requests every {period} seconds..."
+        # Requests are claimed with row locks, so messages, sweeps and other
+        # replicas of this command never assign one twice.
+        self.sweep()
+        threading.Thread(
+            target=self.run_sweeper, args=(period,), name="sweeper", daemon=True
+        ).start()
+        msg = f"Assigning verification requests, sweeping every {period} seconds..."
         logger.info(msg)
-        while True:
-            unassigned = VerificationRequest.objects.filter(
-                status=VerificationRequest.SENT, accountable=None
-            )
-            for item in unassigned:
-                accountable = item.assign()
-                if accountable:
-                    item.refresh_from_db()
-                    serializer = AdminVerificationRequestSerializer(item)
-                    event = VerificationAssigned(serializer.data)
-                    kafka_event_store.add_event(event)
-
-            sleep(period)
+        consumer = create_consumer(
+            settings.KAFKA_URL,
+            "verificationassigner",
+            {
+                VerificationCreated.get_topic(),
+                VerificationInspected.get_topic(),
+                *get_user_event_topics(),
+            },
+            retry_delays=settings.KAFKA_RETRY_DELAYS,
+            event_types=set(CALLBACKS),
+        )
+        consumer.start_consuming(on_message=self.on_message)
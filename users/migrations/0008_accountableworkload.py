@@ -0,0 +1,43 @@
+# Generated by Django 5.0.7 on 2026-10-18 11:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def count_workloads(apps, schema_editor):
+    AccountableWorkload = apps.get_model("users", "AccountableWorkload")
+    VerificationRequest = apps.get_model("users", "VerificationRequest")
+    counts = (
+        VerificationRequest.objects.filter(status=1)
+        .exclude(accountable=None)
+        .values("accountable")
+        .annotate(count=models.Count("pk"))
+        .values_list("accountable", "count")
+    )
+    AccountableWorkload.objects.bulk_create(
+        AccountableWorkload(accountable_id=pk, assigned_count=count)
+        for pk, count in counts
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_user_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountableWorkload',
+            fields=[
+                ('accountable', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='workload', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Accountable')),
+                ('assigned_count', models.PositiveIntegerField(db_index=True, default=0, verbose_name='Assigned requests')),
+            ],
+            options={
+                'verbose_name': 'Accountable Workload',
+                'verbose_name_plural': 'Accountable Workloads',
+            },
+        ),
+        migrations.RunPython(count_workloads, migrations.RunPython.noop),
+    ]
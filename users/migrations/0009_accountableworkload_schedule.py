@@ -0,0 +1,35 @@
+# Generated by Django 5.0.7 on 2026-10-18 11:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('users', '0008_accountableworkload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accountableworkload',
+            name='capacity',
+            field=models.PositiveIntegerField(blank=True, help_text='Most sent requests assigned at once, except overdue ones. Empty for no limit.', null=True, verbose_name='Capacity'),
+        ),
+        migrations.AddField(
+            model_name='accountableworkload',
+            name='content_type',
+            field=models.ForeignKey(blank=True, help_text='Requests of this type are assigned to this accountable first', limit_choices_to={'app_label': 'users', 'model__in': ['user', 'company']}, null=True, on_delete=django.db.models.deletion.SET_NULL, to='contenttypes.contenttype', verbose_name='Preferred requests'),
+        ),
+        migrations.AddField(
+            model_name='accountableworkload',
+            name='works_from',
+            field=models.TimeField(blank=True, help_text='Requests are only assigned during working hours', null=True, verbose_name='Works from'),
+        ),
+        migrations.AddField(
+            model_name='accountableworkload',
+            name='works_until',
+            field=models.TimeField(blank=True, null=True, verbose_name='Works until'),
+        ),
+    ]
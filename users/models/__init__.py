@@ -1,2 +1,5 @@
 # ruff : noqa: F401
 from .base import User
+from .ledger import AppliedEvent
+from .outbox import OutboxEvent
+from .workload import AccountableWorkload
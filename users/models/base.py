@@ -1,10 +1,18 @@
+from collections import defaultdict
+
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.models import UserManager as DjangoUserManager
 from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connection
 from django.db import models
-from django.db.models import Count
+from django.db.models import BooleanField
+from django.db.models import Case
+from django.db.models import ExpressionWrapper
+from django.db.models import F
 from django.db.models import Q
+from django.db.models import When
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
 from django.utils import timezone
@@ -62,8 +70,153 @@ class UserManager(DjangoUserManager):
         return self._create_user(email, password, **extra_fields)
 
     def update_user(self, **kwargs):
+        """
+        Update only the fields carried by a `UserUpdated` event, and count it
+        in the version of the user. Redeliveries are left out by event id.
+        """
         pk = kwargs.pop("id")
-        return self.filter(pk=pk).update(**kwargs)
+        fields = self._get_model_fields(kwargs)
+        # Events published before the consumer counted versions carry one.
+        fields.pop("version", None)
+        return self.filter(pk=pk).update(
+            **fields, version=F("version") + 1, updated_at=timezone.now()
+        )
+
+    def _get_model_fields(self, body):
+        """
+        Map an event body to model attributes, skipping non-concrete fields.
+        """
+        fields = {}
+        for name, value in body.items():
+            try:
+                field = self.model._meta.get_field(name)  # noqa: SLF001
+            except FieldDoesNotExist:
+                continue
+            if field.concrete:
+                fields[field.attname] = value
+        return fields
+
+    def apply_batch(  # noqa: PLR0913
+        self, created, updated, deleted, batch_size=1000, update_counts=None
+    ):
+        """
+        Apply the final state of a batch of user events in bulk. `created` and
+        `updated` map user ids to event bodies; `deleted` is a set of user ids.
+        Updates of new users are folded into their creation, while creates of
+        already existing users are ignored. The version of a user grows by
+        the number of updates folded in `updated`, from `update_counts`, or by
+        one.
+        """
+        update_counts = update_counts or {}
+        existing = {
+            str(pk) for pk in self.filter(pk__in=created).values_list("pk", flat=True)
+        }
+        for pk, body in list(created.items()):
+            if pk in existing:
+                del created[pk]
+            elif pk in updated:
+                created[pk] = {
+                    **body,
+                    **updated.pop(pk),
+                    "version": body.get("version", 0) + update_counts.get(pk, 1),
+                }
+
+        self.bulk_create(
+            [self.model(**self._get_model_fields(body)) for body in created.values()],
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+
+        # Users whose events changed the same fields are updated together.
+        groups = defaultdict(list)
+        now = timezone.now()
+        for pk, body in updated.items():
+            fields = self._get_model_fields({**body, "id": pk})
+            fields["updated_at"] = now
+            fields["version"] = F("version") + update_counts.get(pk, 1)
+            groups[frozenset(fields) - {"id"}].append(self.model(**fields))
+        for fields, objs in groups.items():
+            self.bulk_update(objs, fields, batch_size=batch_size)
+
+        if deleted:
+            self.filter(pk__in=deleted).delete()
+
+    def load_users(self, bodies, batch_size=5000, update_fields=None):
+        """
+        Insert users from event bodies, overwriting existing users with the same
+        id. Only `update_fields` are overwritten, if given.
+        """
+        if update_fields is None:
+            update_fields = [
+                f.name
+                for f in self.model._meta.concrete_fields  # noqa: SLF001
+                if not f.primary_key
+            ]
+        return self.bulk_create(
+            [self.model(**self._get_model_fields(body)) for body in bodies],
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=["id"],
+            update_fields=update_fields,
+        )
+
+    def copy_users(self, table, bodies):
+        """
+        Copy users from full event bodies into `table`, a table like the users
+        table, with COPY.
+        """
+        fields = self.model._meta.concrete_fields  # noqa: SLF001
+        columns = ", ".join(connection.ops.quote_name(f.column) for f in fields)
+        sql = f"COPY {connection.ops.quote_name(table)} ({columns}) FROM STDIN"
+        with connection.cursor() as cursor, cursor.copy(sql) as copy:
+            for body in bodies:
+                obj = self.model(**self._get_model_fields(body))
+                copy.write_row(
+                    [
+                        f.get_db_prep_save(f.pre_save(obj, add=True), connection)
+                        for f in fields
+                    ]
+                )
+
+    def create_shadow_table(self, table):
+        """
+        Create an empty, unlogged table like the users table, to load users
+        into with `copy_users` before merging them with `merge_shadow_table`.
+        """
+        table = connection.ops.quote_name(table)
+        db_table = connection.ops.quote_name(self.model._meta.db_table)  # noqa: SLF001
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            cursor.execute(
+                f"CREATE UNLOGGED TABLE {table} (LIKE {db_table} INCLUDING DEFAULTS)"
+            )
+
+    def merge_shadow_table(self, table):
+        """
+        Insert or overwrite the users of a shadow table in one statement, then
+        drop it. Returns the number of merged users.
+
+        The shadow table is not renamed over the users table, since the foreign
+        keys of other tables would still point at the old one.
+        """
+        fields = self.model._meta.concrete_fields  # noqa: SLF001
+        columns = [connection.ops.quote_name(f.column) for f in fields]
+        updates = [
+            f"{c} = EXCLUDED.{c}"
+            for c, f in zip(columns, fields, strict=True)
+            if not f.primary_key
+        ]
+        table = connection.ops.quote_name(table)
+        db_table = connection.ops.quote_name(self.model._meta.db_table)  # noqa: SLF001
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {db_table} ({', '.join(columns)}) "  # noqa: S608
+                f"SELECT {', '.join(columns)} FROM {table} "
+                f"ON CONFLICT (id) DO UPDATE SET {', '.join(updates)}"
+            )
+            merged = cursor.rowcount
+            cursor.execute(f"DROP TABLE {table}")
+        return merged
 
     def get_by_natural_key(self, username):
         # We override this method to make it possible to get user by secondary field
@@ -85,20 +238,44 @@ class UserManager(DjangoUserManager):
             qs = qs.exclude(**exclude_kwargs)
         return qs
 
-    def get_least_assigned_accountable(self, exclude_kwargs=None):
-        from users.models.verification import VerificationRequest
-
-        qs = self.get_assignable_admins(exclude_kwargs=exclude_kwargs)
-        return (
-            qs.annotate(
-                assigned_verification_count=Count(
-                    "assigned_verifications",
-                    filter=Q(assigned_verifications__status=VerificationRequest.SENT),
+    def get_least_assigned_accountable(
+        self, exclude_kwargs=None, content_type_id=None, *, overdue=False, now=None
+    ):
+        """
+        Pick the accountable of a single request in one query, as `Scheduler`
+        does for many: accountables out of their working hours are left out,
+        and those at capacity too unless the request is `overdue`. Accountables
+        with room preferring `content_type_id` come first, then the least
+        assigned one.
+        """
+        from users.models.workload import get_available_filter
+
+        has_room = Q(workload__capacity=None) | Q(
+            workload__assigned_count__lt=F("workload__capacity")
+        )
+        qs = self.get_assignable_admins(exclude_kwargs=exclude_kwargs).filter(
+            get_available_filter(timezone.localtime(now).time(), "workload__")
+        )
+        if not overdue:
+            qs = qs.filter(has_room)
+        qs = qs.alias(has_room=ExpressionWrapper(has_room, output_field=BooleanField()))
+        ordering = [
+            F("has_room").desc(),
+            # Admins without a workload have not been assigned any request.
+            F("workload__assigned_count").asc(nulls_first=True),
+            "pk",
+        ]
+        if content_type_id:
+            qs = qs.alias(
+                preferred=Case(
+                    When(
+                        has_room & Q(workload__content_type=content_type_id), then=True
+                    ),
+                    default=False,
                 )
             )
-            .order_by("assigned_verification_count")
-            .first()
-        )
+            ordering.insert(0, F("preferred").desc())
+        return qs.order_by(*ordering).first()
 
 
 def avatar_upload_to(instance, filename):
@@ -181,6 +358,14 @@ class User(AbstractUser):
     )
     access_list = models.JSONField(default=list, encoder=MessageEncoder)
     roles = models.JSONField(default=list, encoder=MessageEncoder)
+    # Number of `UserUpdated` events applied by the consumer
+    version = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name=_("Version")
+    )
+    # Lets reconciliation only look at recently changed users
+    updated_at = models.DateTimeField(
+        auto_now=True, db_index=True, verbose_name=_("Updated At")
+    )
 
     USERNAME_FIELD = "email"
     # Make it possible to get user by username if fails by email.
@@ -201,7 +386,7 @@ class User(AbstractUser):
 
     def reset_password(self, new_password):
         self.set_password(new_password)
-        self.save(update_fields=["password"])
+        self.save(update_fields=["password", "updated_at"])
 
     def change_password(self, current_password, new_password):
         if not self.check_password(current_password):
@@ -210,17 +395,17 @@ class User(AbstractUser):
 
     def change_username(self, new_username):
         self.username = new_username
-        self.save(update_fields=["username"])
+        self.save(update_fields=["username", "updated_at"])
 
     def update_avatar(self, new_avatar):
         self.avatar = new_avatar
         self.avatar_updated_at = timezone.now()
-        self.save(update_fields=["avatar", "avatar_updated_at"])
+        self.save(update_fields=["avatar", "avatar_updated_at", "updated_at"])
 
     def delete_avatar(self):
         self.avatar.delete()
         self.avatar_updated_at = timezone.now()
-        self.save(update_fields=["avatar", "avatar_updated_at"])
+        self.save(update_fields=["avatar", "avatar_updated_at", "updated_at"])
 
     def update_or_create_company(self, **kwargs):
         from .company import Company
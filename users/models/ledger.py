@@ -0,0 +1,35 @@
+from django.db import models
+
+
+class AppliedEventManager(models.Manager):
+    def get_applied(self, event_ids):
+        """
+        Return which of `event_ids` are already applied, in one query.
+        """
+        return {
+            str(pk) for pk in self.filter(pk__in=event_ids).values_list("pk", flat=True)
+        }
+
+    def record(self, event_ids):
+        self.bulk_create(
+            [self.model(pk=event_id) for event_id in event_ids],
+            ignore_conflicts=True,
+        )
+
+    def prune(self, before):
+        return self.filter(applied_at__lt=before).delete()
+
+
+class AppliedEvent(models.Model):
+    """
+    Id of an event applied by the consumer, recorded in the same transaction as
+    its changes, so that redelivered events are skipped.
+    """
+
+    id = models.UUIDField(primary_key=True)
+    applied_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    objects = AppliedEventManager()
+
+    def __str__(self):
+        return str(self.pk)
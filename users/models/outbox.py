@@ -0,0 +1,84 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.db import models
+from django.db import transaction
+from django.db.models.functions import Now
+
+from utils.json import MessageEncoder
+from utils.kafka import get_message_headers
+
+
+class OutboxEventManager(models.Manager):
+    def claim_batch(self, batch_size, lag, lease):
+        """
+        Mark the oldest `batch_size` events as being published and return them,
+        unless another relay is still publishing its own. Events of the last
+        `lag` seconds are left for later, as transactions that started earlier
+        may still commit events before them. Claims older than `lease` seconds
+        are of a relay that failed, and their events are claimed again.
+        """
+        db_table = self.model._meta.db_table  # noqa: SLF001
+        with transaction.atomic():
+            # Claims are made one at a time, so that relays publish in order.
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [db_table])
+            if self.filter(claimed_at__gt=Now() - timedelta(seconds=lease)).exists():
+                return []
+            batch = list(
+                self.filter(created_at__lte=Now() - timedelta(seconds=lag)).order_by(
+                    "pk"
+                )[:batch_size]
+            )
+            self.filter(pk__in=[event.pk for event in batch]).update(claimed_at=Now())
+        return batch
+
+    def publish_batch(  # noqa: PLR0913
+        self, producer, batch_size=500, timeout=30, lag=1, lease=120
+    ):
+        """
+        Publish a batch of events claimed by `claim_batch` in order, and delete
+        them once the broker has acknowledged all of them. Returns the number
+        of published events. If any send fails, the claim is released and the
+        whole batch is published again on the next call.
+        """
+        batch = self.claim_batch(batch_size, lag, lease)
+        pks = [event.pk for event in batch]
+        try:
+            futures = [
+                producer.send(
+                    event.topic,
+                    event.message,
+                    message_key=event.key,
+                    headers=get_message_headers(event.message),
+                )
+                for event in batch
+            ]
+            producer.flush(timeout=timeout)
+            for future in futures:
+                future.get(timeout=timeout)
+        except Exception:
+            self.filter(pk__in=pks).update(claimed_at=None)
+            raise
+        self.filter(pk__in=pks).delete()
+        return len(batch)
+
+
+class OutboxEvent(models.Model):
+    """
+    An event waiting to be published to Kafka. It is written in the same
+    transaction as the change it describes and published by `outboxrelay`.
+    """
+
+    topic = models.CharField(max_length=255)
+    key = models.CharField(max_length=255, blank=True)
+    message = models.JSONField(encoder=MessageEncoder)
+    # Start of the writing transaction, by the database clock
+    created_at = models.DateTimeField(db_default=Now())
+    # When a relay started publishing the event
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    objects = OutboxEventManager()
+
+    def __str__(self):
+        return f"{self.topic}: {self.key}"
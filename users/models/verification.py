@@ -1,12 +1,21 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
+from django.db import connection
 from django.db import models
+from django.db import transaction
 from django.db.models import Q
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from users.models.workload import AccountableWorkload
+from users.scheduling import Scheduler
 from utils.models import BaseModel
 
 User = get_user_model()
@@ -53,6 +62,96 @@ class VerificationRequestManager(models.Manager):
             request = self.create_request_for_company(content_object, **kwargs)
         return request
 
+    def claim_unassigned(self, limit, pks=None):
+        """
+        Lock up to `limit` of the oldest sent and unassigned requests, or of
+        `pks`, skipping those locked by another transaction, which must be the
+        one of the caller. Returns their primary keys.
+        """
+        qs = self.select_for_update(skip_locked=True).filter(
+            status=self.model.SENT, accountable=None
+        )
+        if pks is not None:
+            qs = qs.filter(pk__in=pks)
+        return list(qs.order_by("created_at").values_list("pk", flat=True)[:limit])
+
+    def distribute(self, pks, exclude_kwargs=None, now=None):
+        """
+        Pick the accountables of requests with a `Scheduler`, oldest request
+        first, as `VerificationRequest.assign` does one at a time. Returns the
+        accountable primary key per request primary key, for the requests
+        someone can take now.
+
+        Only the workloads of the picked accountables are locked, until the
+        end of the transaction, which must be the one applying the
+        assignments. Their loads are checked again then, as other assigners
+        may have added to them, and requests that no longer fit are left for
+        the next round.
+        """
+        now = now or timezone.now()
+        overdue = now - timedelta(hours=settings.VERIFICATION_SLA_HOURS)
+        admins = User.objects.get_assignable_admins(exclude_kwargs=exclude_kwargs)
+        scheduler = Scheduler(
+            AccountableWorkload.objects.get_workloads(
+                admins.values_list("pk", flat=True)
+            ),
+            overdue=overdue,
+            now=now,
+        )
+        picks = []
+        for pk, content_type, created_at in (
+            self.filter(pk__in=pks)
+            .order_by("created_at")
+            .values_list("pk", "content_type", "created_at")
+        ):
+            accountable = scheduler.pick(content_type, created_at)
+            if accountable is not None:
+                picks.append((pk, accountable, created_at))
+
+        workloads = {
+            workload.pk: workload
+            for workload in AccountableWorkload.objects.lock_workloads(
+                {accountable for _, accountable, _ in picks}
+            )
+        }
+        loads = {pk: workload.assigned_count for pk, workload in workloads.items()}
+        assignments = {}
+        for pk, accountable, created_at in picks:
+            if created_at >= overdue and workloads[accountable].is_full(
+                loads[accountable]
+            ):
+                continue
+            loads[accountable] += 1
+            assignments[pk] = accountable
+        return assignments
+
+    def assign_many(self, assignments):
+        """
+        Apply `distribute` assignments in one UPDATE, to the requests still sent
+        and unassigned. Returns the primary keys of the assigned requests.
+        """
+        if not assignments:
+            return []
+        db_table = connection.ops.quote_name(self.model._meta.db_table)  # noqa: SLF001
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {db_table} AS r"  # noqa: S608
+                " SET accountable_id = a.accountable_id, updated_at = now()"
+                " FROM unnest(%s::bigint[], %s::uuid[]) AS a (id, accountable_id)"
+                " WHERE r.id = a.id AND r.status = %s AND r.accountable_id IS NULL"
+                " RETURNING r.id",
+                [
+                    list(assignments),
+                    list(assignments.values()),
+                    self.model.SENT,
+                ],
+            )
+            assigned = [row[0] for row in cursor.fetchall()]
+            AccountableWorkload.objects.adjust(
+                Counter(assignments[pk] for pk in assigned)
+            )
+        return assigned
+
 
 class VerificationRequest(BaseModel):
     # "user" or "company"
@@ -127,11 +226,16 @@ class VerificationRequest(BaseModel):
     def __str__(self):
         return str(self.content_object)
 
-    def assign(self, accountable=None):
-        if not accountable:
-            exclude_kwargs = {"pk": self.accountable.pk} if self.accountable else {}
-            accountable = User.objects.get_least_assigned_accountable(exclude_kwargs)
+    def is_overdue(self, now=None):
+        now = now or timezone.now()
+        return self.created_at < now - timedelta(hours=settings.VERIFICATION_SLA_HOURS)
 
+    def assign(self, accountable=None):
+        """
+        Assign the request to `accountable`, or to the one picked as
+        `Scheduler` would. Returns the accountable, or `None` if the request is
+        left as it is.
+        """
         if accountable:
             if accountable == self.accountable:
                 return None
@@ -141,11 +245,37 @@ class VerificationRequest(BaseModel):
                 or not accountable.is_staff
             ):
                 return None
-            qs = VerificationRequest.objects.filter(pk=self.pk).exclude(
-                status__in=[self.REJECTED, self.VERIFIED],
-            )
-            updated = qs.update(accountable=accountable)
-
-            if updated:
-                return accountable
-        return None
+        qs = VerificationRequest.objects.filter(pk=self.pk).exclude(
+            status__in=[self.REJECTED, self.VERIFIED],
+        )
+        with transaction.atomic():
+            # The row is locked, so the workloads move with what it was
+            # assigned to when it is updated.
+            previous = qs.select_for_update().values("status", "accountable").first()
+            if previous is None:
+                return None
+            counted = previous["status"] == self.SENT
+            if not accountable:
+                exclude_kwargs = (
+                    {"pk": previous["accountable"]} if previous["accountable"] else {}
+                )
+                overdue = self.is_overdue()
+                accountable = User.objects.get_least_assigned_accountable(
+                    exclude_kwargs, self.content_type_id, overdue=overdue
+                )
+                # The pick is checked again once the workload is locked, as
+                # another assigner may have filled their capacity meanwhile.
+                if accountable is None or (
+                    counted
+                    and not AccountableWorkload.objects.adjust(
+                        {previous["accountable"]: -1, accountable.pk: 1},
+                        within_capacity=not overdue,
+                    )
+                ):
+                    return None
+            elif counted and previous["accountable"] != accountable.pk:
+                AccountableWorkload.objects.adjust(
+                    {previous["accountable"]: -1, accountable.pk: 1}
+                )
+            qs.update(accountable=accountable)
+        return accountable
@@ -0,0 +1,203 @@
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db import models
+from django.db import transaction
+from django.db.models import Case
+from django.db.models import Count
+from django.db.models import F
+from django.db.models import Q
+from django.db.models import Value
+from django.db.models import When
+from django.db.models.functions import Greatest
+from django.utils.translation import gettext_lazy as _
+
+User = get_user_model()
+
+
+def get_available_filter(time, prefix=""):
+    """
+    Filter of the workloads, under `prefix`, available at `time` as
+    `AccountableWorkload.is_available` tells. Accountables without a workload
+    are available.
+    """
+
+    def q(lookup, value):
+        return Q(**{f"{prefix}{lookup}": value})
+
+    works_until = F(f"{prefix}works_until")
+    return (
+        q("works_from", None)
+        | q("works_until", None)
+        | (
+            q("works_from__lte", works_until)
+            & q("works_from__lte", time)
+            & q("works_until__gt", time)
+        )
+        | (
+            q("works_from__gt", works_until)
+            & (q("works_from__lte", time) | q("works_until__gt", time))
+        )
+    )
+
+
+class AccountableWorkloadManager(models.Manager):
+    def adjust(self, deltas, *, within_capacity=False):
+        """
+        Add `deltas` to the sent requests assigned to each accountable, by
+        primary key, in one UPDATE so that concurrent changes add up. Unassigned
+        requests, under `None`, are ignored. With `within_capacity`, nothing is
+        added and `False` is returned if an accountable would exceed their
+        capacity.
+        """
+        deltas = {pk: delta for pk, delta in deltas.items() if delta and pk is not None}
+        if not deltas:
+            return True
+        workloads = self.lock_workloads(deltas)
+        if within_capacity and any(
+            deltas[w.pk] > 0 and w.is_full(w.assigned_count + deltas[w.pk] - 1)
+            for w in workloads
+        ):
+            return False
+        # Counters that drifted below are left at zero until `recount`.
+        self.filter(pk__in=deltas).update(
+            assigned_count=Greatest(
+                F("assigned_count")
+                + Case(
+                    *(When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()),
+                    default=Value(0),
+                ),
+                Value(0),
+            )
+        )
+        return True
+
+    def get_workloads(self, pks):
+        """
+        Workloads of the accountables of `pks`, unsaved for those without one.
+        """
+        pks = list(pks)
+        workloads = self.in_bulk(pks)
+        return [workloads.get(pk) or self.model(accountable_id=pk) for pk in pks]
+
+    def lock_workloads(self, pks):
+        """
+        Workloads of the accountables of `pks`, created for those without one,
+        and locked until the end of the transaction. Rows are locked in order,
+        so that concurrent assigners wait for each other instead of
+        deadlocking.
+        """
+        pks = sorted(pks)
+        self.bulk_create(
+            [self.model(accountable_id=pk) for pk in pks], ignore_conflicts=True
+        )
+        return list(self.select_for_update().filter(pk__in=pks).order_by("pk"))
+
+    def recount(self):
+        """
+        Count the sent requests assigned to each accountable again and correct
+        the counters that drifted. Returns the corrected counters by primary
+        key.
+        """
+        from users.models.verification import VerificationRequest
+
+        with transaction.atomic():
+            # Rows are locked first, so that assignments committed while
+            # counting are added to the new counts rather than lost.
+            current = dict(
+                self.select_for_update()
+                .order_by("pk")
+                .values_list("pk", "assigned_count")
+            )
+            counts = dict.fromkeys(
+                User.objects.get_assignable_admins().values_list("pk", flat=True), 0
+            )
+            counts.update(
+                VerificationRequest.objects.filter(status=VerificationRequest.SENT)
+                .exclude(accountable=None)
+                .values("accountable")
+                .annotate(count=Count("pk"))
+                .values_list("accountable", "count")
+            )
+            # Counters of former accountables are kept, at zero.
+            counts.update({pk: 0 for pk in current.keys() - counts.keys()})
+            drifted = {
+                pk: count for pk, count in counts.items() if current.get(pk) != count
+            }
+            self.bulk_create(
+                [
+                    self.model(accountable_id=pk, assigned_count=count)
+                    for pk, count in drifted.items()
+                ],
+                update_conflicts=True,
+                unique_fields=["accountable"],
+                update_fields=["assigned_count"],
+            )
+        return {
+            pk: count for pk, count in drifted.items() if current.get(pk, 0) != count
+        }
+
+
+class AccountableWorkload(models.Model):
+    """
+    Number of sent verification requests assigned to an accountable, kept up
+    to date as requests are assigned and inspected, so that the least assigned
+    one is found without counting their requests.
+    """
+
+    accountable = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="workload",
+        verbose_name=_("Accountable"),
+    )
+    assigned_count = models.PositiveIntegerField(
+        default=0, db_index=True, verbose_name=_("Assigned requests")
+    )
+    capacity = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text=_(
+            "Most sent requests assigned at once, except overdue ones."
+            " Empty for no limit."
+        ),
+        verbose_name=_("Capacity"),
+    )
+    works_from = models.TimeField(
+        null=True,
+        blank=True,
+        help_text=_("Requests are only assigned during working hours"),
+        verbose_name=_("Works from"),
+    )
+    works_until = models.TimeField(null=True, blank=True, verbose_name=_("Works until"))
+    content_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        limit_choices_to={"app_label": "users", "model__in": ["user", "company"]},
+        help_text=_("Requests of this type are assigned to this accountable first"),
+        verbose_name=_("Preferred requests"),
+    )
+
+    objects = AccountableWorkloadManager()
+
+    class Meta:
+        verbose_name = _("Accountable Workload")
+        verbose_name_plural = _("Accountable Workloads")
+
+    def __str__(self):
+        return f"{self.accountable}: {self.assigned_count}"
+
+    def is_available(self, time):
+        """
+        Whether `time` is within the working hours, which may span midnight.
+        """
+        if self.works_from is None or self.works_until is None:
+            return True
+        if self.works_from <= self.works_until:
+            return self.works_from <= time < self.works_until
+        return time >= self.works_from or time < self.works_until
+
+    def is_full(self, load):
+        return self.capacity is not None and load >= self.capacity
@@ -0,0 +1,23 @@
+from utils.kafka import get_event_message
+
+from .models.outbox import OutboxEvent
+
+
+class OutboxEventStore:
+    """
+    Stores events in the outbox table, in the current database transaction.
+    They are published to Kafka later by the `outboxrelay` command.
+    """
+
+    def add_event(self, event):
+        return OutboxEvent.objects.create(
+            topic=event.topic, key=event.key, message=get_event_message(event)
+        )
+
+    def add_events(self, events):
+        return OutboxEvent.objects.bulk_create(
+            OutboxEvent(
+                topic=event.topic, key=event.key, message=get_event_message(event)
+            )
+            for event in events
+        )
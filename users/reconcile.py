@@ -0,0 +1,200 @@
+import time
+import zlib
+from itertools import batched
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from users.events import USER_EVENTS
+from users.events import UserEventFold
+from users.events import get_user_event_topics
+from users.serializers.user import ReadOnlyUserSerializer
+from users.serializers.user import UserSnapshotSerializer
+from users.snapshots import CONTENT_HASH_HEADER
+from users.snapshots import get_content_hash
+from users.snapshots import publish_snapshots
+from utils.kafka import get_header
+from utils.kafka import read_topics
+
+User = get_user_model()
+
+# Fields also written without an event, such as by `User.reset_password` or a
+# login, so events may not carry their latest value
+UNPUBLISHED_FIELDS = {
+    "password",
+    "username",
+    "avatar",
+    "avatar_updated_at",
+    "last_login",
+    "updated_at",
+    "version",
+}
+
+
+class Divergence:
+    """
+    Users whose row differs from what was published: `missing` rows, `changed`
+    rows and `extra` rows of deleted users.
+    """
+
+    def __init__(self):
+        self.missing = set()
+        self.changed = set()
+        self.extra = set()
+        # Expected state of each missing or changed user
+        self.expected = {}
+
+    def __len__(self):
+        return len(self.missing) + len(self.changed) + len(self.extra)
+
+    def __str__(self):
+        return (
+            f"{len(self.missing)} missing, {len(self.changed)} changed,"
+            f" {len(self.extra)} extra"
+        )
+
+
+def iter_users(qs, batch_size):
+    """
+    Yield chunks of users in primary key order, each with its own query.
+    """
+    last_pk = None
+    while True:
+        chunk = qs.order_by("pk")
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+        chunk = list(chunk[:batch_size])
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1].pk
+
+
+def read_user_events(since=None):
+    """
+    Stream the user events produced since a datetime, one topic after the
+    other. The events of a user are in order within a topic, and creates,
+    updates and deletes fold the same in any order. Only updates may also be
+    in both a per event topic and the single user topic that replaced it, so
+    the single topic is read last.
+    """
+    topics = sorted(
+        get_user_event_topics(), key=lambda t: (t == settings.USER_EVENTS_TOPIC, t)
+    )
+    event_types = {event.name for event in USER_EVENTS}
+    for topic in topics:
+        for message in read_topics(
+            settings.KAFKA_URL, [topic], since=since, event_types=event_types
+        ):
+            yield message.value
+
+
+def get_share(key, shares):
+    return zlib.crc32(key.encode("utf-8")) % shares
+
+
+def reconcile_events(read_messages, grace=60, batch_size=1000, passes=1):
+    """
+    Compare users with the events returned by `read_messages`, such as
+    `read_user_events`. Users with events younger than `grace` seconds are
+    skipped, as the consumer may not have applied them yet. To bound memory,
+    the events are read `passes` times, each time folding those of a share of
+    the users only.
+    """
+    cutoff = time.time() - grace
+    divergence = Divergence()
+    for share in range(passes):
+        fold = UserEventFold()
+        for message in read_messages():
+            if get_share(message["key"], passes) == share:
+                fold.add(message)
+        reconcile_fold(fold, cutoff, divergence, batch_size)
+    return divergence
+
+
+def reconcile_fold(fold, cutoff, divergence, batch_size):
+    """
+    Add the users diverging from the events folded in `fold` up to `cutoff` to
+    `divergence`. Only the fields carried by the events are compared, except
+    for `UNPUBLISHED_FIELDS`.
+    """
+    settled = {pk for pk, ts in fold.timestamps.items() if ts <= cutoff}
+    expected = {}
+    for pk in settled - fold.deleted:
+        expected[pk] = {**fold.created.get(pk, {}), **fold.updated.get(pk, {})}
+        # The version is counted by the consumer, not carried by events.
+        expected[pk].pop("version", None)
+    divergence.extra |= {
+        str(pk)
+        for pk in User.objects.filter(pk__in=settled & fold.deleted).values_list(
+            "pk", flat=True
+        )
+    }
+    found = set()
+    for pks in batched(sorted(expected), batch_size):
+        for user in User.objects.filter(pk__in=pks):
+            pk = str(user.pk)
+            found.add(pk)
+            body = {
+                name: value
+                for name, value in expected[pk].items()
+                if name not in UNPUBLISHED_FIELDS
+            }
+            data = ReadOnlyUserSerializer(user, fields=body).data
+            body = {name: value for name, value in body.items() if name in data}
+            if get_content_hash(data) != get_content_hash(body):
+                divergence.changed.add(pk)
+                divergence.expected[pk] = body
+    # Rows of users created before the events can not be restored from them.
+    for pk in (set(expected) - found) & set(fold.created):
+        divergence.missing.add(pk)
+        divergence.expected[pk] = expected[pk]
+
+
+def repair_events(divergence, batch_size=1000):
+    """
+    Apply the expected state to the users diverging from the events.
+    """
+    User.objects.apply_batch(
+        {pk: divergence.expected[pk] for pk in divergence.missing},
+        {pk: divergence.expected[pk] for pk in divergence.changed},
+        divergence.extra,
+        batch_size=batch_size,
+    )
+
+
+def reconcile_snapshots(messages, since=None, batch_size=1000):
+    """
+    Compare the content hash of users updated `since` with the latest of their
+    snapshot `messages`, which need not be decoded. Without `since`, the
+    snapshots of users that do not exist are reported too.
+    """
+    hashes = {}
+    for message in messages:
+        pk = message.key.decode("utf-8")
+        if message.value is None:
+            hashes.pop(pk, None)
+        else:
+            hashes[pk] = get_header(message, CONTENT_HASH_HEADER)
+    divergence = Divergence()
+    qs = User.objects.all()
+    if since is not None:
+        qs = qs.filter(updated_at__gte=since)
+    for chunk in iter_users(qs, batch_size):
+        for user in chunk:
+            pk = str(user.pk)
+            if pk not in hashes:
+                divergence.missing.add(pk)
+            elif hashes.pop(pk) != get_content_hash(UserSnapshotSerializer(user).data):
+                divergence.changed.add(pk)
+    if since is None:
+        divergence.extra = set(hashes)
+    return divergence
+
+
+def repair_snapshots(divergence, producer):
+    """
+    Republish the snapshots diverging from the users, or their tombstones.
+    """
+    pks = divergence.missing | divergence.changed | divergence.extra
+    return publish_snapshots(producer, pks)
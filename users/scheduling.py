@@ -0,0 +1,68 @@
+import heapq
+from collections import defaultdict
+
+from django.utils import timezone
+
+
+class Scheduler:
+    """
+    Picks the accountable of each verification request, given their
+    `AccountableWorkload`. Accountables out of their working hours are left
+    out, and those at capacity only take requests created before `overdue`.
+    Otherwise, accountables preferring the content type of a request come
+    first, then the least assigned one. Loads are kept in heaps, so that each
+    pick costs O(log n).
+    """
+
+    def __init__(self, workloads, overdue, now=None):
+        self.overdue = overdue
+        time = timezone.localtime(now).time()
+        self.workloads = {}
+        self.loads = {}
+        # Heaps of (load, pk) of the available accountables, and of those
+        # preferring each content type. Entries are updated as they reach the
+        # top, when their load is outdated.
+        self.available = []
+        self.preferred = defaultdict(list)
+        for workload in workloads:
+            if not workload.is_available(time):
+                continue
+            pk = workload.accountable_id
+            self.workloads[pk] = workload
+            self.loads[pk] = workload.assigned_count
+            self.available.append((workload.assigned_count, pk))
+            if workload.content_type_id:
+                self.preferred[workload.content_type_id].append(
+                    (workload.assigned_count, pk)
+                )
+        # Overdue requests may exceed capacity, so accountables at capacity
+        # are only dropped from a copy.
+        self.unlimited = list(self.available)
+        for heap in [self.available, self.unlimited, *self.preferred.values()]:
+            heapq.heapify(heap)
+
+    def peek(self, heap, *, capacity=True):
+        while heap:
+            load, pk = heap[0]
+            if load != self.loads[pk]:
+                heapq.heapreplace(heap, (self.loads[pk], pk))
+            elif capacity and self.workloads[pk].is_full(load):
+                # Loads only grow, so it stays at capacity.
+                heapq.heappop(heap)
+            else:
+                return pk
+        return None
+
+    def pick(self, content_type_id, created_at):
+        """
+        Pick the accountable of a request and count it in their load. Returns
+        its primary key, or `None` if no one can take it now.
+        """
+        pk = self.peek(self.preferred.get(content_type_id))
+        if pk is None:
+            pk = self.peek(self.available)
+        if pk is None and created_at < self.overdue:
+            pk = self.peek(self.unlimited, capacity=False)
+        if pk is not None:
+            self.loads[pk] += 1
+        return pk
@@ -17,6 +17,26 @@ class ReadOnlyUserSerializer(serializers.ModelSerializer):
             "user_permissions",
         )
 
+    def __init__(self, *args, fields=None, **kwargs):
+        # `fields` limits the representation to the given fields.
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class UserSnapshotSerializer(ReadOnlyUserSerializer):
+    """
+    Public projection of a user, published to the user snapshots topic.
+    """
+
+    class Meta(ReadOnlyUserSerializer.Meta):
+        exclude = (
+            *ReadOnlyUserSerializer.Meta.exclude,
+            "password",
+            "shahkar_response",
+        )
+
 
 class SearchAdminUserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -13,6 +13,7 @@ from users.exceptions import StatusError
 from users.models.company import Company
 from users.models.verification import Document
 from users.models.verification import VerificationRequest
+from users.models.workload import AccountableWorkload
 from users.serializers.me import MeSerializer
 
 User = get_user_model()
@@ -130,24 +131,31 @@ class InspectionSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         now = timezone.now()
         with transaction.atomic():
-            updated = (
-                VerificationRequest.objects.filter(pk=instance.pk)
-                .exclude(
-                    status__in=[
-                        VerificationRequest.REJECTED,
-                        VerificationRequest.VERIFIED,
-                    ]
-                )
-                .update(inspected_at=now, **validated_data)
+            qs = VerificationRequest.objects.filter(pk=instance.pk).exclude(
+                status__in=[
+                    VerificationRequest.REJECTED,
+                    VerificationRequest.VERIFIED,
+                ]
             )
+            previous = qs.select_for_update().values_list("status", flat=True).first()
+            updated = qs.update(inspected_at=now, **validated_data)
             if not updated:
                 raise ValidationError({"detail": _("Request already inspected")})
             instance.refresh_from_db()
+            was_sent = previous == VerificationRequest.SENT
+            if was_sent != (instance.status == VerificationRequest.SENT):
+                AccountableWorkload.objects.adjust(
+                    {instance.accountable_id: -1 if was_sent else 1}
+                )
             if instance.status == VerificationRequest.VERIFIED:
                 if instance.content_type.model == "user":
                     updated = User.objects.filter(
                         pk=instance.object_id, identity_verified=False
-                    ).update(identity_verified=True, identity_verified_at=now)
+                    ).update(
+                        identity_verified=True,
+                        identity_verified_at=now,
+                        updated_at=now,
+                    )
                 else:
                     updated = Company.objects.filter(
                         pk=instance.object_id, verified=False
@@ -7,13 +7,17 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
 from django.core.cache import cache
 from django.db import IntegrityError
+from django.db import transaction
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from rest_framework.exceptions import ValidationError
 
+from utils import acks
 from utils import tokens
-from utils.decorators import delay_return
+from utils.bus import FileEventStore
+from utils.bus import InMemoryEventStore
 from utils.kafka import KafkaEventStore
+from utils.spool import SPOOLED
 
 from .events import EmailVerificationRequested
 from .events import MobileVerificationRequested
@@ -23,6 +27,7 @@ from .events import UserDeleted
 from .events import UserUpdated
 from .exceptions import EmailVerificationError
 from .exceptions import MobileVerificationError
+from .outbox import OutboxEventStore
 from .serializers.user import ReadOnlyUserSerializer
 from .shahkar import ShahkarVerificationError
 from .shahkar import shahkar
@@ -30,14 +35,59 @@ from .shahkar import shahkar
 logger = logging.getLogger(__name__)
 User = get_user_model()
 bootstrap_servers = settings.KAFKA_URL
-kafka_event_store = KafkaEventStore(bootstrap_servers=bootstrap_servers)
+
+
+def create_kafka_event_store():
+    return KafkaEventStore(
+        bootstrap_servers=bootstrap_servers,
+        spool_dir=settings.EVENT_SPOOL_DIR,
+        relay_socket=settings.EVENT_RELAY_SOCKET,
+        coalesce_ms=settings.EVENT_COALESCE_MS,
+    )
+
+
+def create_memory_event_store():
+    # Events are applied by this process, as the consumer would.
+    from .handlers import handle_message
+
+    return InMemoryEventStore(
+        handle_message, background=settings.EVENT_STORE_BACKGROUND
+    )
+
+
+EVENT_STORES = {
+    "kafka": create_kafka_event_store,
+    "outbox": OutboxEventStore,
+    "memory": create_memory_event_store,
+    "file": lambda: FileEventStore(settings.EVENT_LOG_PATH),
+}
+
+
+def create_event_store(name=None):
+    """
+    Create the event store backend named by `settings.EVENT_STORE`.
+    """
+    return EVENT_STORES[name or settings.EVENT_STORE]()
+
+
+event_store = create_event_store()
 
 
 class UserService:
-    def __init__(self, event_store):
+    def __init__(self, event_store, ack_timeout=None):
         self.event_store = event_store
+        # Seconds to wait for events to be applied, EVENT_ACK_TIMEOUT if None
+        self.ack_timeout = ack_timeout
+
+    def publish(self, event):
+        """
+        Add an event and wait until it is applied. A spooled event is not
+        applied before Kafka is back, so it is reported as accepted instead.
+        """
+        if self.event_store.add_event(event) is SPOOLED:
+            raise acks.EventDeferredError
+        acks.wait_for_ack(event.id, self.ack_timeout)
 
-    @delay_return()
     def create(self, **kwargs):
         email = kwargs.pop("email")
         if User.objects.filter(email=email).exists():
@@ -49,13 +99,14 @@ class UserService:
         instance = User(pk=pk, email=email, password=password, **kwargs)
         serializer = ReadOnlyUserSerializer(instance)
         event = UserCreated(serializer.data)
-        self.event_store.add_event(event)
+        self.publish(event)
         return instance
 
     @staticmethod
     def on_user_created(**kwargs):
         try:
-            User.objects.create(**kwargs)
+            with transaction.atomic():
+                User.objects.create(**kwargs)
         except IntegrityError as e:
             msg = f"IntegrityError: {kwargs['email']} - {e!s}"
             logger.warning(msg)
@@ -78,15 +129,16 @@ class UserService:
             shahkar_response=res.text,
         )
 
-    @delay_return()
     def update(self, instance, **kwargs):
         if "password" in kwargs:
             kwargs["password"] = make_password(kwargs["password"])
         for key, value in kwargs.items():
             setattr(instance, key, value)
-        serializer = ReadOnlyUserSerializer(instance)
+        # Only the changed fields are published and updated by the consumer,
+        # which also counts the version.
+        serializer = ReadOnlyUserSerializer(instance, fields=["id", *kwargs])
         event = UserUpdated(serializer.data)
-        self.event_store.add_event(event)
+        self.publish(event)
         return instance
 
     def delete(self, instance):
@@ -166,4 +218,4 @@ class UserService:
         self.event_store.add_event(event)
 
 
-user_service = UserService(kafka_event_store)
+user_service = UserService(event_store)
@@ -0,0 +1,101 @@
+import hashlib
+import json
+from itertools import batched
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from users.serializers.user import UserSnapshotSerializer
+from utils.json import MessageEncoder
+from utils.kafka import EVENT_TYPE_HEADER
+from utils.kafka import SCHEMA_VERSION_HEADER
+
+User = get_user_model()
+
+SNAPSHOT_TYPE = "UserSnapshot"
+# Bumped when the snapshot changes incompatibly
+SNAPSHOT_SCHEMA_VERSION = 1
+
+HEADERS = [
+    (EVENT_TYPE_HEADER, SNAPSHOT_TYPE.encode("utf-8")),
+    (SCHEMA_VERSION_HEADER, str(SNAPSHOT_SCHEMA_VERSION).encode()),
+]
+# Header with the content hash of a snapshot, to compare it without decoding
+CONTENT_HASH_HEADER = "content-hash"
+# Fields that change without an event, left out of content hashes
+UNHASHED_FIELDS = {"last_login", "updated_at"}
+
+
+def get_content_hash(data):
+    """
+    Hash serialized user fields, ignoring their order.
+    """
+    data = {k: v for k, v in data.items() if k not in UNHASHED_FIELDS}
+    encoded = json.dumps(data, sort_keys=True, cls=MessageEncoder).encode("utf-8")
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+def send_snapshots(producer, users):
+    futures = []
+    for user in users:
+        snapshot = UserSnapshotSerializer(user).data
+        content_hash = get_content_hash(snapshot).encode()
+        futures.append(
+            producer.send(
+                settings.USER_SNAPSHOTS_TOPIC,
+                snapshot,
+                message_key=str(user.pk),
+                headers=[*HEADERS, (CONTENT_HASH_HEADER, content_hash)],
+            )
+        )
+    return futures
+
+
+def publish_snapshots(producer, pks):
+    """
+    Publish the current state of the given users to the compacted snapshots
+    topic, and a tombstone for those that no longer exist.
+    """
+    pks = {str(pk) for pk in pks}
+    users = list(User.objects.filter(pk__in=pks))
+    futures = send_snapshots(producer, users)
+    for pk in pks - {str(user.pk) for user in users}:
+        futures.append(
+            producer.send(
+                settings.USER_SNAPSHOTS_TOPIC, None, message_key=pk, headers=HEADERS
+            )
+        )
+    return futures
+
+
+def publish_snapshot_range(
+    producer, after=None, limit=None, batch_size=1000, timeout=30
+):
+    """
+    Republish the snapshots of users in primary key order, from the one after
+    `after` and up to `limit` users. Returns the number of users and the
+    primary key of the last one.
+    """
+    count = 0
+    last_pk = None
+    qs = User.objects.order_by("pk")
+    if after is not None:
+        qs = qs.filter(pk__gt=after)
+    if limit is not None:
+        qs = qs[:limit]
+    for batch in batched(qs.iterator(chunk_size=batch_size), batch_size):
+        futures = send_snapshots(producer, batch)
+        producer.flush(timeout=timeout)
+        for future in futures:
+            future.get(timeout=timeout)
+        count += len(batch)
+        last_pk = batch[-1].pk
+    return count, last_pk
+
+
+def publish_all_snapshots(producer, batch_size=1000, timeout=30):
+    """
+    Republish the snapshots of all users. Returns the number of users.
+    """
+    count, _ = publish_snapshot_range(producer, batch_size=batch_size, timeout=timeout)
+    return count
@@ -1,3 +1,72 @@
 import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from users.models.ledger import AppliedEvent
+from users.models.workload import AccountableWorkload
+from users.reconcile import read_user_events
+from users.reconcile import reconcile_events
+from users.reconcile import repair_events
+from users.snapshots import publish_snapshot_range
+from utils.kafka import create_producer
 
 logger = logging.getLogger(__name__)
+
+
+@shared_task
+def prune_applied_events():
+    before = timezone.now() - timedelta(days=settings.APPLIED_EVENTS_RETENTION_DAYS)
+    deleted, _ = AppliedEvent.objects.prune(before)
+    msg = f"Pruned {deleted} applied events."
+    logger.info(msg)
+    return deleted
+
+
+@shared_task
+def publish_user_snapshots(after=None):
+    """
+    Republish the snapshots of a chunk of users, then queue the next chunk, so
+    that each run stays within the task time limits.
+    """
+    if not settings.USER_SNAPSHOTS_TOPIC:
+        return 0
+    limit = settings.USER_SNAPSHOTS_CHUNK_SIZE
+    producer = create_producer(settings.KAFKA_URL)
+    try:
+        count, last_pk = publish_snapshot_range(producer, after, limit)
+    finally:
+        producer.end()
+    if count == limit:
+        publish_user_snapshots.delay(str(last_pk))
+    msg = f"Published snapshots of {count} users."
+    logger.info(msg)
+    return count
+
+
+@shared_task(
+    soft_time_limit=settings.RECONCILE_TIME_LIMIT,
+    time_limit=settings.RECONCILE_TIME_LIMIT + 60,
+)
+def reconcile_users():
+    since = timezone.now() - timedelta(hours=settings.RECONCILE_WINDOW_HOURS)
+    divergence = reconcile_events(
+        lambda: read_user_events(since), passes=settings.RECONCILE_PASSES
+    )
+    if divergence:
+        msg = f"Users diverge from events: {divergence}"
+        logger.warning(msg)
+        if settings.RECONCILE_REPAIR:
+            repair_events(divergence)
+    return len(divergence)
+
+
+@shared_task
+def recount_workloads():
+    drifted = AccountableWorkload.objects.recount()
+    if drifted:
+        msg = f"Corrected the workloads of {len(drifted)} accountables."
+        logger.warning(msg)
+    return len(drifted)
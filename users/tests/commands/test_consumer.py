@@ -0,0 +1,215 @@
+import uuid
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase
+from django.test import TestCase
+from django.test import override_settings
+
+from users.events import UserUpdated
+from users.management.commands.consumer import Command
+from users.tests.factories import UserFactory
+from utils import acks
+
+User = get_user_model()
+
+
+def message(tp, payload, timestamp, event_id=None):
+    value = {
+        "id": event_id or str(uuid.uuid4()),
+        "type": tp,
+        "key": payload["id"],
+        "payload": payload,
+        "timestamp": timestamp,
+    }
+    return SimpleNamespace(topic=tp, partition=0, value=value)
+
+
+class BatchConsumerTests(TestCase):
+    def setUp(self):
+        self.command = Command()
+        self.user = UserFactory(first_name="old")
+
+    def test_create_and_update(self):
+        pk = str(uuid.uuid4())
+        self.command.on_batch(
+            [
+                message("UserUpdated", {"id": pk, "first_name": "b"}, 2),
+                message("UserCreated", {"id": pk, "email": "n@g.com"}, 1),
+                message("UserUpdated", {"id": pk, "last_name": "c"}, 3),
+            ]
+        )
+        user = User.objects.get(pk=pk)
+        self.assertEqual(user.email, "n@g.com")
+        self.assertEqual(user.first_name, "b")
+        self.assertEqual(user.last_name, "c")
+
+    def test_last_update_wins(self):
+        pk = str(self.user.pk)
+        self.command.on_batch(
+            [
+                message("UserUpdated", {"id": pk, "first_name": "a"}, 1),
+                message("UserUpdated", {"id": pk, "first_name": "b"}, 2),
+            ]
+        )
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, "b")
+
+    def test_partition_order_is_kept(self):
+        pk = str(self.user.pk)
+        self.command.on_batch(
+            [
+                message("UserUpdated", {"id": pk, "first_name": "a"}, 2),
+                # Produced later on a host whose clock is behind
+                message("UserUpdated", {"id": pk, "first_name": "b"}, 1),
+            ]
+        )
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, "b")
+
+    def test_updates_are_counted(self):
+        pk = str(self.user.pk)
+        first = message("UserUpdated", {"id": pk, "first_name": "a"}, 1)
+        self.command.on_batch(
+            [
+                first,
+                # Concurrent requests read the same version.
+                message("UserUpdated", {"id": pk, "version": 1, "last_name": "c"}, 2),
+                # Redelivered in the same batch
+                first,
+            ]
+        )
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, "a")
+        self.assertEqual(self.user.last_name, "c")
+        self.assertEqual(self.user.version, 2)
+
+    def test_delete_wins(self):
+        pk = str(self.user.pk)
+        self.command.on_batch(
+            [
+                message("UserDeleted", {"id": pk}, 1),
+                message("UserUpdated", {"id": pk, "first_name": "b"}, 2),
+            ]
+        )
+        self.assertFalse(User.objects.filter(pk=pk).exists())
+
+    def test_replayed_create_is_ignored(self):
+        pk = str(self.user.pk)
+        self.command.on_batch(
+            [
+                message("UserCreated", {"id": pk, "email": self.user.email}, 1),
+                message("UserUpdated", {"id": pk, "last_name": "c"}, 2),
+            ]
+        )
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, "old")
+        self.assertEqual(self.user.last_name, "c")
+
+
+class IdempotentConsumerTests(TestCase):
+    def setUp(self):
+        self.command = Command()
+        self.user = UserFactory(first_name="old")
+        payload = {"id": str(self.user.pk), "first_name": "a"}
+        self.update = message("UserUpdated", payload, 1)
+
+    def test_redelivered_message_is_skipped(self):
+        self.command.on_message(self.update)
+        User.objects.filter(pk=self.user.pk).update(first_name="b")
+        self.command.on_message(self.update)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, "b")
+
+    def test_redelivered_batch_is_skipped(self):
+        self.command.on_batch([self.update])
+        User.objects.filter(pk=self.user.pk).update(first_name="b")
+        self.command.on_batch([self.update])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, "b")
+
+    def test_applied_events_are_acknowledged(self):
+        merged = message("UserUpdated", {"id": str(self.user.pk)}, 2)
+        merged.value["merged_ids"] = ["earlier"]
+        self.command.on_message(self.update)
+        self.assertTrue(acks.is_applied(self.update.value["id"]))
+        self.command.on_batch([merged])
+        self.assertTrue(acks.is_applied(merged.value["id"]))
+        self.assertTrue(acks.is_applied("earlier"))
+
+    def test_replayed_create_is_skipped(self):
+        pk = str(uuid.uuid4())
+        create = message("UserCreated", {"id": pk, "email": "n@g.com"}, 1)
+        self.command.on_message(create)
+        self.command.on_message(create)
+        self.assertTrue(User.objects.filter(pk=pk).exists())
+
+
+@override_settings(USER_SNAPSHOTS_TOPIC="user-snapshots")
+class SnapshotTests(TestCase):
+    def setUp(self):
+        self.command = Command()
+        self.command.producer = MagicMock()
+        self.user = UserFactory(first_name="old")
+
+    def test_snapshot_after_update(self):
+        payload = {"id": str(self.user.pk), "first_name": "a"}
+        self.command.on_message(message("UserUpdated", payload, 1))
+        send = self.command.producer.send
+        send.assert_called_once()
+        topic, snapshot = send.call_args.args
+        self.assertEqual(topic, "user-snapshots")
+        self.assertEqual(snapshot["first_name"], "a")
+        self.assertNotIn("password", snapshot)
+        self.assertEqual(send.call_args.kwargs["message_key"], str(self.user.pk))
+
+    def test_tombstone_after_delete(self):
+        pk = str(self.user.pk)
+        self.command.on_batch([message("UserDeleted", {"id": pk}, 1)])
+        self.command.producer.send.assert_called_once()
+        self.assertEqual(
+            self.command.producer.send.call_args.args, ("user-snapshots", None)
+        )
+
+
+class UpdateUserTests(TestCase):
+    def setUp(self):
+        self.user = UserFactory(first_name="old", last_name="old", version=2)
+
+    def test_only_changed_fields_are_updated(self):
+        User.objects.update_user(id=self.user.pk, first_name="new")
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, "new")
+        self.assertEqual(self.user.last_name, "old")
+        self.assertEqual(self.user.version, 3)
+
+    def test_concurrent_updates_are_applied(self):
+        # Both requests read version 2, and change different fields.
+        User.objects.update_user(id=self.user.pk, version=2, first_name="new")
+        User.objects.update_user(id=self.user.pk, version=2, last_name="new")
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, "new")
+        self.assertEqual(self.user.last_name, "new")
+        self.assertEqual(self.user.version, 4)
+
+
+@patch("users.management.commands.consumer.create_consumer")
+class SingleTopicTests(SimpleTestCase):
+    @override_settings(USER_EVENTS_TOPIC="users")
+    def test_single_topic(self, create_consumer):
+        self.assertEqual(UserUpdated({"id": "1"}).topic, "users")
+        Command().handle(batch=False, workers=1)
+        topics = create_consumer.call_args.args[2]
+        self.assertEqual(topics, {"users", "UserCreated", "UserUpdated", "UserDeleted"})
+        self.assertEqual(
+            create_consumer.call_args.kwargs["event_types"],
+            {"UserCreated", "UserUpdated", "UserDeleted"},
+        )
+
+    def test_topic_per_event(self, create_consumer):
+        self.assertEqual(UserUpdated({"id": "1"}).topic, "UserUpdated")
+        Command().handle(batch=False, workers=1)
+        topics = create_consumer.call_args.args[2]
+        self.assertEqual(topics, {"UserCreated", "UserUpdated", "UserDeleted"})
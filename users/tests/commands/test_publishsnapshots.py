@@ -0,0 +1,23 @@
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.test import override_settings
+
+from users.tests.factories import UserFactory
+
+
+@override_settings(USER_SNAPSHOTS_TOPIC="user-snapshots")
+@patch("users.management.commands.publishsnapshots.create_compacted_topic")
+@patch("users.management.commands.publishsnapshots.create_producer")
+class PublishSnapshotsTests(TestCase):
+    def test_publish_all(self, create_producer, create_compacted_topic):
+        users = UserFactory.create_batch(3)
+        call_command("publishsnapshots", "--batch-size", "2", stdout=StringIO())
+        producer = create_producer.return_value
+        keys = [c.kwargs["message_key"] for c in producer.send.call_args_list]
+        self.assertEqual(keys, sorted(str(user.pk) for user in users))
+        self.assertEqual(producer.flush.call_count, 2)
+        producer.end.assert_called_once()
+        create_compacted_topic.assert_called_once()
@@ -0,0 +1,151 @@
+import time
+import uuid
+from io import StringIO
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.test import override_settings
+
+from users.serializers.user import ReadOnlyUserSerializer
+from users.serializers.user import UserSnapshotSerializer
+from users.snapshots import CONTENT_HASH_HEADER
+from users.snapshots import get_content_hash
+from users.tests.factories import UserFactory
+
+User = get_user_model()
+
+
+def message(tp, payload, age=3600):
+    value = {
+        "id": str(uuid.uuid4()),
+        "type": tp,
+        "key": str(payload["id"]),
+        "payload": payload,
+        "timestamp": time.time() - age,
+    }
+    return SimpleNamespace(value=value)
+
+
+@patch("users.reconcile.read_topics")
+class ReconcileEventsTests(TestCase):
+    def setUp(self):
+        self.in_sync = UserFactory(first_name="a")
+        self.drifted = UserFactory(first_name="old")
+        self.deleted = UserFactory()
+        self.recent = UserFactory(first_name="old")
+        lost = UserFactory.build(id=uuid.uuid4())
+        self.lost_data = dict(ReadOnlyUserSerializer(lost).data)
+        self.events = [
+            message("UserUpdated", {"id": str(self.in_sync.pk), "first_name": "a"}),
+            message("UserUpdated", {"id": str(self.drifted.pk), "first_name": "b"}),
+            message("UserDeleted", {"id": str(self.deleted.pk)}),
+            message("UserCreated", self.lost_data),
+            # Not applied yet
+            message("UserUpdated", {"id": str(self.recent.pk), "first_name": "b"}, 1),
+        ]
+
+    def test_report(self, read_topics):
+        read_topics.return_value = iter(self.events)
+        out = StringIO()
+        call_command("reconcileusers", stdout=out)
+        self.assertIn("Found 1 missing, 1 changed, 1 extra users", out.getvalue())
+        self.drifted.refresh_from_db()
+        self.assertEqual(self.drifted.first_name, "old")
+
+    def test_repair(self, read_topics):
+        read_topics.return_value = iter(self.events)
+        call_command("reconcileusers", "--repair", stdout=StringIO())
+        self.drifted.refresh_from_db()
+        self.assertEqual(self.drifted.first_name, "b")
+        self.assertTrue(User.objects.filter(pk=self.lost_data["id"]).exists())
+        self.assertFalse(User.objects.filter(pk=self.deleted.pk).exists())
+        self.recent.refresh_from_db()
+        self.assertEqual(self.recent.first_name, "old")
+
+    def test_in_passes(self, read_topics):
+        read_topics.side_effect = lambda *args, **kwargs: iter(self.events)
+        out = StringIO()
+        call_command("reconcileusers", "--passes", "3", stdout=out)
+        self.assertIn("Found 1 missing, 1 changed, 1 extra users", out.getvalue())
+
+    def test_fields_written_without_events_are_kept(self, read_topics):
+        user = UserFactory()
+        created = message("UserCreated", dict(ReadOnlyUserSerializer(user).data))
+        user.change_username("renamed")
+        user.reset_password("changed")
+        read_topics.return_value = iter([created])
+        out = StringIO()
+        call_command("reconcileusers", "--repair", stdout=out)
+        self.assertIn("Repaired 0 missing, 0 changed, 0 extra users", out.getvalue())
+        user.refresh_from_db()
+        self.assertEqual(user.username, "renamed")
+
+    @override_settings(USER_EVENTS_TOPIC="users")
+    def test_single_topic_is_read_last(self, read_topics):
+        topics = {
+            "users": [
+                message("UserUpdated", {"id": str(self.drifted.pk), "first_name": "b"})
+            ],
+            "UserUpdated": [
+                message("UserUpdated", {"id": str(self.drifted.pk), "first_name": "a"})
+            ],
+        }
+        read_topics.side_effect = lambda servers, topics_, **kwargs: iter(
+            topics.get(topics_[0], [])
+        )
+        call_command("reconcileusers", "--repair", stdout=StringIO())
+        self.drifted.refresh_from_db()
+        self.assertEqual(self.drifted.first_name, "b")
+
+
+@override_settings(USER_SNAPSHOTS_TOPIC="user-snapshots")
+@patch("users.management.commands.reconcileusers.create_producer")
+@patch("users.management.commands.reconcileusers.read_topics")
+class ReconcileSnapshotsTests(TestCase):
+    def snapshot(self, user, content_hash=None):
+        if content_hash is None:
+            content_hash = get_content_hash(UserSnapshotSerializer(user).data)
+        return SimpleNamespace(
+            key=str(user.pk).encode(),
+            value=b"snapshot",
+            headers=[(CONTENT_HASH_HEADER, content_hash.encode())],
+        )
+
+    def setUp(self):
+        self.in_sync = UserFactory()
+        self.changed = UserFactory()
+        self.missing = UserFactory()
+        self.deleted = UserFactory.build(id=uuid.uuid4())
+        self.snapshots = [
+            self.snapshot(self.in_sync),
+            self.snapshot(self.changed, "outdated"),
+            self.snapshot(self.deleted, "deleted"),
+        ]
+
+    def test_repair(self, read_topics, create_producer):
+        read_topics.return_value = iter(self.snapshots)
+        out = StringIO()
+        call_command(
+            "reconcileusers", "--source", "snapshots", "--full", "--repair", stdout=out
+        )
+        self.assertIn("Repaired 1 missing, 1 changed, 1 extra users", out.getvalue())
+        producer = create_producer.return_value
+        sent = {
+            c.kwargs["message_key"]: c.args[1] for c in producer.send.call_args_list
+        }
+        self.assertEqual(
+            set(sent),
+            {str(self.changed.pk), str(self.missing.pk), str(self.deleted.pk)},
+        )
+        self.assertIsNone(sent[str(self.deleted.pk)])
+
+    def test_incremental(self, read_topics, create_producer):
+        read_topics.return_value = iter(self.snapshots)
+        User.objects.filter(pk=self.changed.pk).update(updated_at="2000-01-01T00:00Z")
+        out = StringIO()
+        call_command("reconcileusers", "--source", "snapshots", stdout=out)
+        # Old and deleted users are not compared
+        self.assertIn("Found 1 missing, 0 changed, 0 extra users", out.getvalue())
@@ -0,0 +1,77 @@
+from io import StringIO
+from types import SimpleNamespace
+from typing import NamedTuple
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from kafka.structs import OffsetAndMetadata
+from kafka.structs import TopicPartition
+
+from utils.kafka import EVENT_TYPE_HEADER
+from utils.kafka import ORIGINAL_TOPIC_HEADER
+from utils.kafka import RETRY_AT_HEADER
+from utils.kafka import RETRY_ATTEMPT_HEADER
+
+DLQ = TopicPartition("userapi.dlq", 0)
+
+
+class ConsumerRecord(NamedTuple):
+    offset: int
+    value: bytes
+    headers: list
+    topic: str = DLQ.topic
+    partition: int = DLQ.partition
+    key: bytes = b"1"
+
+
+@patch("users.management.commands.redrivedlq.create_producer")
+@patch("users.management.commands.redrivedlq.create_consumer")
+class RedriveTests(SimpleTestCase):
+    def test_headers_are_kept(self, create_consumer, create_producer):
+        headers = [
+            (EVENT_TYPE_HEADER, b"UserUpdated"),
+            (ORIGINAL_TOPIC_HEADER, b"UserUpdated"),
+            (RETRY_ATTEMPT_HEADER, b"3"),
+            (RETRY_AT_HEADER, b"1.0"),
+            ("error", b"ValueError: boom"),
+        ]
+        message = SimpleNamespace(
+            key=b"1", value={"type": "UserUpdated"}, headers=headers
+        )
+        consumer = create_consumer.return_value
+        consumer.poll.side_effect = [
+            {TopicPartition("userapi.dlq", 0): [message]},
+            {},
+        ]
+        call_command("redrivedlq", stdout=StringIO())
+        producer = create_producer.return_value
+        producer.send.assert_called_once_with(
+            "UserUpdated",
+            {"type": "UserUpdated"},
+            message_key="1",
+            headers=[
+                (EVENT_TYPE_HEADER, b"UserUpdated"),
+                (ORIGINAL_TOPIC_HEADER, b"UserUpdated"),
+            ],
+        )
+
+
+@patch("users.management.commands.redrivedlq.create_producer")
+@patch("utils.kafka.KafkaConsumer")
+class RedriveCommitTests(SimpleTestCase):
+    def test_offsets_are_committed(self, kafka_consumer, create_producer):
+        headers = [(ORIGINAL_TOPIC_HEADER, b"UserUpdated")]
+        kafka_consumer.return_value.poll.side_effect = [
+            {DLQ: [ConsumerRecord(i, b"{}", headers) for i in range(3)]},
+            {},
+        ]
+        # The command wraps the mocked KafkaConsumer in a real Consumer.
+        call_command("redrivedlq", stdout=StringIO())
+        self.assertEqual(create_producer.return_value.send.call_count, 3)
+        kafka = kafka_consumer.return_value
+        kafka.commit_async.assert_called_once()
+        self.assertEqual(
+            kafka.commit_async.call_args.args[0], {DLQ: OffsetAndMetadata(3, None)}
+        )
+        kafka.commit.assert_called_once_with({DLQ: OffsetAndMetadata(3, None)})
@@ -0,0 +1,104 @@
+import json
+import tempfile
+import uuid
+from io import StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.test import override_settings
+
+from users.serializers.user import ReadOnlyUserSerializer
+from users.serializers.user import UserSnapshotSerializer
+from users.tests.factories import UserFactory
+
+User = get_user_model()
+
+
+def message(tp, payload, timestamp):
+    value = {
+        "id": str(uuid.uuid4()),
+        "type": tp,
+        "key": str(payload["id"]),
+        "payload": payload,
+        "timestamp": timestamp,
+    }
+    return SimpleNamespace(topic=tp, partition=0, value=value)
+
+
+@patch("users.management.commands.replayevents.read_topics")
+class ReplayEventsTests(TestCase):
+    def setUp(self):
+        self.existing = UserFactory(first_name="old")
+        self.deleted = UserFactory()
+        # A user that is lost from the table and only exists in the log
+        lost = UserFactory.build(id=uuid.uuid4(), first_name="lost")
+        self.lost_data = dict(ReadOnlyUserSerializer(lost).data)
+        # A user whose row is out of date
+        stale = UserFactory(first_name="stale")
+        self.stale_data = dict(ReadOnlyUserSerializer(stale).data)
+        self.stale_data["first_name"] = "fresh"
+        self.stale = stale
+        self.events = [
+            message("UserCreated", self.lost_data, 1),
+            message("UserCreated", self.stale_data, 2),
+            message("UserUpdated", {"id": str(self.existing.pk), "first_name": "a"}, 3),
+            message("UserUpdated", {"id": self.lost_data["id"], "last_name": "b"}, 4),
+            message("UserDeleted", {"id": str(self.deleted.pk)}, 5),
+        ]
+
+    def assert_replayed(self):
+        lost = User.objects.get(pk=self.lost_data["id"])
+        self.assertEqual(lost.first_name, "lost")
+        self.assertEqual(lost.last_name, "b")
+        self.assertEqual(lost.email, self.lost_data["email"])
+        self.stale.refresh_from_db()
+        self.assertEqual(self.stale.first_name, "fresh")
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.first_name, "a")
+        self.assertFalse(User.objects.filter(pk=self.deleted.pk).exists())
+
+    def test_replay(self, read_topics):
+        read_topics.return_value = iter(self.events)
+        call_command("replayevents", stdout=StringIO())
+        self.assert_replayed()
+
+    @override_settings(USER_SNAPSHOTS_TOPIC="user-snapshots")
+    def test_replay_from_snapshots(self, read_topics):
+        new = dict(UserSnapshotSerializer(UserFactory.build(id=uuid.uuid4())).data)
+        snapshot = dict(UserSnapshotSerializer(self.stale).data)
+        snapshot["first_name"] = "fresh"
+        snapshots = [
+            SimpleNamespace(key=new["id"].encode(), value=new),
+            SimpleNamespace(key=str(self.stale.pk).encode(), value=snapshot),
+            SimpleNamespace(key=str(self.deleted.pk).encode(), value=None),
+        ]
+        updated = message("UserUpdated", {"id": new["id"], "last_name": "b"}, 1)
+        read_topics.side_effect = [iter(snapshots), iter([updated])]
+        password = self.stale.password
+        call_command("replayevents", "--from-snapshots", stdout=StringIO())
+        new_user = User.objects.get(pk=new["id"])
+        self.assertEqual(new_user.last_name, "b")
+        self.assertFalse(new_user.has_usable_password())
+        self.stale.refresh_from_db()
+        self.assertEqual(self.stale.first_name, "fresh")
+        self.assertEqual(self.stale.password, password)
+        self.assertFalse(User.objects.filter(pk=self.deleted.pk).exists())
+
+    def test_replay_into_shadow_table(self, read_topics):
+        read_topics.return_value = iter(self.events)
+        call_command("replayevents", "--shadow", "--batch-size", "1", stdout=StringIO())
+        self.assert_replayed()
+
+    def test_replay_from_log(self, read_topics):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "events.log"
+            path.write_text(
+                "".join(json.dumps(event.value) + "\n" for event in self.events)
+            )
+            call_command("replayevents", "--log", str(path), stdout=StringIO())
+        read_topics.assert_not_called()
+        self.assert_replayed()
@@ -0,0 +1,106 @@
+import uuid
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from users.assignment import assign_unassigned
+from users.assignment import handle_message
+from users.management.commands.verificationassigner import Command
+from users.models.verification import VerificationRequest
+from users.tests.factories import UserFactory
+from users.tests.factories import UserVerificationFactory
+from utils import acks
+
+User = get_user_model()
+
+
+def message(tp, payload):
+    return {
+        "id": str(uuid.uuid4()),
+        "type": tp,
+        "key": str(payload["id"]),
+        "payload": payload,
+        "timestamp": 1,
+    }
+
+
+@patch("users.assignment.event_store")
+class AssignmentTests(TestCase):
+    def setUp(self):
+        self.staff = UserFactory(is_staff=True, roles=["verifications.accountable"])
+
+    def test_assign_created_request(self, event_store):
+        item = UserVerificationFactory()
+        handle_message(message("VerificationCreated", {"id": str(item.pk)}))
+        item.refresh_from_db()
+        self.assertEqual(item.accountable, self.staff)
+        event = event_store.add_event.call_args.args[0]
+        self.assertEqual(event.name, "VerificationAssigned")
+
+    def test_missing_request_is_retried(self, event_store):
+        with self.assertRaises(VerificationRequest.DoesNotExist):
+            handle_message(message("VerificationCreated", {"id": 10**9}))
+
+    def test_assigned_request_is_left_alone(self, event_store):
+        other = UserFactory(is_staff=True, roles=["verifications.accountable"])
+        item = UserVerificationFactory(accountable=other)
+        handle_message(message("VerificationCreated", {"id": str(item.pk)}))
+        item.refresh_from_db()
+        self.assertEqual(item.accountable, other)
+        event_store.add_event.assert_not_called()
+
+    def test_assign_backlog_on_role_change(self, event_store):
+        self.staff.roles = []
+        self.staff.save()
+        items = UserVerificationFactory.create_batch(2)
+        self.staff.roles = ["verifications.accountable"]
+        self.staff.save()
+        handle_message(message("UserUpdated", {"id": str(self.staff.pk), "version": 1}))
+        event_store.add_events.assert_not_called()
+        update = message("UserUpdated", {"id": str(self.staff.pk), "roles": ["x"]})
+        with self.assertRaises(acks.EventNotAppliedError):
+            handle_message(update)
+        acks.acknowledge(update["id"])
+        handle_message(update)
+        for item in items:
+            item.refresh_from_db()
+            self.assertEqual(item.accountable, self.staff)
+        events = event_store.add_events.call_args.args[0]
+        self.assertEqual({e.key for e in events}, {item.pk for item in items})
+
+    def test_assign_backlog_in_batches(self, event_store):
+        items = UserVerificationFactory.create_batch(3)
+        self.assertEqual(assign_unassigned(batch_size=2), len(items))
+        batches = [c.args[0] for c in event_store.add_events.call_args_list]
+        self.assertEqual([len(events) for events in batches], [2, 1])
+        self.assertEqual(
+            [e.key for events in batches for e in events], [i.pk for i in items]
+        )
+
+    def test_no_accountable(self, event_store):
+        self.staff.delete()
+        UserVerificationFactory.create_batch(3)
+        self.assertEqual(assign_unassigned(batch_size=2), 0)
+
+
+@patch("users.assignment.event_store")
+@patch("users.management.commands.verificationassigner.create_consumer")
+class VerificationAssignerTests(TestCase):
+    def test_sweep_then_consume(self, create_consumer, event_store):
+        staff = UserFactory(is_staff=True, roles=["verifications.accountable"])
+        item = UserVerificationFactory()
+        with patch("threading.Thread"):
+            Command().handle(period=600)
+        item.refresh_from_db()
+        self.assertEqual(item.accountable, staff)
+        topics = create_consumer.call_args.args[2]
+        self.assertIn("VerificationCreated", topics)
+        self.assertEqual(
+            create_consumer.call_args.kwargs["event_types"],
+            {"VerificationCreated", "VerificationInspected", "UserUpdated"},
+        )
+        consumer = create_consumer.return_value
+        on_message = consumer.start_consuming.call_args.kwargs["on_message"]
+        on_message(SimpleNamespace(value={"type": "Other"}))
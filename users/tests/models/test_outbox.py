@@ -0,0 +1,54 @@
+from datetime import timedelta
+from unittest.mock import MagicMock
+
+from django.db.models.functions import Now
+from django.test import TestCase
+
+from users.events import UserUpdated
+from users.models.outbox import OutboxEvent
+from users.outbox import OutboxEventStore
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        store = OutboxEventStore()
+        for i in range(3):
+            store.add_event(UserUpdated({"id": str(i), "first_name": "v"}))
+
+    def test_add_event(self):
+        event = OutboxEvent.objects.first()
+        self.assertEqual(event.topic, "UserUpdated")
+        self.assertEqual(event.key, "0")
+        self.assertEqual(event.message["type"], "UserUpdated")
+        self.assertEqual(event.message["payload"], {"id": "0", "first_name": "v"})
+
+    def test_publish_batch(self):
+        producer = MagicMock()
+        self.assertEqual(OutboxEvent.objects.publish_batch(producer, 2, lag=0), 2)
+        keys = [c.kwargs["message_key"] for c in producer.send.call_args_list]
+        self.assertEqual(keys, ["0", "1"])
+        self.assertEqual(OutboxEvent.objects.get().key, "2")
+
+    def test_recent_events_are_held_back(self):
+        producer = MagicMock()
+        self.assertEqual(OutboxEvent.objects.publish_batch(producer, lag=1), 0)
+        producer.send.assert_not_called()
+        self.assertEqual(OutboxEvent.objects.count(), 3)
+
+    def test_claimed_events_are_left_to_their_relay(self):
+        producer = MagicMock()
+        OutboxEvent.objects.filter(key="0").update(claimed_at=Now())
+        self.assertEqual(OutboxEvent.objects.publish_batch(producer, lag=0), 0)
+        producer.send.assert_not_called()
+        # Until the claim expires
+        OutboxEvent.objects.filter(key="0").update(
+            claimed_at=Now() - timedelta(hours=1)
+        )
+        self.assertEqual(OutboxEvent.objects.publish_batch(producer, lag=0), 3)
+
+    def test_publish_failure(self):
+        producer = MagicMock()
+        producer.send.return_value.get.side_effect = TimeoutError
+        with self.assertRaises(TimeoutError):
+            OutboxEvent.objects.publish_batch(producer, lag=0)
+        self.assertEqual(OutboxEvent.objects.filter(claimed_at=None).count(), 3)
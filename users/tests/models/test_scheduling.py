@@ -0,0 +1,170 @@
+from datetime import time
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.test import SimpleTestCase
+from django.test import TestCase
+from django.utils import timezone
+
+from users.models.verification import VerificationRequest
+from users.models.workload import AccountableWorkload
+from users.scheduling import Scheduler
+from users.tests.factories import CompanyVerificationFactory
+from users.tests.factories import UserFactory
+from users.tests.factories import UserVerificationFactory
+
+User = get_user_model()
+
+
+class SchedulerTests(SimpleTestCase):
+    def setUp(self):
+        self.now = timezone.localtime().replace(hour=12)
+        self.old = self.now - timedelta(days=3)
+
+    def create_scheduler(self, *workloads):
+        return Scheduler(workloads, overdue=self.now - timedelta(days=2), now=self.now)
+
+    def test_least_assigned(self):
+        scheduler = self.create_scheduler(
+            AccountableWorkload(accountable_id=1, assigned_count=2),
+            AccountableWorkload(accountable_id=2),
+        )
+        picks = [scheduler.pick(None, self.now) for _ in range(4)]
+        self.assertEqual(picks, [2, 2, 1, 2])
+
+    def test_capacity(self):
+        scheduler = self.create_scheduler(
+            AccountableWorkload(accountable_id=1, capacity=1),
+            AccountableWorkload(accountable_id=2, assigned_count=1, capacity=2),
+        )
+        picks = [scheduler.pick(None, self.now) for _ in range(3)]
+        self.assertEqual(picks, [1, 2, None])
+
+    def test_overdue_exceeds_capacity(self):
+        scheduler = self.create_scheduler(
+            AccountableWorkload(accountable_id=1, assigned_count=3, capacity=1),
+            AccountableWorkload(accountable_id=2, assigned_count=1, capacity=1),
+        )
+        self.assertIsNone(scheduler.pick(None, self.now))
+        self.assertEqual(scheduler.pick(None, self.old), 2)
+        self.assertEqual(scheduler.pick(None, self.old), 2)
+
+    def test_working_hours(self):
+        local = timezone.localtime(self.now).time()
+        start = time(local.hour - 1)
+        end = time(local.hour + 1)
+        scheduler = self.create_scheduler(
+            AccountableWorkload(accountable_id=1, works_from=end, works_until=start),
+            AccountableWorkload(accountable_id=2, works_from=start, works_until=end),
+        )
+        self.assertEqual(scheduler.pick(None, self.old), 2)
+        self.assertEqual(scheduler.pick(None, self.old), 2)
+
+    def test_preferred_content_type(self):
+        scheduler = self.create_scheduler(
+            AccountableWorkload(accountable_id=1, assigned_count=5, content_type_id=7),
+            AccountableWorkload(accountable_id=2),
+        )
+        self.assertEqual(scheduler.pick(7, self.now), 1)
+        self.assertEqual(scheduler.pick(8, self.now), 2)
+
+    def test_preferred_at_capacity(self):
+        scheduler = self.create_scheduler(
+            AccountableWorkload(
+                accountable_id=1, assigned_count=1, capacity=1, content_type_id=7
+            ),
+            AccountableWorkload(accountable_id=2, assigned_count=5),
+        )
+        self.assertEqual(scheduler.pick(7, self.now), 2)
+
+
+class DistributeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        UserFactory.create_batch(2, is_staff=True, roles=["verifications.accountable"])
+        cls.staff1 = User.objects.first()
+        cls.staff2 = User.objects.last()
+        AccountableWorkload.objects.create(
+            accountable=cls.staff1,
+            assigned_count=2,
+            content_type=ContentType.objects.get(app_label="users", model="company"),
+        )
+        AccountableWorkload.objects.create(accountable=cls.staff2, capacity=3)
+
+    def test_distribute(self):
+        overdue = UserVerificationFactory()
+        VerificationRequest.objects.filter(pk=overdue.pk).update(
+            created_at=timezone.now() - timedelta(days=3)
+        )
+        items = [
+            UserVerificationFactory(),
+            CompanyVerificationFactory(),
+            UserVerificationFactory(),
+        ]
+        pks = [overdue.pk, *(item.pk for item in items)]
+        assignments = VerificationRequest.objects.distribute(pks)
+        self.assertEqual(
+            [assignments[pk] for pk in pks],
+            [self.staff2.pk, self.staff2.pk, self.staff1.pk, self.staff2.pk],
+        )
+
+    def test_assign_at_capacity(self):
+        self.staff1.roles = []
+        self.staff1.save()
+        items = UserVerificationFactory.create_batch(4)
+        self.assertEqual([item.assign() for item in items[:3]], [self.staff2] * 3)
+        self.assertIsNone(items[3].assign())
+
+    def test_assign_preferred(self):
+        company = CompanyVerificationFactory()
+        item = UserVerificationFactory()
+        with self.assertNumQueries(1):
+            accountable = User.objects.get_least_assigned_accountable(
+                content_type_id=company.content_type_id
+            )
+        self.assertEqual(accountable, self.staff1)
+        self.assertEqual(company.assign(), self.staff1)
+        self.assertEqual(item.assign(), self.staff2)
+
+    def test_assign_in_working_hours(self):
+        now = timezone.localtime()
+        AccountableWorkload.objects.filter(accountable=self.staff2).update(
+            works_from=(now + timedelta(hours=1)).time(),
+            works_until=(now + timedelta(hours=2)).time(),
+        )
+        self.assertEqual(UserVerificationFactory().assign(), self.staff1)
+
+    def test_assign_when_filled_meanwhile(self):
+        AccountableWorkload.objects.filter(accountable=self.staff2).update(
+            assigned_count=3
+        )
+        item = UserVerificationFactory()
+        with patch.object(
+            User.objects, "get_least_assigned_accountable", return_value=self.staff2
+        ):
+            self.assertIsNone(item.assign())
+        item.refresh_from_db()
+        self.assertIsNone(item.accountable)
+        workload = AccountableWorkload.objects.get(accountable=self.staff2)
+        self.assertEqual(workload.assigned_count, 3)
+
+    def test_distribute_checks_locked_loads(self):
+        self.staff1.roles = []
+        self.staff1.save()
+        items = UserVerificationFactory.create_batch(2)
+        # Another assigner added to the load after it was read.
+        read = [
+            AccountableWorkload(accountable=self.staff2, assigned_count=1, capacity=3)
+        ]
+        AccountableWorkload.objects.filter(accountable=self.staff2).update(
+            assigned_count=2
+        )
+        with patch.object(
+            AccountableWorkload.objects, "get_workloads", return_value=read
+        ):
+            assignments = VerificationRequest.objects.distribute(
+                [item.pk for item in items]
+            )
+        self.assertEqual(assignments, {items[0].pk: self.staff2.pk})
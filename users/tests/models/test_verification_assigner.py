@@ -1,7 +1,12 @@
+from unittest.mock import Mock
+
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.test import TestCase
 
+from users.assignment import assign_batch
 from users.models.verification import VerificationRequest
+from users.models.workload import AccountableWorkload
 from users.tests.factories import UserFactory
 from users.tests.factories import UserVerificationFactory
 
@@ -18,7 +23,55 @@ class AssignVerificationTests(TestCase):
 
     def test_load_balancing(self):
         vr = VerificationRequest.objects.first()
-        vr.accountable = self.staff1
-        vr.save()
+        vr.assign(self.staff1)
         vr = VerificationRequest.objects.last()
         self.assertEqual(vr.assign(), self.staff2)
+
+
+class BatchAssignVerificationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        UserFactory.create_batch(2, is_staff=True, roles=["verifications.accountable"])
+        cls.staff1 = User.objects.first()
+        cls.staff2 = User.objects.last()
+        UserVerificationFactory.create_batch(2, accountable=cls.staff1)
+        AccountableWorkload.objects.recount()
+        cls.unassigned = UserVerificationFactory.create_batch(4)
+
+    def test_distribute_to_least_assigned(self):
+        pks = [item.pk for item in self.unassigned]
+        assignments = VerificationRequest.objects.distribute(pks)
+        accountables = [assignments[pk] for pk in pks]
+        self.assertEqual(accountables[:2], [self.staff2.pk] * 2)
+        self.assertEqual(
+            sorted(map(str, accountables[2:])),
+            sorted([str(self.staff1.pk), str(self.staff2.pk)]),
+        )
+
+    def test_claim_unassigned(self):
+        pks = [item.pk for item in self.unassigned]
+        with transaction.atomic():
+            self.assertEqual(VerificationRequest.objects.claim_unassigned(3), pks[:3])
+            self.assertEqual(
+                VerificationRequest.objects.claim_unassigned(3, pks=pks[2:]), pks[2:]
+            )
+
+    def test_assign_many_skips_assigned(self):
+        item = self.unassigned[0]
+        item.accountable = self.staff1
+        item.save()
+        assigned = VerificationRequest.objects.assign_many(
+            {i.pk: self.staff2.pk for i in self.unassigned}
+        )
+        self.assertEqual(sorted(assigned), sorted(i.pk for i in self.unassigned[1:]))
+        item.refresh_from_db()
+        self.assertEqual(item.accountable, self.staff1)
+
+    def test_assign_batch(self):
+        store = Mock()
+        assigned = assign_batch([item.pk for item in self.unassigned], store)
+        self.assertEqual(assigned, len(self.unassigned))
+        loads = dict(AccountableWorkload.objects.values_list("pk", "assigned_count"))
+        self.assertEqual(loads, {self.staff1.pk: 3, self.staff2.pk: 3})
+        events = store.add_events.call_args.args[0]
+        self.assertEqual(len(events), len(self.unassigned))
@@ -0,0 +1,79 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from users.models.verification import VerificationRequest
+from users.models.workload import AccountableWorkload
+from users.serializers.verification import InspectionSerializer
+from users.tests.factories import UserFactory
+from users.tests.factories import UserVerificationFactory
+
+User = get_user_model()
+
+
+class AccountableWorkloadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        UserFactory.create_batch(2, is_staff=True, roles=["verifications.accountable"])
+        cls.staff1 = User.objects.first()
+        cls.staff2 = User.objects.last()
+        cls.items = UserVerificationFactory.create_batch(3)
+
+    def get_loads(self):
+        loads = dict.fromkeys([self.staff1.pk, self.staff2.pk], 0)
+        loads.update(AccountableWorkload.objects.values_list("pk", "assigned_count"))
+        return loads
+
+    def test_assign(self):
+        self.items[0].assign(self.staff1)
+        self.items[1].assign(self.staff1)
+        self.assertEqual(self.get_loads(), {self.staff1.pk: 2, self.staff2.pk: 0})
+        self.assertEqual(self.items[2].assign(), self.staff2)
+        self.assertEqual(self.get_loads(), {self.staff1.pk: 2, self.staff2.pk: 1})
+
+    def test_reassign(self):
+        item = self.items[0]
+        item.assign(self.staff1)
+        item.refresh_from_db()
+        item.assign(self.staff2)
+        self.assertEqual(self.get_loads(), {self.staff1.pk: 0, self.staff2.pk: 1})
+
+    def test_assign_inspecting(self):
+        item = self.items[0]
+        item.status = VerificationRequest.INSPECTING
+        item.save()
+        item.assign(self.staff1)
+        self.assertEqual(self.get_loads(), {self.staff1.pk: 0, self.staff2.pk: 0})
+
+    def test_inspect(self):
+        item = self.items[0]
+        item.assign(self.staff1)
+        item.refresh_from_db()
+        serializer = InspectionSerializer(
+            item, data={"status": VerificationRequest.INSPECTING}
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.assertEqual(self.get_loads(), {self.staff1.pk: 0, self.staff2.pk: 0})
+
+    def test_assign_many(self):
+        VerificationRequest.objects.assign_many(
+            {item.pk: self.staff2.pk for item in self.items}
+        )
+        self.assertEqual(self.get_loads(), {self.staff1.pk: 0, self.staff2.pk: 3})
+
+    def test_recount(self):
+        self.items[0].assign(self.staff1)
+        VerificationRequest.objects.filter(pk=self.items[1].pk).update(
+            accountable=self.staff2
+        )
+        VerificationRequest.objects.filter(pk=self.items[0].pk).delete()
+        drifted = AccountableWorkload.objects.recount()
+        self.assertEqual(drifted, {self.staff1.pk: 0, self.staff2.pk: 1})
+        self.assertEqual(self.get_loads(), {self.staff1.pk: 0, self.staff2.pk: 1})
+        self.assertEqual(AccountableWorkload.objects.recount(), {})
+
+    def test_least_assigned_without_counting(self):
+        self.items[0].assign(self.staff1)
+        with self.assertNumQueries(1):
+            accountable = User.objects.get_least_assigned_accountable()
+        self.assertEqual(accountable, self.staff2)
@@ -0,0 +1,33 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.test import override_settings
+
+from users import tasks
+from users.tests.factories import UserFactory
+
+
+@override_settings(USER_SNAPSHOTS_TOPIC="user-snapshots", USER_SNAPSHOTS_CHUNK_SIZE=2)
+@patch("users.tasks.create_producer")
+class PublishUserSnapshotsTests(TestCase):
+    @patch("users.tasks.publish_user_snapshots.delay")
+    def test_next_chunk_is_queued(self, delay, create_producer):
+        pks = sorted(str(user.pk) for user in UserFactory.create_batch(3))
+        self.assertEqual(tasks.publish_user_snapshots(), 2)
+        delay.assert_called_once_with(pks[1])
+
+        delay.reset_mock()
+        self.assertEqual(tasks.publish_user_snapshots(pks[1]), 1)
+        delay.assert_not_called()
+        producer = create_producer.return_value
+        keys = [c.kwargs["message_key"] for c in producer.send.call_args_list]
+        self.assertEqual(keys, pks)
+
+
+@override_settings(RECONCILE_PASSES=2)
+class ReconcileUsersTests(TestCase):
+    @patch("users.tasks.read_user_events")
+    def test_events_are_read_per_pass(self, read_user_events):
+        read_user_events.side_effect = lambda since: iter([])
+        self.assertEqual(tasks.reconcile_users(), 0)
+        self.assertEqual(read_user_events.call_count, 2)
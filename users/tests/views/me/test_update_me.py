@@ -1,11 +1,18 @@
 # ruff: noqa: S106
+import tempfile
+from unittest.mock import Mock
 from unittest.mock import patch
 
+from django.test import override_settings
+from kafka.errors import KafkaTimeoutError
 from rest_framework import status
 from rest_framework.reverse import reverse
 from rest_framework.test import APITestCase
 
+from users.services import user_service
 from users.tests.factories import UserFactory
+from utils.spool import Spool
+from utils.spool import SpoolingProducer
 
 
 class UpdateMeTests(APITestCase):
@@ -71,3 +78,34 @@ class UpdateMeTests(APITestCase):
         # Ensure these data are not changed.
         # Other sensitive data are surely rejected in validation.
         self.assertEqual(data["is_active"], True)
+
+    @patch("utils.kafka.KafkaEventStore.add_event")
+    def test_event_carries_changed_fields(self, add_event):
+        self.client.force_authenticate(self.user)
+        response = self.client.patch(self.url, data={"first_name": "changed"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        event = add_event.call_args.args[0]
+        self.assertEqual(
+            event.data,
+            {"id": str(self.user.pk), "first_name": "changed"},
+        )
+
+    @override_settings(EVENT_ACK_TIMEOUT=10)
+    def test_accepted_when_kafka_is_unreachable(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        producer = Mock()
+        producer.send.side_effect = KafkaTimeoutError
+        spooling = SpoolingProducer(
+            producer, Spool(directory.name, 1024 * 1024), interval=3600
+        )
+        self.client.force_authenticate(self.user)
+        with (
+            patch.object(user_service.event_store, "producer", spooling),
+            patch("utils.acks.wait_for_ack") as wait_for_ack,
+        ):
+            response = self.client.patch(self.url, data={"first_name": "changed"})
+        # The spooled event is not applied before Kafka is back.
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        wait_for_ack.assert_not_called()
+        self.assertTrue(spooling.spool.pending)
@@ -1,6 +1,7 @@
 import mimetypes
 
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.http.response import HttpResponse
 from django.utils.translation import gettext_lazy as _
 from rest_framework import mixins
@@ -35,7 +36,7 @@ from users.serializers.verification import AdminVerificationRequestSerializer
 from users.serializers.verification import DocumentSerializer
 from users.serializers.verification import InspectionSerializer
 from users.serializers.verification import VerificationRequestSerializer
-from users.services import kafka_event_store
+from users.services import event_store
 
 User = get_user_model()
 
@@ -113,11 +114,12 @@ class VerificationRequestViewSet(
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         try:
-            instance = serializer.save(documents=documents)
-            event = VerificationCreated(
-                AdminVerificationRequestSerializer(instance).data
-            )
-            kafka_event_store.add_event(event)
+            with transaction.atomic():
+                instance = serializer.save(documents=documents)
+                event = VerificationCreated(
+                    AdminVerificationRequestSerializer(instance).data
+                )
+                event_store.add_event(event)
             return Response(data=serializer.data, status=status.HTTP_201_CREATED)
         except StatusError:
             return Response(
@@ -147,12 +149,14 @@ class VerificationRequestViewSet(
         instance = self.get_object()
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        accountable = instance.assign(**serializer.validated_data)
+        with transaction.atomic():
+            accountable = instance.assign(**serializer.validated_data)
+            if accountable:
+                instance.refresh_from_db()
+                serializer = AdminVerificationRequestSerializer(instance)
+                event = VerificationAssigned(serializer.data)
+                event_store.add_event(event)
         if accountable:
-            instance.refresh_from_db()
-            serializer = AdminVerificationRequestSerializer(instance)
-            event = VerificationAssigned(serializer.data)
-            kafka_event_store.add_event(event)
             return Response(serializer.data)
 
         return Response(
@@ -173,13 +177,22 @@ class VerificationRequestViewSet(
         instance = self.get_object()
         serializer = self.get_serializer(instance, data=request.data)
         serializer.is_valid(raise_exception=True)
-        instance = serializer.save()
-        serializer = AdminVerificationRequestSerializer(instance)
-        event = VerificationInspected(serializer.data)
-        kafka_event_store.add_event(event)
-        if instance.status == VerificationRequest.VERIFIED:
-            event = UserUpdated(MeSerializer(instance.user).data)
-            kafka_event_store.add_event(event)
+        with transaction.atomic():
+            instance = serializer.save()
+            serializer = AdminVerificationRequestSerializer(instance)
+            event = VerificationInspected(serializer.data)
+            event_store.add_event(event)
+            if instance.status == VerificationRequest.VERIFIED:
+                user = instance.user
+                user.refresh_from_db()
+                data = MeSerializer(user).data
+                if instance.content_type.model == "user":
+                    fields = ["identity_verified", "identity_verified_at"]
+                else:
+                    fields = ["company"]
+                changes = {name: data[name] for name in ["id", *fields]}
+                event = UserUpdated(changes)
+                event_store.add_event(event)
         return Response(serializer.data)
 
 
@@ -0,0 +1,73 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class EventNotAppliedError(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _(
+        "Your change is accepted but not applied yet. Please try again shortly."
+    )
+    default_code = "event_not_applied"
+
+
+class EventDeferredError(APIException):
+    """
+    Raised instead of waiting for an event that is spooled, as it is not
+    applied before Kafka is reachable again.
+    """
+
+    status_code = status.HTTP_202_ACCEPTED
+    default_detail = _(
+        "Your change is accepted and will be applied once the service recovers."
+    )
+    default_code = "event_deferred"
+
+
+def get_cache():
+    return caches[settings.EVENT_ACK_CACHE]
+
+
+def get_ack_key(event_id):
+    return f"event.applied.{event_id}"
+
+
+def acknowledge(event_id):
+    """
+    Record that the event of `event_id` is applied to the database. Called by
+    the consumer after it has applied an event.
+    """
+    acknowledge_many([event_id])
+
+
+def acknowledge_many(event_ids):
+    """
+    Same as `acknowledge`, for many event ids.
+    """
+    get_cache().set_many(
+        dict.fromkeys(map(get_ack_key, event_ids), True), settings.EVENT_ACK_TTL
+    )
+
+
+def is_applied(event_id):
+    return get_cache().get(get_ack_key(event_id), False)
+
+
+def wait_for_ack(event_id, timeout=None):
+    """
+    Block until the consumer acknowledges that the event of `event_id` is
+    applied, or raise `EventNotAppliedError` after `timeout` seconds. A zero
+    timeout disables waiting.
+    """
+    timeout = settings.EVENT_ACK_TIMEOUT if timeout is None else timeout
+    if not timeout:
+        return
+    deadline = time.monotonic() + timeout
+    while not is_applied(event_id):
+        if time.monotonic() >= deadline:
+            raise EventNotAppliedError
+        time.sleep(settings.EVENT_ACK_POLL_INTERVAL)
@@ -0,0 +1,303 @@
+import asyncio
+import contextlib
+import dataclasses
+import inspect
+import logging
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiokafka import AIOKafkaConsumer
+from aiokafka import ConsumerRebalanceListener
+from aiokafka.coordinator.assignors.range import RangePartitionAssignor
+from aiokafka.coordinator.assignors.sticky.sticky_assignor import (
+    StickyPartitionAssignor,
+)
+from django.conf import settings
+
+from utils.kafka import Consumer
+from utils.kafka import PollSizer
+from utils.kafka import check_decoded
+from utils.kafka import create_producer
+from utils.kafka import get_event_type
+from utils.metrics import CONSUMER_BATCH_SECONDS
+from utils.metrics import CONSUMER_COMMIT_SECONDS
+from utils.metrics import CONSUMER_HANDLER_SECONDS
+from utils.metrics import CONSUMER_LAG
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRebalanceListener(ConsumerRebalanceListener):
+    """
+    Waits for the messages being processed, then commits the offsets of
+    partitions about to be revoked, so that their next consumer does not
+    process them again.
+    """
+
+    def __init__(self, consumer):
+        self.consumer = consumer
+
+    async def on_partitions_revoked(self, revoked):
+        await self.consumer.on_revoke(set(revoked))
+
+    async def on_partitions_assigned(self, assigned):
+        msg = f"Assigned partitions: {sorted(assigned)}"
+        logger.info(msg)
+
+
+class AsyncConsumer(Consumer):
+    """
+    A `Consumer` running on asyncio with aiokafka. Handlers may be coroutine
+    functions; other handlers run in a pool of `workers` threads, so that
+    polling, heartbeats, commits and shutdown signals are not held up by them.
+    Messages with the same key are handled in order, and the offsets of a
+    poll are committed while the next one is handled.
+    """
+
+    # Seconds to wait before polling again after a failure
+    backoff = 5
+
+    def connect(self, topics, configs):
+        # aiokafka consumers are bound to the event loop they are created on,
+        # so this one is created by `consume`.
+        self.topics = topics
+        self.configs = configs
+        self.executor = None
+        self.loop = None
+        self.stopping = None
+        # Set while no poll is being processed
+        self.idle = None
+        self.commit = None
+
+    def with_value(self, message, value):
+        return dataclasses.replace(message, value=value)
+
+    async def poll(self, timeout_ms=1000, max_records=None):
+        message_batch = await self.consumer.getmany(
+            timeout_ms=timeout_ms, max_records=max_records
+        )
+        return self.decode_batch(message_batch)
+
+    async def update_lag(self):
+        for tp in self.consumer.assignment():
+            highwater = self.consumer.highwater(tp)
+            if highwater is None:
+                continue
+            lag = max(highwater - await self.consumer.position(tp), 0)
+            CONSUMER_LAG.labels(self.group, tp.topic, tp.partition).set(lag)
+
+    async def commit_offsets(self, offsets):
+        self.offsets.update(offsets)
+        try:
+            with CONSUMER_COMMIT_SECONDS.labels(self.group).time():
+                await self.consumer.commit(
+                    {tp: offset.offset for tp, offset in offsets.items()}
+                )
+            logger.info("Offsets committed successfully.")
+        except Exception as e:
+            msg = f"Failed to commit offsets: {e}"
+            logger.exception(msg)
+
+    async def commit_sync(self, partitions=None):
+        offsets = {
+            tp: offset
+            for tp, offset in self.offsets.items()
+            if partitions is None or tp in partitions
+        }
+        if offsets:
+            await self.commit_offsets(offsets)
+
+    async def on_revoke(self, revoked):
+        msg = f"Revoking partitions: {sorted(revoked)}"
+        logger.info(msg)
+        await self.idle.wait()
+        if self.commit:
+            await self.commit
+        await self.commit_sync(revoked)
+        self.forget(revoked)
+
+    async def call(self, handler, *args):
+        """
+        Await a coroutine function, or run any other function in a thread.
+        """
+        if inspect.iscoroutinefunction(handler):
+            return await handler(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, handler, *args)
+
+    async def process_message(self, message, on_message=None):
+        try:
+            msg = f"Processing message {message.topic}:{message.offset}"
+            logger.debug(msg)
+            check_decoded(message)
+            if on_message:
+                event_type = get_event_type(message)
+                with CONSUMER_HANDLER_SECONDS.labels(self.group, event_type).time():
+                    await self.call(on_message, message)
+        except Exception as e:
+            msg = f"Failed to process message: {e}"
+            logger.exception(msg)
+            if not self.producer:
+                raise
+            await self.call(self.dead_letter, message, e)
+
+    async def process_lanes(self, message_batch, on_message):
+        """
+        Process a poll in one task per lane of `get_lanes`. When a message
+        fails, the rest of its lane is left unprocessed and consumed again.
+        Returns the offsets to commit.
+        """
+
+        async def process_lane(lane):
+            for i, message in enumerate(lane):
+                try:
+                    await self.process_message(message, on_message)
+                except Exception:  # noqa: BLE001
+                    return lane[i:]
+            return []
+
+        lanes = self.get_lanes(message_batch).values()
+        unprocessed = await asyncio.gather(*(process_lane(lane) for lane in lanes))
+        return self.rewind(message_batch, unprocessed)
+
+    async def process(self, message_batch, on_message=None, on_batch=None):
+        """
+        Process a poll with `on_batch` at once, if given, falling back to
+        `on_message` per message as `Consumer.process_batch` does. Returns the
+        offsets to commit.
+        """
+        if on_batch:
+            messages = [
+                message for messages in message_batch.values() for message in messages
+            ]
+            try:
+                with CONSUMER_BATCH_SECONDS.labels(self.group).time():
+                    await self.call(on_batch, messages)
+            except Exception as e:
+                msg = f"Failed to process batch: {e}"
+                logger.exception(msg)
+                if not (self.producer and on_message):
+                    self.rewind(message_batch, [messages])
+                    raise
+            else:
+                return self.rewind(message_batch, [])
+        return await self.process_lanes(message_batch, on_message)
+
+    async def back_off(self):
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(self.stopping.wait(), self.backoff)
+
+    def stop(self):
+        """
+        Stop consuming. May be called from any thread.
+        """
+        self.loop.call_soon_threadsafe(self.stopping.set)
+
+    async def consume(self, on_message=None, on_batch=None):
+        """
+        Consume messages until SIGTERM or SIGINT, calling `on_message` for each
+        message, or `on_batch` once with all messages of a poll when given.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            self.loop.add_signal_handler(signum, self.stopping.set)
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.consumer = AIOKafkaConsumer(**self.configs)
+        if self.topics:
+            self.consumer.subscribe(
+                topics=list(self.topics), listener=AsyncRebalanceListener(self)
+            )
+        await self.consumer.start()
+        try:
+            while not self.stopping.is_set():
+                try:
+                    self.release()
+                    message_batch = await self.poll(
+                        timeout_ms=self.sizer.timeout_ms,
+                        max_records=self.sizer.records,
+                    )
+                    message_batch = self.hold_back(message_batch)
+                    await self.update_lag()
+                    self.observe_batch(message_batch)
+                    start = time.monotonic()
+                    if not message_batch:
+                        self.adapt(message_batch, 0)
+                        continue
+                    self.idle.clear()
+                    try:
+                        offsets = await self.process(
+                            message_batch, on_message, on_batch
+                        )
+                        if self.commit:
+                            await self.commit
+                        self.commit = asyncio.create_task(self.commit_offsets(offsets))
+                    finally:
+                        self.idle.set()
+                    self.adapt(message_batch, time.monotonic() - start)
+                    if any(
+                        offsets[tp].offset <= messages[-1].offset
+                        for tp, messages in message_batch.items()
+                    ):
+                        # Avoid rapid retries of failed messages
+                        await self.back_off()
+                except Exception as e:
+                    msg = f"Error occurred while consuming messages: {e}"
+                    logger.exception(msg)
+                    await self.back_off()
+        finally:
+            logger.info("Closing consumer...")
+            if self.commit:
+                await self.commit
+            await self.commit_sync()
+            await self.consumer.stop()
+            self.executor.shutdown()
+            if self.producer:
+                self.producer.end()
+
+    def start_consuming(self, on_message=None, on_batch=None):
+        asyncio.run(self.consume(on_message=on_message, on_batch=on_batch))
+
+
+def create_async_consumer(  # noqa: PLR0913
+    bootstrap_servers,
+    group_id,
+    topics=None,
+    workers=1,
+    retry_delays=None,
+    event_types=None,
+):
+    """
+    Create an `AsyncConsumer`, configured as `utils.kafka.create_consumer`
+    configures a `Consumer`.
+    """
+    producer = None
+    if retry_delays is not None:
+        producer = create_producer(bootstrap_servers)
+    return AsyncConsumer(
+        *(topics or []),
+        workers=workers,
+        producer=producer,
+        retry_delays=retry_delays or (),
+        event_types=event_types,
+        bootstrap_servers=bootstrap_servers,
+        auto_offset_reset="earliest",
+        partition_assignment_strategy=(
+            StickyPartitionAssignor,
+            RangePartitionAssignor,
+        ),
+        enable_auto_commit=False,
+        group_id=group_id,
+        session_timeout_ms=30000,
+        heartbeat_interval_ms=10000,
+        sizer=PollSizer(
+            min_records=settings.KAFKA_POLL_MIN_RECORDS,
+            max_records=settings.KAFKA_POLL_MAX_RECORDS,
+            target_ms=settings.KAFKA_POLL_TARGET_MS,
+            saturation_ms=settings.KAFKA_SATURATION_MS,
+        ),
+        max_poll_records=settings.KAFKA_POLL_MAX_RECORDS,
+    )
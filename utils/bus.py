@@ -0,0 +1,110 @@
+import fcntl
+import logging
+import os
+import queue
+import threading
+from pathlib import Path
+
+from django.db import connection
+
+from utils.codecs import get_codec
+from utils.kafka import get_event_message
+
+logger = logging.getLogger(__name__)
+
+codec = get_codec("json")
+
+
+class InMemoryEventStore:
+    """
+    Hands events straight to `handler` in this process, without a broker.
+    The handler is called with the message built by `get_event_message`,
+    synchronously or, with `background`, on a thread in the order events were
+    added.
+    """
+
+    def __init__(self, handler, *, background=False):
+        self.handler = handler
+        self.queue = None
+        if background:
+            self.queue = queue.Queue()
+            threading.Thread(
+                target=self.run_worker, name="event-bus", daemon=True
+            ).start()
+
+    def run_worker(self):
+        while True:
+            message = self.queue.get()
+            if message is None:
+                # The connection of this thread is not closed by Django.
+                connection.close()
+                self.queue.task_done()
+                return
+            try:
+                self.handler(message)
+            except Exception as e:
+                msg = f"Failed to handle message: {e}"
+                logger.exception(msg)
+            finally:
+                self.queue.task_done()
+
+    def add_event(self, event):
+        message = get_event_message(event)
+        if self.queue is None:
+            self.handler(message)
+        else:
+            self.queue.put(message)
+
+    def add_events(self, events):
+        for event in events:
+            self.add_event(event)
+
+    def join(self):
+        """
+        Wait until the queued events are handled.
+        """
+        if self.queue is not None:
+            self.queue.join()
+
+    def close(self):
+        """
+        Stop the worker once the queued events are handled.
+        """
+        if self.queue is not None:
+            self.queue.put(None)
+            self.join()
+            self.queue = None
+
+
+class FileEventStore:
+    """
+    Appends events to a local log file, one JSON message per line. Processes
+    sharing the file append whole lines under a lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def add_event(self, event):
+        self.add_events([event])
+
+    def add_events(self, events):
+        lines = b"".join(
+            codec.encode(get_event_message(event)) + b"\n" for event in events
+        )
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            os.write(fd, lines)
+        finally:
+            os.close(fd)
+
+
+def read_event_log(path):
+    """
+    Yield the messages of a log written by `FileEventStore`, oldest first.
+    """
+    with Path(path).open("rb") as f:
+        for line in f:
+            if line.strip():
+                yield codec.decode(line)
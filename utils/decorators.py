@@ -1,6 +1,3 @@
-import os
-from time import sleep
-
 from django.db import connection
 from django.db import reset_queries
 
@@ -22,18 +19,3 @@ def check_db_queries(logger=None):
         return wrapper
 
     return decorator
-
-
-def delay_return(delay=5):
-    if os.environ["DJANGO_SETTINGS_MODULE"] == "config.settings.test":
-        delay = 0
-
-    def decorator(func):
-        def wrapper(*func_args, **func_kwargs):
-            result = func(*func_args, **func_kwargs)
-            sleep(delay)
-            return result
-
-        return wrapper
-
-    return decorator
@@ -1,20 +1,96 @@
-import json
+import atexit
+import heapq
 import logging
 import signal
+import threading
 import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
+from django.conf import settings
+from kafka import ConsumerRebalanceListener
 from kafka import KafkaConsumer
 from kafka import KafkaProducer
+from kafka.admin import KafkaAdminClient
+from kafka.admin import NewTopic
+from kafka.coordinator.assignors.range import RangePartitionAssignor
+from kafka.coordinator.assignors.sticky.sticky_assignor import StickyPartitionAssignor
 from kafka.errors import KafkaError
+from kafka.errors import TopicAlreadyExistsError
+from kafka.structs import OffsetAndMetadata
+from kafka.structs import TopicPartition
 
-from utils.json import MessageEncoder
+from utils.codecs import CODEC_HEADER
+from utils.codecs import decode
+from utils.codecs import get_codec
+from utils.metrics import CONSUMER_BATCH_SECONDS
+from utils.metrics import CONSUMER_BATCH_SIZE
+from utils.metrics import CONSUMER_COMMIT_SECONDS
+from utils.metrics import CONSUMER_FAILURES
+from utils.metrics import CONSUMER_HANDLER_SECONDS
+from utils.metrics import CONSUMER_LAG
+from utils.metrics import CONSUMER_MESSAGES
+from utils.metrics import CONSUMER_POLL_RECORDS
+from utils.metrics import CONSUMER_THROTTLES
+from utils.relay import RelayClient
+from utils.spool import Spool
+from utils.spool import SpoolingProducer
 
 logger = logging.getLogger(__name__)
 
+# Headers of messages moved to retry and dead-letter topics
+ORIGINAL_TOPIC_HEADER = "original-topic"
+ORIGINAL_PARTITION_HEADER = "original-partition"
+ORIGINAL_OFFSET_HEADER = "original-offset"
+RETRY_ATTEMPT_HEADER = "retry-attempt"
+RETRY_AT_HEADER = "retry-at"
+ERROR_HEADER = "error"
+EVENT_TYPE_HEADER = "event-type"
+SCHEMA_VERSION_HEADER = "schema-version"
+
+
+def get_header(message, name):
+    for key, value in message.headers or []:
+        if key == name:
+            return value.decode("utf-8")
+    return None
+
+
+def has_event_type(message, event_types=None):
+    """
+    Whether the event type header of a message is one of `event_types`.
+    Messages without the header might be of any type.
+    """
+    if event_types is None:
+        return True
+    event_type = get_header(message, EVENT_TYPE_HEADER)
+    return event_type is None or event_type in event_types
+
+
+def get_event_type(message):
+    """
+    The event type of a decoded message, from its header or else its value.
+    """
+    event_type = get_header(message, EVENT_TYPE_HEADER)
+    if event_type is None and isinstance(message.value, dict):
+        event_type = message.value.get("type")
+    return event_type or "unknown"
+
 
 class Producer:
-    def __init__(self, **configs):
-        self.producer = KafkaProducer(**configs)
+    def __init__(self, codec, **configs):
+        self.codec = codec
+        self.producer = KafkaProducer(
+            value_serializer=self.serialize,
+            **configs,
+        )
+
+    def serialize(self, value):
+        # Tombstones are kept empty, and values already encoded as they are.
+        if value is None or isinstance(value, bytes):
+            return value
+        return self.codec.encode(value)
 
     def on_send_success(self, record_metadata):
         """
@@ -32,7 +108,9 @@ class Producer:
         """
         msg = f"Failed to send message: {exc}"
         logger.exception(msg)
-        # Optionally, implement retry logic or move message to a dead-letter queue
+
+    def flush(self, timeout=None):
+        self.producer.flush(timeout=timeout)
 
     def end(self):
         # Make sure all buffered messages are sent before closing
@@ -40,13 +118,20 @@ class Producer:
         self.producer.flush()
         self.producer.close()
 
-    def send(self, topic, message, message_key=None):
+    def send(self, topic, message, message_key=None, headers=None):
         """
-        Send a message to a Kafka topic.
+        Send a message to a Kafka topic. A message already encoded as bytes is
+        sent as it is, with the codec header of `headers`.
         """
+        headers = list(headers or [])
+        if not isinstance(message, bytes):
+            headers = [(k, v) for k, v in headers if k != CODEC_HEADER]
+            headers.append((CODEC_HEADER, self.codec.name.encode("utf-8")))
         try:
             # Asynchronous send with callback
-            future = self.producer.send(topic, key=message_key, value=message)
+            future = self.producer.send(
+                topic, key=message_key, value=message, headers=headers
+            )
             future.add_callback(self.on_send_success)
             future.add_errback(self.on_send_error)
         except KafkaError as e:
@@ -58,79 +143,588 @@ class Producer:
             return future
 
 
-def create_producer(bootstrap_servers):
+def create_producer(bootstrap_servers, codec=None, **configs):
     """
-    Create and configure a Kafka producer.
+    Create and configure a Kafka producer. Messages are encoded with `codec`,
+    `settings.KAFKA_CODEC` by default. `configs` override the defaults below.
     """
-    return Producer(
-        bootstrap_servers=bootstrap_servers,
-        acks="all",  # Wait for leader and all replicas to acknowledge
-        retries=5,  # Number of retries for transient errors
+    configs = {
+        "acks": "all",  # Wait for leader and all replicas to acknowledge
+        "retries": 5,  # Number of retries for transient errors
         # Ensure this is less than or equal to 5 if idempotence is enabled
-        max_in_flight_requests_per_connection=5,
-        compression_type="gzip",  # Compress messages for more efficient network usage
-        linger_ms=100,  # Delay sending for a short time to batch messages
-        batch_size=32 * 1024,  # Batch size in bytes (32 KB)
-        # Serialize message value
-        value_serializer=lambda v: json.dumps(v, cls=MessageEncoder).encode("utf-8"),
+        "max_in_flight_requests_per_connection": 5,
+        # Compress messages for more efficient network usage
+        "compression_type": "gzip",
+        "linger_ms": 100,  # Delay sending for a short time to batch messages
+        "batch_size": 32 * 1024,  # Batch size in bytes (32 KB)
         # Serialize message key
-        key_serializer=lambda k: k.encode("utf-8") if k else None,
+        "key_serializer": lambda k: k.encode("utf-8") if k else None,
+        **configs,
+    }
+    return Producer(
+        get_codec(codec or settings.KAFKA_CODEC),
+        bootstrap_servers=bootstrap_servers,
+        **configs,
     )
 
 
+class UndecodedValue:
+    """
+    Value of a message that failed to decode, with its raw `data`.
+    """
+
+    def __init__(self, data, error):
+        self.data = data
+        self.error = error
+
+    def __repr__(self):
+        return f"UndecodedValue({self.error!r})"
+
+
+def check_decoded(message):
+    if isinstance(message.value, UndecodedValue):
+        raise message.value.error
+
+
+def get_raw_value(message):
+    """
+    The value of a consumed message to produce again: decoded values are
+    encoded by the producer, while undecoded ones are sent as they were.
+    """
+    if isinstance(message.value, UndecodedValue):
+        return message.value.data
+    return message.value
+
+
+class PollSizer:
+    """
+    Sizes polls from how long handling them takes. While polls come back
+    full and are handled within `target_ms`, the size doubles up to
+    `max_records`, so that a backlog is handled in large batches; a slower
+    poll halves it, down to `min_records`. A full poll is followed by one
+    that does not wait, as more messages are likely buffered, and any other
+    by one that waits up to `idle_timeout_ms` for messages to arrive.
+    Handlers are saturated while handling a message takes longer than
+    `saturation_ms` on average. A single slow poll counts for at most twice
+    `saturation_ms`, and the average halves every `half_life` seconds spent
+    out of handlers, so that it recovers while consuming is paused or idle.
+    """
+
+    # Weight of the last poll in the average time to handle a message
+    smoothing = 0.2
+
+    # Seconds out of handlers for the average time to handle a message to halve
+    half_life = 5
+
+    def __init__(  # noqa: PLR0913
+        self,
+        min_records=10,
+        max_records=1000,
+        target_ms=1000,
+        saturation_ms=500,
+        idle_timeout_ms=1000,
+    ):
+        self.min_records = min_records
+        self.max_records = max_records
+        self.target_ms = target_ms
+        self.saturation_ms = saturation_ms
+        self.idle_timeout_ms = idle_timeout_ms
+        self.records = min(100, max_records)
+        self.timeout_ms = idle_timeout_ms
+        self.latency_ms = 0
+        self.observed_at = time.monotonic()
+
+    @property
+    def saturated(self):
+        return self.latency_ms > self.saturation_ms
+
+    def observe(self, count, seconds):
+        """
+        Adjust to a poll of `count` messages handled in `seconds`.
+        """
+        now = time.monotonic()
+        idle = max(now - self.observed_at - seconds, 0)
+        self.observed_at = now
+        self.latency_ms *= 0.5 ** (idle / self.half_life)
+        full = count >= self.records
+        self.timeout_ms = 0 if full else self.idle_timeout_ms
+        if not count:
+            return
+        if seconds * 1000 > self.target_ms:
+            self.records = max(self.records // 2, self.min_records)
+        elif full:
+            self.records = min(self.records * 2, self.max_records)
+        latency_ms = min(seconds * 1000 / count, self.saturation_ms * 2)
+        self.latency_ms += self.smoothing * (latency_ms - self.latency_ms)
+
+
+class RebalanceListener(ConsumerRebalanceListener):
+    """
+    Commits the offsets of processed messages of partitions about to be
+    revoked, so that their next consumer does not process them again.
+    Partitions are only revoked while polling, so no messages of theirs are
+    being processed then.
+    """
+
+    def __init__(self, consumer):
+        self.consumer = consumer
+
+    def on_partitions_revoked(self, revoked):
+        self.consumer.on_revoke(set(revoked))
+
+    def on_partitions_assigned(self, assigned):
+        msg = f"Assigned partitions: {sorted(assigned)}"
+        logger.info(msg)
+
+
 class Consumer:
     RUNNING = True
 
-    def __init__(self, *topics, **configs):
-        self.consumer = KafkaConsumer(*topics, **configs)
+    # Longest time to pause consuming while handlers are saturated, in seconds
+    max_throttle = 30
+
+    def __init__(  # noqa: PLR0913
+        self,
+        *topics,
+        workers=1,
+        producer=None,
+        retry_delays=(),
+        event_types=None,
+        sizer=None,
+        **configs,
+    ):
+        """
+        With a `producer`, failed messages are moved to a retry topic per delay
+        in `retry_delays` (in seconds) and finally to a dead-letter topic,
+        instead of being raised. With `event_types`, messages whose event type
+        header names another type are skipped without being decoded. Polls
+        are sized by `sizer`, a `PollSizer`.
+        """
+        self.group_id = configs.get("group_id")
+        # Label of the metrics of this consumer
+        self.group = self.group_id or ""
+        self.workers = workers
+        self.event_types = event_types
+        self.producer = producer
+        self.retry_delays = retry_delays
+        # retry partitions paused until their next message is due
+        self.paused = {}
+        self.sizer = sizer or PollSizer()
+        # partitions paused while handlers are saturated, and until when
+        self.throttled = set()
+        self.throttled_until = 0
+        self.throttle = 0
+        # offsets last committed, or being committed, per partition
+        self.offsets = {}
+        if producer:
+            topics = (*topics, *self.retry_topics)
+        self.consumer = self.connect(topics, configs)
+
+    def connect(self, topics, configs):
+        consumer = KafkaConsumer(**configs)
+        if topics:
+            consumer.subscribe(topics=list(topics), listener=RebalanceListener(self))
+        return consumer
+
+    @property
+    def retry_topics(self):
+        return [
+            f"{self.group_id}.retry.{i}" for i in range(1, len(self.retry_delays) + 1)
+        ]
+
+    @property
+    def dead_letter_topic(self):
+        return f"{self.group_id}.dlq"
 
     def handle_shutdown_signal(self, signum, frame):
         """
         Signal handler for graceful shutdown on receiving SIGTERM or SIGINT.
         """
         logger.info("Received shutdown signal, stopping consumer...")
+        self.stop()
+
+    def stop(self):
         self.RUNNING = False
 
-    def commit_offsets(self):
+    def commit_offsets(self, offsets):
+        """
+        Commit offsets after processing a batch of messages, without waiting
+        for the broker. A failed commit is covered by the next one.
+        """
+        self.offsets.update(offsets)
+        try:
+            self.consumer.commit_async(
+                offsets, callback=partial(self.on_commit, time.monotonic())
+            )
+        except Exception as e:
+            msg = f"Failed to commit offsets: {e}"
+            logger.exception(msg)
+
+    def on_commit(self, start, offsets, response):
+        CONSUMER_COMMIT_SECONDS.labels(self.group).observe(time.monotonic() - start)
+        if isinstance(response, Exception):
+            msg = f"Failed to commit offsets: {response}"
+            logger.warning(msg)
+        else:
+            logger.debug("Offsets committed successfully.")
+
+    def commit_sync(self, partitions=None):
         """
-        Commit offsets manually after processing a batch of messages.
+        Commit the offsets of processed messages of `partitions`, or all, and
+        wait for the broker, as the last commit before partitions are given
+        up.
         """
+        offsets = {
+            tp: offset
+            for tp, offset in self.offsets.items()
+            if partitions is None or tp in partitions
+        }
+        if not offsets:
+            return
         try:
-            self.consumer.commit()
+            with CONSUMER_COMMIT_SECONDS.labels(self.group).time():
+                self.consumer.commit(offsets)
             logger.info("Offsets committed successfully.")
         except Exception as e:
             msg = f"Failed to commit offsets: {e}"
             logger.exception(msg)
 
-    def start_consuming(self, on_message=None):
+    def on_revoke(self, revoked):
+        msg = f"Revoking partitions: {sorted(revoked)}"
+        logger.info(msg)
+        self.commit_sync(revoked)
+        self.forget(revoked)
+
+    def forget(self, partitions):
+        """
+        Drop the state kept for partitions no longer assigned. Partitions
+        assigned again start unpaused.
+        """
+        for tp in partitions:
+            self.offsets.pop(tp, None)
+            self.paused.pop(tp, None)
+        self.throttled -= partitions
+
+    def accepts(self, message):
+        return has_event_type(message, self.event_types)
+
+    def poll(self, timeout_ms=1000, max_records=None):
+        """
+        Poll for messages, decoding each value with the codec named in its
+        headers.
+        """
+        message_batch = self.consumer.poll(
+            timeout_ms=timeout_ms, max_records=max_records
+        )
+        return self.decode_batch(message_batch)
+
+    def decode_message(self, message):
+        """
+        Decode the value of a message. A value that fails to decode is kept
+        as an `UndecodedValue`, so that the message fails when processed and
+        is retried or dead-lettered like any other.
+        """
+        try:
+            value = decode(message.value, message.headers)
+        except Exception as e:  # noqa: BLE001
+            value = UndecodedValue(message.value, e)
+        return self.with_value(message, value)
+
+    def with_value(self, message, value):
+        return message._replace(value=value)
+
+    def decode_batch(self, message_batch):
+        message_batch = {
+            tp: [
+                self.decode_message(message)
+                for message in messages
+                if self.accepts(message)
+            ]
+            for tp, messages in message_batch.items()
+        }
+        message_batch = {
+            tp: messages for tp, messages in message_batch.items() if messages
+        }
+        for tp, messages in message_batch.items():
+            for message in messages:
+                CONSUMER_MESSAGES.labels(
+                    self.group, tp.topic, get_event_type(message)
+                ).inc()
+        return message_batch
+
+    def update_lag(self):
+        """
+        Set the lag of each assigned partition, from the high watermark of the
+        last fetch.
+        """
+        for tp in self.consumer.assignment():
+            highwater = self.consumer.highwater(tp)
+            if highwater is None:
+                continue
+            lag = max(highwater - self.consumer.position(tp), 0)
+            CONSUMER_LAG.labels(self.group, tp.topic, tp.partition).set(lag)
+
+    def observe_poll(self, message_batch):
+        self.update_lag()
+        self.observe_batch(message_batch)
+
+    def observe_batch(self, message_batch):
+        if message_batch:
+            CONSUMER_BATCH_SIZE.labels(self.group).observe(
+                sum(len(messages) for messages in message_batch.values())
+            )
+
+    def process_message(self, message, on_message=None):
+        try:
+            # Process each message
+            msg = f"Processing message {message.topic}:{message.offset}"
+            logger.debug(msg)
+            check_decoded(message)
+            if on_message:
+                event_type = get_event_type(message)
+                with CONSUMER_HANDLER_SECONDS.labels(self.group, event_type).time():
+                    on_message(message)
+        except Exception as e:
+            msg = f"Failed to process message: {e}"
+            logger.exception(msg)
+            if not self.producer:
+                raise
+            self.dead_letter(message, e)
+
+    def dead_letter(self, message, exc):
+        """
+        Move a failed message to the next retry topic, or to the dead-letter
+        topic once all retries are used. The headers keep the error and where
+        the message was originally consumed from.
+        """
+        headers = dict(message.headers or [])
+        headers.setdefault(ORIGINAL_TOPIC_HEADER, message.topic.encode("utf-8"))
+        headers.setdefault(ORIGINAL_PARTITION_HEADER, str(message.partition).encode())
+        headers.setdefault(ORIGINAL_OFFSET_HEADER, str(message.offset).encode())
+        attempt = int(get_header(message, RETRY_ATTEMPT_HEADER) or 0)
+        headers[RETRY_ATTEMPT_HEADER] = str(attempt + 1).encode()
+        headers[ERROR_HEADER] = f"{type(exc).__name__}: {exc}"[:1000].encode("utf-8")
+        if attempt < len(self.retry_delays):
+            topic = self.retry_topics[attempt]
+            retry_at = time.time() + self.retry_delays[attempt]
+            headers[RETRY_AT_HEADER] = str(retry_at).encode()
+        else:
+            topic = self.dead_letter_topic
+            headers.pop(RETRY_AT_HEADER, None)
+        key = message.key.decode("utf-8") if message.key else None
+        future = self.producer.send(
+            topic,
+            get_raw_value(message),
+            message_key=key,
+            headers=list(headers.items()),
+        )
+        # The message is committed as processed, so it must not get lost.
+        future.get(timeout=30)
+        CONSUMER_FAILURES.labels(self.group, topic).inc()
+        msg = f"Message {message.topic}:{message.offset} moved to {topic}"
+        logger.warning(msg)
+
+    def hold_back(self, message_batch):
+        """
+        Resume retry partitions whose next message is due, and pause the ones
+        whose next message is not. Returns the batch without the messages that
+        are not due yet; they are consumed again after resuming.
+        """
+        now = time.time()
+        for tp, retry_at in list(self.paused.items()):
+            if retry_at <= now:
+                self.consumer.resume(tp)
+                del self.paused[tp]
+
+        batch = {}
+        for tp, messages in message_batch.items():
+            for i, message in enumerate(messages):
+                retry_at = get_header(message, RETRY_AT_HEADER)
+                if retry_at and float(retry_at) > now:
+                    self.consumer.seek(tp, message.offset)
+                    self.consumer.pause(tp)
+                    self.paused[tp] = float(retry_at)
+                    messages = messages[:i]  # noqa: PLW2901
+                    break
+            if messages:
+                batch[tp] = messages
+        return batch
+
+    def process_serially(self, message_batch, on_message):
+        messages = [
+            message for messages in message_batch.values() for message in messages
+        ]
+        for i, message in enumerate(messages):
+            try:
+                self.process_message(message, on_message)
+            except Exception:
+                # The failed message and the ones after it are consumed again.
+                self.commit_offsets(self.rewind(message_batch, [messages[i:]]))
+                raise
+
+        # Commit offsets after processing the batch
+        self.commit_offsets(self.rewind(message_batch, []))
+
+    def process_batch(self, message_batch, on_batch, on_message=None):
+        """
+        Process all messages of a poll at once. If that fails and `on_message`
+        is given, the messages are processed one by one, so that only the
+        failing ones are retried.
+        """
+        messages = [
+            message for messages in message_batch.values() for message in messages
+        ]
+        try:
+            msg = f"Processing batch of {len(messages)} messages"
+            logger.info(msg)
+            with CONSUMER_BATCH_SECONDS.labels(self.group).time():
+                on_batch(messages)
+        except Exception as e:
+            msg = f"Failed to process batch: {e}"
+            logger.exception(msg)
+            if not (self.producer and on_message):
+                self.rewind(message_batch, [messages])
+                raise
+            self.process_serially(message_batch, on_message)
+        else:
+            self.commit_offsets(self.rewind(message_batch, []))
+
+    def process_in_parallel(self, executor, message_batch, on_message):
+        """
+        Process a poll in `self.workers` threads. Messages with the same key are
+        processed by the same thread, in order. When a message fails, the rest
+        of its thread's messages are left unprocessed.
+        Commits, per partition, up to the lowest unprocessed offset and seeks
+        back to it, so that it is consumed again. Returns True if all messages
+        are processed.
+        """
+        lanes = self.get_lanes(message_batch)
+
+        def process_lane(lane):
+            for i, message in enumerate(lane):
+                try:
+                    self.process_message(message, on_message)
+                except Exception:  # noqa: BLE001
+                    return lane[i:]
+            return []
+
+        offsets = self.rewind(message_batch, executor.map(process_lane, lanes.values()))
+        self.commit_offsets(offsets)
+        return all(
+            offsets[tp].offset == messages[-1].offset + 1
+            for tp, messages in message_batch.items()
+        )
+
+    def get_lanes(self, message_batch):
+        """
+        Split a poll into one list of messages per worker, by key.
+        """
+        lanes = defaultdict(list)
+        for messages in message_batch.values():
+            for message in messages:
+                lanes[hash(message.key) % self.workers].append(message)
+        return lanes
+
+    def rewind(self, message_batch, unprocessed_lanes):
+        """
+        Seek each partition back to its lowest unprocessed offset, so that it
+        is consumed again. Returns the offsets to commit.
+        """
+        unprocessed = defaultdict(list)
+        for lane in unprocessed_lanes:
+            for message in lane:
+                unprocessed[(message.topic, message.partition)].append(message.offset)
+
+        offsets = {}
+        for tp, messages in message_batch.items():
+            if unprocessed[(tp.topic, tp.partition)]:
+                offset = min(unprocessed[(tp.topic, tp.partition)])
+                self.consumer.seek(tp, offset)
+            else:
+                offset = messages[-1].offset + 1
+            offsets[tp] = OffsetAndMetadata(offset, None)
+        return offsets
+
+    def process(self, executor, message_batch, on_message=None, on_batch=None):
+        """
+        Process a poll as `start_consuming` describes. Returns True if all
+        messages are processed.
+        """
+        if on_batch:
+            self.process_batch(message_batch, on_batch, on_message)
+        elif executor:
+            return self.process_in_parallel(executor, message_batch, on_message)
+        else:
+            self.process_serially(message_batch, on_message)
+        return True
+
+    def adapt(self, message_batch, seconds):
+        """
+        Size the next poll from how long this one took to process, and pause
+        consuming while handlers are saturated, for twice as long each time
+        in a row.
+        """
+        count = sum(len(messages) for messages in message_batch.values())
+        self.sizer.observe(count, seconds)
+        CONSUMER_POLL_RECORDS.labels(self.group).set(self.sizer.records)
+        if not count:
+            return
+        if not self.sizer.saturated:
+            self.throttle = 0
+            return
+        self.throttle = min(max(self.throttle * 2, 1), self.max_throttle)
+        self.throttled = set(self.consumer.assignment()) - set(self.paused)
+        self.throttled_until = time.monotonic() + self.throttle
+        self.consumer.pause(*self.throttled)
+        CONSUMER_THROTTLES.labels(self.group).inc()
+        msg = (
+            f"Handlers are saturated ({self.sizer.latency_ms:.0f}ms per message),"
+            f" pausing for {self.throttle}s"
+        )
+        logger.warning(msg)
+
+    def release(self):
+        """
+        Resume the partitions paused by `adapt` once their time is up.
+        """
+        if self.throttled and time.monotonic() >= self.throttled_until:
+            self.consumer.resume(*(self.throttled & set(self.consumer.assignment())))
+            self.throttled = set()
+
+    def start_consuming(self, on_message=None, on_batch=None):
+        """
+        Consume messages, calling `on_message` for each message, or `on_batch`
+        once with all messages of a poll when given. With more than one worker,
+        `on_message` is called from a pool of threads.
+        Retry topics are consumed as any other topic, once their messages are
+        due.
+        """
         # Setup signal handling for graceful shutdown
         signal.signal(signal.SIGTERM, self.handle_shutdown_signal)
         signal.signal(signal.SIGINT, self.handle_shutdown_signal)
+        executor = None
+        if self.workers > 1:
+            executor = ThreadPoolExecutor(max_workers=self.workers)
 
         try:
             while self.RUNNING:
                 # Poll for new messages
                 try:
-                    message_batch = self.consumer.poll(timeout_ms=1000)
-
-                    if message_batch:
-                        for messages in message_batch.values():
-                            for message in messages:
-                                try:
-                                    # Process each message
-                                    msg = f"Processing message: {message.value}"
-                                    logger.info(msg)
-                                    if on_message:
-                                        on_message(message)
-                                except Exception as e:
-                                    msg = f"Failed to process message: {e}"
-                                    logger.exception(msg)
-                                    raise
-                                    # TODO: We should not raise. We have to move to DLQ
-                                    # Optionally, log the offset or take further action
-
-                        # Commit offsets after processing the batch
-                        self.commit_offsets()
+                    self.release()
+                    message_batch = self.poll(
+                        timeout_ms=self.sizer.timeout_ms,
+                        max_records=self.sizer.records,
+                    )
+                    message_batch = self.hold_back(message_batch)
+                    self.observe_poll(message_batch)
+                    start = time.monotonic()
+                    done = not message_batch or self.process(
+                        executor, message_batch, on_message, on_batch
+                    )
+                    self.adapt(message_batch, time.monotonic() - start)
+                    if not done:
+                        # Sleep to avoid rapid retries of failed messages
+                        time.sleep(5)
 
                 except Exception as e:
                     msg = f"Error occurred while consuming messages: {e}"
@@ -141,41 +735,293 @@ class Consumer:
         finally:
             # Clean up and close the consumer
             logger.info("Closing consumer...")
+            if executor:
+                executor.shutdown()
+            self.commit_sync()
+            if self.producer:
+                self.producer.end()
             self.consumer.close()
 
 
-def create_consumer(bootstrap_servers, group_id, topics=None):
+def create_consumer(  # noqa: PLR0913
+    bootstrap_servers,
+    group_id,
+    topics=None,
+    workers=1,
+    retry_delays=None,
+    event_types=None,
+):
     """
-    Create and configure a Kafka consumer.
+    Create and configure a Kafka consumer. Failed messages are retried after
+    each of `retry_delays` and then dead-lettered, unless it is None. Only
+    messages of `event_types` are consumed, if given.
     """
     topics = topics or []
+    producer = None
+    if retry_delays is not None:
+        producer = create_producer(bootstrap_servers)
     return Consumer(
         *topics,
+        workers=workers,
+        producer=producer,
+        retry_delays=retry_delays or (),
+        event_types=event_types,
         bootstrap_servers=bootstrap_servers,
         # Start from the earliest message if no offsets are committed
         auto_offset_reset="earliest",
+        # Keep partitions with their consumer across rebalances, such as the
+        # ones of rolling deploys. Range is kept for members not upgraded yet.
+        partition_assignment_strategy=(
+            StickyPartitionAssignor,
+            RangePartitionAssignor,
+        ),
         # Manually commit offsets, providing control over when a message is
         # considered processed.
         enable_auto_commit=False,
-        value_deserializer=lambda m: json.loads(m.decode("utf-8")),
         group_id=group_id,
         auto_commit_interval_ms=5000,  # default is 5000 milliseconds
-        max_poll_records=100,  # Number of messages to fetch in one poll
+        # Polls are sized from the time handling them takes
+        sizer=PollSizer(
+            min_records=settings.KAFKA_POLL_MIN_RECORDS,
+            max_records=settings.KAFKA_POLL_MAX_RECORDS,
+            target_ms=settings.KAFKA_POLL_TARGET_MS,
+            saturation_ms=settings.KAFKA_SATURATION_MS,
+        ),
+        max_poll_records=settings.KAFKA_POLL_MAX_RECORDS,
         session_timeout_ms=30000,  # Consumer session timeout
         # Heartbeat to the broker to avoid session timeout
         heartbeat_interval_ms=10000,
     )
 
 
+def create_compacted_topic(bootstrap_servers, topic, partitions, replicas):
+    """
+    Create a log-compacted topic, keeping only the last message of each key,
+    unless it exists.
+    """
+    admin = KafkaAdminClient(bootstrap_servers=bootstrap_servers)
+    try:
+        admin.create_topics(
+            [
+                NewTopic(
+                    topic,
+                    num_partitions=partitions,
+                    replication_factor=replicas,
+                    topic_configs={"cleanup.policy": "compact"},
+                )
+            ]
+        )
+    except TopicAlreadyExistsError:
+        pass
+    finally:
+        admin.close()
+
+
+def interleave(records, key):
+    """
+    Merge records of different partitions and topics in the order of `key`,
+    keeping the order of each partition, which is the order its records were
+    produced in even when the clocks of their producers disagree.
+    """
+    partitions = defaultdict(list)
+    for record in records:
+        partitions[record.topic, record.partition].append(record)
+    return list(heapq.merge(*partitions.values(), key=key))
+
+
+def read_topics(
+    bootstrap_servers, topics, since=None, event_types=None, *, decode_values=True
+):
+    """
+    Read the messages of `topics` from the beginning, or from `since` (a
+    datetime), up to the last message at the time of the call. Messages are
+    decoded, unless `decode_values` is false, and yielded in order per
+    partition. No offsets are committed.
+    """
+    consumer = KafkaConsumer(
+        bootstrap_servers=bootstrap_servers, enable_auto_commit=False
+    )
+    try:
+        partitions = [
+            TopicPartition(topic, partition)
+            for topic in topics
+            for partition in consumer.partitions_for_topic(topic) or ()
+        ]
+        consumer.assign(partitions)
+        end_offsets = consumer.end_offsets(partitions)
+        if since is None:
+            consumer.seek_to_beginning(*partitions)
+        else:
+            timestamp = int(since.timestamp() * 1000)
+            offsets = consumer.offsets_for_times(dict.fromkeys(partitions, timestamp))
+            for tp, offset in offsets.items():
+                consumer.seek(tp, offset.offset if offset else end_offsets[tp])
+        remaining = {tp for tp in partitions if consumer.position(tp) < end_offsets[tp]}
+        while remaining:
+            message_batch = consumer.poll(timeout_ms=1000, max_records=5000)
+            for tp, messages in message_batch.items():
+                for message in messages:
+                    if message.offset >= end_offsets[tp] or not has_event_type(
+                        message, event_types
+                    ):
+                        continue
+                    if decode_values:
+                        value = decode(message.value, message.headers)
+                        message = message._replace(value=value)  # noqa: PLW2901
+                    yield message
+                if consumer.position(tp) >= end_offsets[tp]:
+                    remaining.discard(tp)
+                    consumer.pause(tp)
+    finally:
+        consumer.close()
+
+
+def get_event_message(event):
+    """
+    Build the message published for an event.
+    """
+    return {
+        "id": event.id,
+        "type": event.name,
+        "key": event.key,
+        "payload": event.data,
+        "timestamp": event.timestamp,
+        "schema_version": event.schema_version,
+    }
+
+
+def get_message_headers(message):
+    """
+    Build the headers of an event message, so that consumers can route or skip
+    it without decoding it.
+    """
+    return [
+        (EVENT_TYPE_HEADER, message["type"].encode("utf-8")),
+        (SCHEMA_VERSION_HEADER, str(message.get("schema_version", 1)).encode()),
+    ]
+
+
+def create_event_producer(bootstrap_servers, spool_dir=None, **configs):
+    """
+    Create a producer for events. With `spool_dir`, sends do not block while
+    Kafka is unreachable; events are spooled to disk instead.
+    """
+    if not spool_dir:
+        return create_producer(bootstrap_servers, **configs)
+    configs.setdefault("max_block_ms", settings.EVENT_SPOOL_MAX_BLOCK_MS)
+    producer = create_producer(bootstrap_servers, **configs)
+    spool = Spool(spool_dir, settings.EVENT_SPOOL_MAX_BYTES)
+    return SpoolingProducer(producer, spool)
+
+
 class KafkaEventStore:
-    def __init__(self, bootstrap_servers):
-        self.producer = create_producer(bootstrap_servers)
+    def __init__(
+        self, bootstrap_servers, spool_dir=None, relay_socket=None, coalesce_ms=0
+    ):
+        """
+        With `coalesce_ms`, events of a coalescable type are held back for that
+        long and merged with the following ones of the same key. Any other
+        event of the key sends the held back one first, so the order is kept.
+        """
+        if relay_socket:
+            # Events are sent by the `eventrelay` process of this host.
+            self.producer = RelayClient(
+                relay_socket,
+                lambda: create_event_producer(bootstrap_servers, spool_dir),
+            )
+        else:
+            self.producer = create_event_producer(bootstrap_servers, spool_dir)
+        self.coalesce_ms = coalesce_ms
+        # held back messages and when to send them, per key
+        self.pending = {}
+        self.condition = threading.Condition()
+        self.flusher = None
+        if coalesce_ms:
+            atexit.register(self.flush)
+
+    def send(self, topic, message, key):
+        return self.producer.send(
+            topic, message, message_key=key, headers=get_message_headers(message)
+        )
 
     def add_event(self, event):
-        body = {
-            "type": event.name,
-            "key": event.key,
-            "payload": event.data,
-            "timestamp": time.time(),
-        }
-        return self.producer.send(event.topic, body, message_key=event.key)
+        body = get_event_message(event)
+        if not self.coalesce_ms:
+            return self.send(event.topic, body, event.key)
+        with self.condition:
+            pending = self.pending.pop(event.key, None)
+            if pending and event.coalescable:
+                deadline, topic, message = pending
+                body = merge_event_messages(message, body)
+                self.pending[event.key] = (deadline, topic, body)
+                return None
+            if pending:
+                self.send(pending[1], pending[2], event.key)
+            if event.coalescable:
+                deadline = time.monotonic() + self.coalesce_ms / 1000
+                self.pending[event.key] = (deadline, event.topic, body)
+                self.start_flusher()
+                self.condition.notify()
+                return None
+            return self.send(event.topic, body, event.key)
+
+    def add_events(self, events):
+        # The producer batches the messages, per partition.
+        return [self.add_event(event) for event in events]
+
+    def start_flusher(self):
+        # Threads do not survive a fork, so check the flusher is still there.
+        if self.flusher is None or not self.flusher.is_alive():
+            self.flusher = threading.Thread(
+                target=self.run_flusher, name="event-coalescer", daemon=True
+            )
+            self.flusher.start()
+
+    def run_flusher(self):
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                for key, (deadline, topic, message) in list(self.pending.items()):
+                    if deadline <= now:
+                        del self.pending[key]
+                        self.send_pending(topic, message, key)
+                deadlines = [deadline for deadline, _, _ in self.pending.values()]
+                timeout = min(deadlines) - now if deadlines else None
+                self.condition.wait(timeout)
+
+    def send_pending(self, topic, message, key):
+        try:
+            self.send(topic, message, key)
+        except Exception as e:
+            msg = f"Failed to send coalesced message: {e}"
+            logger.exception(msg)
+
+    def flush(self):
+        """
+        Send the held back messages now.
+        """
+        with self.condition:
+            while self.pending:
+                key, (_, topic, message) = self.pending.popitem()
+                self.send_pending(topic, message, key)
+
+
+def merge_event_messages(message, later):
+    """
+    Merge two event messages of the same key into one, as if only the later
+    one was produced with the payloads of both.
+    """
+    return {
+        **later,
+        "payload": {**message["payload"], **later["payload"]},
+        "merged_ids": [*get_event_ids(message), *later.get("merged_ids", [])],
+    }
+
+
+def get_event_ids(message):
+    """
+    Ids of the events an event message stands for, including the ones merged
+    into it. Events published before ids were introduced have none.
+    """
+    event_id = message.get("id")
+    return [*message.get("merged_ids", []), *([event_id] if event_id else [])]
@@ -0,0 +1,92 @@
+import logging
+import threading
+import time
+
+from prometheus_client import REGISTRY
+from prometheus_client import Counter
+from prometheus_client import Gauge
+from prometheus_client import Histogram
+from prometheus_client import start_http_server
+from prometheus_client import write_to_textfile
+
+logger = logging.getLogger(__name__)
+
+CONSUMER_LAG = Gauge(
+    "kafka_consumer_lag",
+    "Messages of a partition not consumed yet",
+    ["group", "topic", "partition"],
+)
+CONSUMER_MESSAGES = Counter(
+    "kafka_consumer_messages_total",
+    "Messages consumed",
+    ["group", "topic", "event_type"],
+)
+CONSUMER_HANDLER_SECONDS = Histogram(
+    "kafka_consumer_handler_seconds",
+    "Time spent handling a message",
+    ["group", "event_type"],
+)
+CONSUMER_BATCH_SIZE = Histogram(
+    "kafka_consumer_batch_size",
+    "Messages of a poll handled at once",
+    ["group"],
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+CONSUMER_BATCH_SECONDS = Histogram(
+    "kafka_consumer_batch_seconds",
+    "Time spent handling a batch of messages",
+    ["group"],
+)
+CONSUMER_COMMIT_SECONDS = Histogram(
+    "kafka_consumer_commit_seconds",
+    "Time spent committing offsets",
+    ["group"],
+)
+CONSUMER_POLL_RECORDS = Gauge(
+    "kafka_consumer_poll_records",
+    "Most messages the next poll returns",
+    ["group"],
+)
+CONSUMER_THROTTLES = Counter(
+    "kafka_consumer_throttles_total",
+    "Times consuming was paused as handlers were saturated",
+    ["group"],
+)
+CONSUMER_FAILURES = Counter(
+    "kafka_consumer_failures_total",
+    "Messages that failed to be handled, by the topic they were moved to",
+    ["group", "destination"],
+)
+
+
+def start_textfile_writer(path, interval=15, registry=REGISTRY):
+    """
+    Write the metrics to `path` every `interval` seconds, for the textfile
+    collector of the node exporter.
+    """
+
+    def run():
+        while True:
+            try:
+                write_to_textfile(path, registry)
+            except OSError as e:
+                msg = f"Failed to write metrics to {path}: {e}"
+                logger.warning(msg)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name="metrics-writer", daemon=True)
+    thread.start()
+    return thread
+
+
+def serve_metrics(port=None, textfile=None):
+    """
+    Expose the metrics of this process on an HTTP `port` and/or in a
+    `textfile`.
+    """
+    if port:
+        start_http_server(port)
+        msg = f"Serving metrics on port {port}"
+        logger.info(msg)
+    if textfile:
+        start_textfile_writer(textfile)
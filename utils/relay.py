@@ -0,0 +1,160 @@
+import logging
+import socket
+import socketserver
+import struct
+import threading
+from pathlib import Path
+
+from utils.codecs import get_codec
+from utils.spool import SPOOLED
+
+logger = logging.getLogger(__name__)
+
+# Each frame is prefixed with its length
+FRAME_HEADER = struct.Struct(">I")
+ACCEPTED = b"\x00"
+REJECTED = b"\x01"
+# Accepted, but spooled until Kafka is reachable again
+ACCEPTED_SPOOLED = b"\x02"
+
+codec = get_codec("msgpack")
+
+
+class RelayError(Exception):
+    pass
+
+
+def read_exactly(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionResetError
+        data += chunk
+    return data
+
+
+def read_frame(sock):
+    (length,) = FRAME_HEADER.unpack(read_exactly(sock, FRAME_HEADER.size))
+    return codec.decode(read_exactly(sock, length))
+
+
+def write_frame(sock, record):
+    data = codec.encode(record)
+    sock.sendall(FRAME_HEADER.pack(len(data)) + data)
+
+
+class RelayHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                record = read_frame(self.request)
+            except ConnectionError:
+                return
+            if record["headers"]:
+                record["headers"] = [tuple(header) for header in record["headers"]]
+            try:
+                result = self.server.producer.send(**record)
+            except Exception as e:  # noqa: BLE001
+                msg = f"Failed to relay message: {e}"
+                logger.warning(msg)
+                self.request.sendall(REJECTED)
+            else:
+                self.request.sendall(
+                    ACCEPTED_SPOOLED if result is SPOOLED else ACCEPTED
+                )
+
+
+class RelayServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Accepts messages from the processes of this host over a Unix socket and
+    sends them with a single producer, so that they share its connections
+    and batches.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, producer):
+        self.producer = producer
+        Path(path).unlink(missing_ok=True)
+        super().__init__(path, RelayHandler)
+
+
+class RelayClient:
+    """
+    Sends messages to the `eventrelay` command over its Unix socket. A message
+    is sent once the relay has handed it to its producer. If the relay can
+    not be reached, messages are sent with a producer of this process, made
+    by `fallback`.
+    """
+
+    def __init__(self, path, fallback, timeout=5):
+        self.path = path
+        self.fallback = fallback
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.sock = None
+        self.producer = None
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def relay(self, record):
+        with self.lock:
+            try:
+                if self.sock is None:
+                    self.sock = self.connect()
+                write_frame(self.sock, record)
+                reply = read_exactly(self.sock, 1)
+            except OSError:
+                self.close()
+                raise
+        if reply not in (ACCEPTED, ACCEPTED_SPOOLED):
+            msg = "The event relay rejected the message."
+            raise RelayError(msg)
+        return reply
+
+    def send(self, topic, message, message_key=None, headers=None):
+        """
+        Send a message through the relay. Returns `SPOOLED` if the relay
+        spooled the message, or the result of the fallback producer if it sent
+        the message.
+        """
+        record = {
+            "topic": topic,
+            "message": message,
+            "message_key": message_key,
+            "headers": headers,
+        }
+        try:
+            reply = self.relay(record)
+        except OSError as e:
+            msg = f"Event relay is unreachable, sending directly: {e}"
+            logger.warning(msg)
+        else:
+            return SPOOLED if reply == ACCEPTED_SPOOLED else None
+        with self.lock:
+            if self.producer is None:
+                self.producer = self.fallback()
+        return self.producer.send(**record)
+
+    def flush(self, timeout=None):
+        if self.producer is not None:
+            self.producer.flush(timeout=timeout)
+
+    def end(self):
+        self.close()
+        if self.producer is not None:
+            self.producer.end()
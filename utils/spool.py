@@ -0,0 +1,248 @@
+import contextlib
+import fcntl
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+
+from kafka.errors import KafkaError
+
+from utils.codecs import get_codec
+
+logger = logging.getLogger(__name__)
+
+# Each record is prefixed with its length and CRC32
+RECORD_HEADER = struct.Struct(">II")
+SEGMENT_SUFFIX = ".spool"
+
+codec = get_codec("msgpack")
+
+# Returned by `SpoolingProducer.send` when a message is spooled
+SPOOLED = object()
+
+
+class SpoolFullError(Exception):
+    pass
+
+
+class Segment:
+    """
+    An append-only file of spooled records. A segment is locked while it is
+    written or drained, so that other processes sharing the spool directory
+    leave it alone.
+    """
+
+    def __init__(self, path, fd):
+        self.path = path
+        self.fd = fd
+
+    @classmethod
+    def create(cls, directory):
+        name = f"{time.time_ns():020d}-{os.getpid()}{SEGMENT_SUFFIX}"
+        path = directory / name
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return cls(path, fd)
+
+    @classmethod
+    def claim(cls, path):
+        """
+        Lock an existing segment for draining, or return None if it is in use.
+        """
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        if not path.exists():
+            # Drained and removed by another process meanwhile
+            os.close(fd)
+            return None
+        return cls(path, fd)
+
+    def append(self, data):
+        os.write(self.fd, RECORD_HEADER.pack(len(data), zlib.crc32(data)) + data)
+
+    def records(self):
+        data = self.path.read_bytes()
+        offset = 0
+        while offset + RECORD_HEADER.size <= len(data):
+            length, crc = RECORD_HEADER.unpack_from(data, offset)
+            offset += RECORD_HEADER.size
+            record = data[offset : offset + length]
+            if len(record) < length or zlib.crc32(record) != crc:
+                # A write cut short by a crash; nothing follows it.
+                msg = f"Truncated record in spool segment {self.path}"
+                logger.warning(msg)
+                return
+            offset += length
+            yield codec.decode(record)
+
+    def close(self):
+        os.close(self.fd)
+
+    def remove(self):
+        self.path.unlink(missing_ok=True)
+        self.close()
+
+
+class Spool:
+    """
+    A bounded on-disk queue of messages that could not be handed to Kafka.
+    Messages are appended to segment files in `directory` and read back in
+    order, oldest segment first.
+    """
+
+    def __init__(self, directory, max_bytes, segment_bytes=1024 * 1024):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.lock = threading.Lock()
+        self.segment = None
+        self.segment_size = 0
+        self.size = self.get_size()
+        # Whether messages appended by this process may still be in the spool
+        self.pending = False
+
+    def get_paths(self):
+        return sorted(self.directory.glob(f"*{SEGMENT_SUFFIX}"))
+
+    def get_size(self):
+        size = 0
+        for path in self.get_paths():
+            with contextlib.suppress(FileNotFoundError):
+                size += path.stat().st_size
+        return size
+
+    def append(self, record):
+        data = codec.encode(record)
+        with self.lock:
+            if self.size + len(data) > self.max_bytes:
+                self.size = self.get_size()
+                if self.size + len(data) > self.max_bytes:
+                    raise SpoolFullError
+            if self.segment is None or self.segment_size >= self.segment_bytes:
+                self.roll()
+                self.segment = Segment.create(self.directory)
+            self.segment.append(data)
+            self.segment_size += RECORD_HEADER.size + len(data)
+            self.size += RECORD_HEADER.size + len(data)
+            self.pending = True
+
+    def roll(self):
+        if self.segment is not None:
+            self.segment.close()
+            self.segment = None
+            self.segment_size = 0
+
+    def drain(self, send):
+        """
+        Call `send` with the records of every segment not in use by another
+        process, in order, removing each segment once all its records are
+        sent. Segments of a failed call are sent again on the next one.
+        """
+        with self.lock:
+            self.roll()
+        for path in self.get_paths():
+            segment = Segment.claim(path)
+            if segment is None:
+                continue
+            try:
+                send(segment.records())
+            except BaseException:
+                segment.close()
+                raise
+            segment.remove()
+        with self.lock:
+            self.size = self.get_size()
+            if self.segment is None and not self.size:
+                self.pending = False
+
+
+class SpoolingProducer:
+    """
+    Wraps a `Producer` so that sending never blocks for long: messages that
+    Kafka does not accept quickly, or fails to deliver, are spooled to disk
+    and sent later by a background thread. While the spool has messages,
+    new ones are spooled as well so that they are not sent out of order.
+    """
+
+    def __init__(self, producer, spool, interval=1, timeout=30):
+        self.producer = producer
+        self.spool = spool
+        self.interval = interval
+        self.timeout = timeout
+        self.drainer = None
+        self.start_drainer()
+
+    def start_drainer(self):
+        # Threads do not survive a fork, so check the drainer is still there.
+        if self.drainer is None or not self.drainer.is_alive():
+            self.drainer = threading.Thread(
+                target=self.run_drainer, name="spool-drainer", daemon=True
+            )
+            self.drainer.start()
+
+    def run_drainer(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.spool.drain(self.send_records)
+            except Exception as e:  # noqa: BLE001
+                msg = f"Failed to drain the event spool: {e}"
+                logger.warning(msg)
+
+    def send_records(self, records):
+        futures = []
+        for record in records:
+            if record["headers"]:
+                record["headers"] = [tuple(header) for header in record["headers"]]
+            futures.append(self.producer.send(**record))
+        self.producer.flush(timeout=self.timeout)
+        for future in futures:
+            future.get(timeout=self.timeout)
+
+    def spool_record(self, record):
+        self.spool.append(record)
+        self.start_drainer()
+
+    def on_delivery_error(self, record, exc):
+        msg = f"Spooling undelivered message: {exc}"
+        logger.warning(msg)
+        self.spool_record(record)
+
+    def send(self, topic, message, message_key=None, headers=None):
+        """
+        Send a message, or spool it. Returns the send future, or `SPOOLED` if
+        the message is spooled.
+        """
+        record = {
+            "topic": topic,
+            "message": message,
+            "message_key": message_key,
+            "headers": headers,
+        }
+        if not self.spool.pending:
+            try:
+                future = self.producer.send(**record)
+            except KafkaError:
+                pass
+            else:
+                future.add_errback(self.on_delivery_error, record)
+                return future
+        self.spool_record(record)
+        return SPOOLED
+
+    def flush(self, timeout=None):
+        self.producer.flush(timeout=timeout)
+
+    def end(self):
+        self.producer.end()